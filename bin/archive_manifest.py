@@ -12,8 +12,13 @@ Options:
      --headers=LIST      Comma separated list of dicom header names to print.
      --oneseries         Only show one series (useful for just exam info)
      --showheaders       Just list all of the headers for each archive
+     --index-dir=DIR     A folder to keep offset indexes for uncompressed
+                         tarballs in. Repeated runs on the same tarball read
+                         headers straight from the recorded offsets.
 """
 
+import os
+
 from docopt import docopt
 import pandas as pd
 
@@ -31,10 +36,13 @@ default_headers = [
 def main():
     arguments = docopt(__doc__)
 
+    index_dir = arguments['--index-dir']
+
     if arguments['--showheaders']:
         for archive in arguments['<archive>']:
-            manifest = datman.utils.get_archive_headers(archive,
-                                                        stop_after_first=False)
+            manifest = datman.utils.get_archive_headers(
+                archive, stop_after_first=False,
+                tar_index=get_index_file(index_dir, archive))
             filepath, headers = list(manifest.items())[0]
             print(",".join([archive, filepath]))
             print("\t" + "\n\t".join(headers.dir()))
@@ -46,7 +54,8 @@ def main():
 
     rows = []
     for archive in arguments["<archive>"]:
-        manifest = datman.utils.get_archive_headers(archive)
+        manifest = datman.utils.get_archive_headers(
+            archive, tar_index=get_index_file(index_dir, archive))
         sortedseries = sorted(manifest.items(),
                               key=lambda x: x[1].get('SeriesNumber'))
         for path, dataset in sortedseries:
@@ -60,5 +69,11 @@ def main():
     print(data.to_csv(index=False))
 
 
+def get_index_file(index_dir, archive):
+    if not index_dir:
+        return None
+    return os.path.join(index_dir, os.path.basename(archive) + ".index.json")
+
+
 if __name__ == "__main__":
     main()
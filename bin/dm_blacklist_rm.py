@@ -18,6 +18,10 @@ Options:
                         of any path defined in the main config file (e.g.
                         'nii'). This option can be repeated to include multiple
                         paths.
+    --workers N         The number of files to move or delete at once.
+                        [default: 4]
+    --cache-dashboard   Reuse the results of dashboard lookups for up to five
+                        minutes instead of querying the database every time.
     -v --verbose
     -d --debug
     -q --quiet
@@ -27,10 +31,13 @@ Options:
 import os
 import logging
 import shutil
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 
 from docopt import docopt
 
 import datman.config
+import datman.dashboard
 import datman.scan
 import datman.utils
 
@@ -47,6 +54,8 @@ def main():
     project = arguments['<project>']
     keep = arguments['--keep']
     override_paths = arguments['--path']
+    workers = int(arguments['--workers'])
+    use_cache = arguments['--cache-dashboard']
     verbose = arguments['--verbose']
     debug = arguments['--debug']
     quiet = arguments['--quiet']
@@ -56,23 +65,30 @@ def main():
         logger.setLevel(logging.INFO)
     if debug:
         logger.setLevel(logging.DEBUG)
+        logging.getLogger("datman.dashboard").setLevel(logging.DEBUG)
     if quiet:
         logger.setLevel(logging.ERROR)
 
+    if use_cache:
+        datman.dashboard.enable_cache()
     config = datman.config.config(study=project)
     metadata = datman.utils.get_subject_metadata(config, allow_partial=True)
     search_paths = get_search_paths(config, override_paths)
 
+    index = FileIndex()
+    found = {}
     for sub in metadata:
         if not metadata[sub]:
             continue
 
         logger.debug(f"Working on {sub}")
         session = datman.scan.Scan(sub, config)
-        handle_blacklisted_scans(
-            session, metadata[sub], search_paths, keep=keep
+        found.update(
+            find_blacklisted_files(session, metadata[sub], search_paths, index)
         )
 
+    handle_blacklisted_files(found, keep=keep, workers=workers)
+
 
 def get_search_paths(config, user_paths=None):
     """Get path types to search for blacklisted files in.
@@ -97,8 +113,49 @@ def get_search_paths(config, user_paths=None):
     return path_keys
 
 
-def handle_blacklisted_scans(session, bl_scans, search_paths, keep=False):
-    """Move or delete all blacklisted scans for the given path types.
+class FileIndex:
+    """Find files by name prefix, listing each folder only once.
+
+    Folder contents are listed on first use and kept sorted, so each search
+    is a binary search in memory instead of a glob of the folder.
+    """
+
+    def __init__(self):
+        self._folders = {}
+
+    def find(self, folder, file_stem):
+        """Find all files in a folder whose name starts with 'file_stem'.
+
+        Args:
+            folder (:obj:`str`): The full path to the folder to search.
+            file_stem (:obj:`str`): The start of the file names to match.
+
+        Returns:
+            list: The full path to each match.
+        """
+        names = self._list(folder)
+        found = []
+        for name in names[bisect_left(names, file_stem):]:
+            if not name.startswith(file_stem):
+                break
+            found.append(os.path.join(folder, name))
+        return found
+
+    def _list(self, folder):
+        try:
+            return self._folders[folder]
+        except KeyError:
+            pass
+        try:
+            names = sorted(os.listdir(folder))
+        except (FileNotFoundError, NotADirectoryError):
+            names = []
+        self._folders[folder] = names
+        return names
+
+
+def find_blacklisted_files(session, bl_scans, search_paths, index):
+    """Find the files of all blacklisted scans for the given path types.
 
     Args:
         session (:obj:`datman.scan.Scan`): A datman scan object for the
@@ -108,51 +165,63 @@ def handle_blacklisted_scans(session, bl_scans, search_paths, keep=False):
         search_paths (:obj:`list`): A list of path types to move/delete
             blacklisted scans from. Each path type must exist in the
             datman config files.
-        keep (bool): Whether to move files instead of deleting them. Optional,
-            default False.
+        index (:obj:`FileIndex`): The index to search folders with.
+
+    Returns:
+        dict: The full path of each file found mapped to the folder of the
+            path type it was found in.
     """
+    found = {}
     for scan in bl_scans:
         for path_type in search_paths:
-            found = session.find_files(scan, format=path_type)
-
-            if not found:
+            if path_type == 'bids':
+                # BIDS files can't be found by name, the session object has
+                # already located them.
+                files = session.find_files(scan, format=path_type)
+            else:
+                folder = getattr(session, f"{path_type}_path", "")
+                files = index.find(folder, scan) if folder else []
+
+            if not files:
                 continue
 
-            if is_already_handled(found):
-                continue
-
-            logger.debug(f"Files found for removal: {found}")
+            logger.debug(f"Files found for removal: {files}")
+            for item in files:
+                found.setdefault(item, getattr(session, f"{path_type}_path"))
+    return found
 
-            if DRYRUN:
-                logger.info("DRYRUN - Leaving files in place.")
-                continue
 
-            for item in found:
-                if keep:
-                    path = getattr(session, f"{path_type}_path")
-                    logger.info(
-                        f"Moving blacklisted files to {path}/blacklisted"
-                    )
-                    move_file(path, item)
-                else:
-                    delete_file(item)
-
-
-def is_already_handled(found_files):
-    """Checks if the found files have already been moved or removed.
-
-    Split series scans get 'found' for each blacklist entry the first time
-    the script encounters the blacklist entries. This checks if all 'found'
-    items have already been removed so unneccessary errors messages can be
-    avoided!
+def handle_blacklisted_files(found, keep=False, workers=4):
+    """Move or delete blacklisted files.
 
     Args:
-        found_files (:obj:`list`): A list of files to check.
-
-    Returns:
-        bool
+        found (:obj:`dict`): The full path to each blacklisted file mapped
+            to the folder it belongs to (see find_blacklisted_files).
+        keep (bool): Whether to move files to a 'blacklisted' subdir of their
+            folder instead of deleting them. Optional, default False.
+        workers (int): How many files to move or delete at once. Optional,
+            default 4.
     """
-    return all([not os.path.exists(item) for item in found_files])
+    if not found:
+        return
+
+    if DRYRUN:
+        logger.info(f"DRYRUN - Leaving {len(found)} files in place.")
+        return
+
+    def handle(item):
+        if keep:
+            logger.info(
+                f"Moving blacklisted file {item} to "
+                f"{found[item]}/blacklisted"
+            )
+            move_file(found[item], item)
+        else:
+            delete_file(item)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() so any unexpected error is raised here
+        list(pool.map(handle, sorted(found)))
 
 
 def move_file(path, item):
@@ -18,6 +18,8 @@ Options:
                             overrides metadata/scans.csv
     --scanid-field STR      Dicom field to match target_name with
                             [default: PatientName]
+    --workers N             Number of processes to use when reading dicom
+                            headers from archives [default: 1]
     -v --verbose            Verbose logging
     -d --debug              Debug logging
     -q --quiet              Less debuggering
@@ -51,6 +53,10 @@ DETAILS
     The --scanid-field specifies a dicom header field to check for a
     well-formatted exam name.
 
+    When many archives need their headers read, --workers can be used to
+    read them in parallel. Links are still made one at a time, in the same
+    order and with the same results as a serial run.
+
 
 ADDITIONAL MATCH CONDITIONS
     Additional columns in the lookup table can be specified to ensure that the
@@ -75,11 +81,12 @@ import glob
 import logging
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 from docopt import docopt
-import pandas as pd
 
 import datman.config
+import datman.scan_list
 import datman.scanid
 import datman.utils
 
@@ -88,6 +95,8 @@ logger = logging.getLogger(os.path.basename(__file__))
 already_linked = {}
 lookup = None
 DRYRUN = None
+# Headers read ahead of time by read_headers, keyed by archive path
+header_cache = {}
 
 
 def main():
@@ -105,6 +114,7 @@ def main():
     lookup_path = arguments["--lookup"]
     scanid_field = arguments["--scanid-field"]
     zipfile = arguments["<zipfile>"]
+    workers = int(arguments["--workers"])
 
     # setup logging
     ch = logging.StreamHandler(sys.stdout)
@@ -149,7 +159,7 @@ def main():
         return
 
     try:
-        lookup = pd.read_csv(lookup_path, sep="\s+", dtype=str)  # noqa: W605
+        lookup = datman.scan_list.ScanLookup.from_file(lookup_path)
     except IOError:
         logger.error("Lookup file {} not found".format(lookup_path))
         return
@@ -171,6 +181,10 @@ def main():
                     if os.path.splitext(archive)[1] == ".zip"]
 
     logger.info("Found {} archives".format(len(archives)))
+    if workers > 1:
+        header_cache.update(read_headers(
+            [item for item in archives if needs_header(item)], workers))
+
     for archive in archives:
         link_archive(archive, dicom_path, scanid_field, cfg)
 
@@ -237,7 +251,7 @@ def link_archive(archive_path, dicom_path, scanid_field, config):
 
 def get_scanid_from_lookup_table(archive_path):
     """
-    Gets the scanid from the lookup table (pandas dataframe)
+    Gets the scanid from the lookup table (datman.scan_list.ScanLookup)
 
     Returns the scanid and the rest of the lookup table information (e.g.
     expected dicom header matches). If no match is found, both the scan id and
@@ -246,25 +260,63 @@ def get_scanid_from_lookup_table(archive_path):
     global lookup
     basename = os.path.basename(os.path.normpath(archive_path))
     source_name = basename[:-len(datman.utils.get_extension(basename))]
-    lookupinfo = lookup[lookup["source_name"] == source_name]
+    lookupinfo = lookup.get_rows(source_name)
 
-    if len(lookupinfo) == 0:
+    if lookupinfo is None:
         logger.debug("{} not found in source_name column."
                      .format(source_name))
         return
     else:
-        scanid = lookupinfo["target_name"].tolist()[0]
+        scanid = lookup.get_target(source_name)
         return (scanid, lookupinfo)
 
 
-def get_archive_headers(archive_path):
-    # get some DICOM headers from the archive
-    header = None
+def needs_header(archive_path):
+    """
+    Checks whether link_archive will have to read an archive's headers.
+
+    Only archives that exist, have not been linked yet and have no entry in
+    the lookup table need their dicom headers read.
+    """
+    if not os.path.isfile(archive_path):
+        return False
+    if os.path.realpath(archive_path) in already_linked:
+        return False
+    return get_scanid_from_lookup_table(archive_path) is None
+
+
+def read_headers(archives, workers):
+    """
+    Reads the first dicom header of each archive in a pool of processes.
+
+    Returns a dictionary mapping each archive path to its header, or to None
+    if no header could be read.
+    """
+    if not archives:
+        return {}
+    logger.info("Reading headers from {} archives with {} workers".format(
+        len(archives), workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        headers = pool.map(read_first_header, archives)
+        return dict(zip(archives, headers))
+
+
+def read_first_header(archive_path):
     try:
-        header = datman.utils.get_archive_headers(archive_path,
-                                                  stop_after_first=True)
-        header = list(header.values())[0]
+        headers = datman.utils.get_archive_headers(archive_path,
+                                                   stop_after_first=True)
+        return list(headers.values())[0]
     except Exception:
+        return None
+
+
+def get_archive_headers(archive_path):
+    # get some DICOM headers from the archive
+    if archive_path in header_cache:
+        header = header_cache[archive_path]
+    else:
+        header = read_first_header(archive_path)
+    if header is None:
         logger.warning("Archive: {} contains no DICOMs".format(archive_path))
     return header
 
@@ -20,6 +20,10 @@ Options:
     --log-to-server    If set, all log messages will also be sent to the
                        configured logging server. This is useful when the
                        script is run on the queue, since it swallows logging.
+    --cache-dashboard  Reuse the results of dashboard lookups for up to five
+                       minutes instead of querying the database every time.
+                       Changes made by other processes in that time may be
+                       missed.
     -q --quiet         Only report errors
     -v --verbose       Be chatty
     -d --debug         Be extra chatty
@@ -64,6 +68,7 @@ def main():
     REMAKE = arguments["--remake"]
     REFRESH = arguments["--refresh"]
     use_server = arguments["--log-to-server"]
+    use_cache = arguments["--cache-dashboard"]
     verbose = arguments["--verbose"]
     debug = arguments["--debug"]
     quiet = arguments["--quiet"]
@@ -79,6 +84,7 @@ def main():
         logger.setLevel(logging.INFO)
     if debug:
         logger.setLevel(logging.DEBUG)
+        logging.getLogger("datman.dashboard").setLevel(logging.DEBUG)
 
     if not session:
         return submit_subjects(config)
@@ -87,6 +93,9 @@ def main():
         logger.error("Dashboard database not found, can't run.")
         return
 
+    if use_cache:
+        datman.dashboard.enable_cache()
+
     subject = prepare_scan(session, config)
     make_metrics(subject, config)
 
@@ -14,22 +14,40 @@ Options:
     -d --debug                  Show lots of output.
     --dry-run
 
+Downloads are recorded in a manifest in the study metadata folder (one per
+server, named sftp_manifest_<server>.json). Remote files and folders that
+haven't changed since they were last downloaded are skipped, and downloads
+that were interrupted continue from where they stopped on the next run.
 """
+import contextlib
+import functools
+import json
 import logging
 import os
+import posixpath
+import queue
 import shutil
+import stat
+import threading
 import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 
 import pysftp
 
 from docopt import docopt
 import datman.config
-from datman.utils import make_temp_directory
+from datman.utils import make_zip, get_zip_settings
 
 logging.basicConfig(level=logging.WARN,
                     format="[%(asctime)s %(name)s] %(levelname)s: %(message)s")
 logger = logging.getLogger(os.path.basename(__file__))
 
+# Interrupted downloads are kept in files and folders with these names so
+# they can be resumed by the next run.
+PARTIAL_EXT = ".part"
+PARTIAL_DIR = ".sftp_partial"
+TRANSFER_CHUNK = 1024 * 1024
+
 
 def main():
     arguments = docopt(__doc__)
@@ -64,9 +82,11 @@ def main():
             os.makedirs(zips_path, exist_ok=True)
 
     server_config = get_server_config(cfg)
+    zip_settings = get_zip_settings(cfg)
 
     for mrserver in server_config:
-        mrusers, mrfolders, pass_file_name, port = server_config[mrserver]
+        (mrusers, mrfolders, pass_file_name, port,
+         connections) = server_config[mrserver]
 
         if isinstance(mrfolders, str):
             mrfolders = [mrfolders]
@@ -76,6 +96,8 @@ def main():
 
         pass_file = os.path.join(meta_path, pass_file_name)
         passwords = read_password(pass_file)
+        manifest = TransferManifest(
+            os.path.join(meta_path, f"sftp_manifest_{mrserver}.json"))
 
         # actually do the copying
         assert len(passwords) == len(mrusers), \
@@ -84,22 +106,11 @@ def main():
         for iloc in range(len(mrusers)):
             mruser = mrusers[iloc]
             password = passwords[iloc]
-            host_keys, options = get_host_keys(mrserver)
-            with pysftp.Connection(mrserver,
-                                   username=mruser,
-                                   password=password,
-                                   port=port,
-                                   cnopts=options) as sftp:
-                if host_keys is not None:
-                    logger.debug("Connecting to new host, caching host key.")
-                    host_keys.add(
-                        mrserver,
-                        sftp.remote_server_key.get_name(),
-                        sftp.remote_server_key
-                    )
-                    host_keys.save(pysftp.helpers.known_hosts())
-
-                valid_dirs = get_valid_remote_dirs(sftp, mrfolders)
+            connect = functools.partial(
+                connect_server, mrserver, mruser, password, port)
+            with ConnectionPool(connect, size=connections) as pool:
+                with pool.connection() as sftp:
+                    valid_dirs = get_valid_remote_dirs(sftp, mrfolders)
                 if len(valid_dirs) < 1:
                     logger.error("Source folders {} not found"
                                  "".format(mrfolders))
@@ -108,7 +119,8 @@ def main():
                     #  process each folder in turn
                     logger.debug("Copying from:{}  to:{}"
                                  .format(valid_dir, zips_path))
-                    process_dir(sftp, valid_dir, zips_path)
+                    process_dir(pool, valid_dir, zips_path,
+                                zip_settings=zip_settings, manifest=manifest)
 
 
 def get_server_config(cfg):
@@ -151,8 +163,80 @@ def read_config(cfg, site=None):
         server_port = cfg.get_key("FtpPort", site=site)
     except datman.config.UndefinedSetting:
         server_port = 22
+    try:
+        connections = int(cfg.get_key("FtpConnections", site=site))
+    except datman.config.UndefinedSetting:
+        connections = 1
+
+    return (mrusers, mrfolders, pass_file, server_port, connections)
+
+
+def connect_server(mrserver, mruser, password, port):
+    """Open a new sftp connection, caching the host key if it's new.
+    """
+    host_keys, options = get_host_keys(mrserver)
+    sftp = pysftp.Connection(mrserver,
+                             username=mruser,
+                             password=password,
+                             port=port,
+                             cnopts=options)
+    if host_keys is not None:
+        logger.debug("Connecting to new host, caching host key.")
+        host_keys.add(
+            mrserver,
+            sftp.remote_server_key.get_name(),
+            sftp.remote_server_key
+        )
+        host_keys.save(pysftp.helpers.known_hosts())
+    return sftp
+
+
+class ConnectionPool:
+    """Share up to 'size' sftp connections between threads.
+
+    Connections are opened by calling 'connect' the first time they're
+    needed and each is only ever used by one thread at a time.
+    """
+
+    def __init__(self, connect, size=1):
+        self.size = max(1, size)
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._opened = []
+        self._lock = threading.Lock()
 
-    return (mrusers, mrfolders, pass_file, server_port)
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._opened) < self.size:
+                conn = self._connect()
+                self._opened.append(conn)
+                return conn
+        return self._idle.get()
+
+    def close(self):
+        with self._lock:
+            for conn in self._opened:
+                conn.close()
+            self._opened = []
+            self._idle = queue.LifoQueue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 def get_host_keys(server):
@@ -204,66 +288,284 @@ def get_valid_remote_dirs(connection, mrfolders):
     return valid_dirs
 
 
-def process_dir(connection, directory, zips_path):
+def process_dir(pool, directory, zips_path, zip_settings=None,
+                manifest=None):
     """Process a directory on the ftp server,
-    copy new files to zips_path
+    copy new files to zips_path. Any folders found are zipped using
+    zip_settings (see datman.utils.make_zip). Up to pool.size files or
+    folders are downloaded at once, each over its own connection.
+
+    If a TransferManifest is given, remote files and folders it records as
+    complete and unchanged are skipped without listing their contents, and
+    interrupted downloads are resumed.
     """
-    with connection.cd(directory):
+    if manifest is None:
+        manifest = TransferManifest()
+
+    with pool.connection() as connection:
         try:
-            files = connection.listdir()
+            entries = list_entries(connection, directory)
         except IOError:
             # can get this if user doesn't have permission to enter the folder
             logger.debug("Cant access remote folder:{}, skipping."
                          .format(directory))
             return
-        for file_name in files:
-            if connection.isfile(file_name):
-                get_file(connection, file_name, zips_path)
-            else:
-                get_folder(connection, file_name, zips_path)
 
+    entries = [entry for entry in entries
+               if entry_needed(entry, directory, zips_path, manifest)]
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        downloads = [
+            executor.submit(download_entry, pool, directory, entry, zips_path,
+                            zip_settings, manifest)
+            for entry in entries
+        ]
+    for download in downloads:
+        download.result()
 
-def get_folder(connection, folder_name, dst_path):
+
+def list_entries(connection, directory):
+    """List the files and folders in a remote directory with their attributes.
+
+    listdir_attr reports symlinks themselves, so each link is stat-ed to
+    find out whether it points to a file or a folder. Broken links and
+    anything that isn't a file or folder are left out.
+    """
+    entries = []
+    for entry in connection.listdir_attr(directory):
+        if stat.S_ISLNK(entry.st_mode):
+            remote_path = posixpath.join(directory, entry.filename)
+            try:
+                attrs = connection.stat(remote_path)
+            except IOError:
+                logger.debug("Cant follow remote link:{}, skipping."
+                             .format(remote_path))
+                continue
+            attrs.filename = entry.filename
+            entry = attrs
+        if not (stat.S_ISREG(entry.st_mode) or stat.S_ISDIR(entry.st_mode)):
+            logger.debug("Remote path:{} is not a file or folder, skipping."
+                         .format(posixpath.join(directory, entry.filename)))
+            continue
+        entries.append(entry)
+    return entries
+
+
+def get_target(entry, zips_path):
+    """Get the local path a listdir_attr entry is downloaded to.
+    """
+    target = os.path.join(zips_path, entry.filename)
+    if stat.S_ISDIR(entry.st_mode):
+        return target + ".zip"
+    return target
+
+
+def entry_needed(entry, directory, zips_path, manifest):
+    """Check whether a listdir_attr entry is missing or out of date locally.
+    """
+    remote_path = posixpath.join(directory, entry.filename)
+    target = get_target(entry, zips_path)
+    if manifest.is_complete(remote_path, entry, target):
+        logger.debug("File: {} unchanged since last download, skipping"
+                     .format(remote_path))
+        return False
+    if remote_path in manifest:
+        return True
+    if download_needed(None, entry.filename, target,
+                       remote_mtime=entry.st_mtime):
+        return True
+    # Downloaded before the manifest existed, record it for next time
+    manifest.update(remote_path, entry, target, "complete")
+    logger.debug("File: {} already exists, skipping".format(entry.filename))
+    return False
+
+
+def download_entry(pool, directory, entry, zips_path, zip_settings=None,
+                   manifest=None):
+    """Download a single listdir_attr entry from a remote directory.
+    """
+    if manifest is None:
+        manifest = TransferManifest()
+    remote_path = posixpath.join(directory, entry.filename)
+    target = get_target(entry, zips_path)
+    # A partial copy can only be continued if the remote hasn't changed
+    resume = manifest.is_partial(remote_path, entry)
+    manifest.update(remote_path, entry, target, "partial")
+
+    with pool.connection() as connection, connection.cd(directory):
+        if stat.S_ISDIR(entry.st_mode):
+            get_folder(connection, entry.filename, zips_path,
+                       zip_settings=zip_settings, resume=resume)
+        else:
+            get_file(connection, entry.filename, zips_path, attrs=entry,
+                     resume=resume)
+    manifest.update(remote_path, entry, target, "complete")
+
+
+def get_folder(connection, folder_name, dst_path, zip_settings=None,
+               resume=False):
+    """Download a remote folder and zip it into dst_path.
+
+    The folder is staged in a hidden folder inside dst_path so that, if
+    resume is set, files already copied by an earlier interrupted run are
+    kept.
+    """
     expected_file = os.path.join(dst_path, folder_name + ".zip")
-    if not download_needed(connection, folder_name, expected_file):
-        logger.debug("File: {} already exists, skipping".format(folder_name))
-        return
+    staging = os.path.join(dst_path, PARTIAL_DIR, folder_name)
+    if not resume and os.path.exists(staging):
+        shutil.rmtree(staging)
+
+    get_tree(connection, folder_name, staging)
+    make_zip(staging, expected_file + PARTIAL_EXT, **(zip_settings or {}))
+    os.replace(expected_file + PARTIAL_EXT, expected_file)
+    shutil.rmtree(staging)
+    try:
+        os.rmdir(os.path.dirname(staging))
+    except OSError:
+        # Other folders are still being downloaded
+        pass
+    logger.info("Copied remote file {} to {}".format(folder_name,
+                                                     expected_file))
+
 
-    with make_temp_directory() as temp_dir:
-        # Note 'get_r' is needed instead of 'get'
-        connection.get_r(folder_name, temp_dir, preserve_mtime=True)
-        source = os.path.join(temp_dir, folder_name)
-        dest = os.path.join(dst_path, folder_name)
-        new_zip = shutil.make_archive(dest, "zip", source)
-        logger.info("Copied remote file {} to {}".format(folder_name,
-                                                         new_zip))
+def get_tree(connection, remote_dir, local_dir):
+    """Copy a remote folder, preserving modification times.
+
+    Unlike pysftp's get_r this lists each folder with a single listdir_attr
+    call instead of stat-ing every file (only symlinks are stat-ed). Files
+    already present locally with the same size and mtime are skipped and
+    partial files are continued.
+    """
+    os.makedirs(local_dir, exist_ok=True)
+    for entry in list_entries(connection, remote_dir):
+        remote_path = posixpath.join(remote_dir, entry.filename)
+        local_path = os.path.join(local_dir, entry.filename)
+        if stat.S_ISDIR(entry.st_mode):
+            get_tree(connection, remote_path, local_path)
+            continue
+        if is_same_file(local_path, entry):
+            continue
+        fetch_file(connection, remote_path, local_path, entry, resume=True)
 
 
-def get_file(connection, file_name, zips_path):
+def get_file(connection, file_name, zips_path, attrs=None, resume=False):
     target = os.path.join(zips_path, file_name)
-    if download_needed(connection, file_name, target):
-        logger.info("Copying new remote file: {}".format(file_name))
-        connection.get(file_name, target, preserve_mtime=True)
-    else:
-        logger.debug("File: {} already exists, skipping".format(file_name))
+    if attrs is None:
+        attrs = connection.stat(file_name)
+    logger.info("Copying new remote file: {}".format(file_name))
+    fetch_file(connection, file_name, target, attrs, resume=resume)
+
 
+def fetch_file(connection, remote_path, local_path, attrs, resume=False):
+    """Download a file, preserving its modification time.
 
-def download_needed(sftp, filename, target):
+    Data is written to a '.part' file beside local_path, which is renamed
+    once the download completes. If resume is set and a '.part' file
+    exists, the download continues from its end instead of from the start.
+    """
+    partial = local_path + PARTIAL_EXT
+    offset = 0
+    if resume and os.path.exists(partial):
+        offset = os.path.getsize(partial)
+        if offset > attrs.st_size:
+            offset = 0
+    if offset:
+        logger.info("Resuming {} from byte {}".format(remote_path, offset))
+
+    with connection.open(remote_path, "rb") as source, \
+            open(partial, "ab" if offset else "wb") as dest:
+        source.seek(offset)
+        source.prefetch(attrs.st_size)
+        shutil.copyfileobj(source, dest, TRANSFER_CHUNK)
+    os.replace(partial, local_path)
+    os.utime(local_path, (attrs.st_atime, attrs.st_mtime))
+
+
+def is_same_file(local_path, attrs):
+    try:
+        local = os.stat(local_path)
+    except FileNotFoundError:
+        return False
+    return (local.st_size == attrs.st_size and
+            int(local.st_mtime) == int(attrs.st_mtime))
+
+
+def download_needed(sftp, filename, target, remote_mtime=None):
     """Check if a local copy of the file exists,
     If no local copy exists return True
     If local copy exists and is older than remote return True
-    otherwise return false"""
+    otherwise return false
+
+    The remote file is only stat-ed if remote_mtime isn't given."""
     if not os.path.isfile(target):
         return True
 
     # check the file modification times
     local_mtime = os.path.getmtime(target)
-    remote_mtime = sftp.stat(filename).st_mtime
+    if remote_mtime is None:
+        remote_mtime = sftp.stat(filename).st_mtime
     if local_mtime < remote_mtime:
         return True
 
     return False
 
 
+class TransferManifest:
+    """A record of what has been downloaded from an sftp server.
+
+    Each remote file or folder is stored with the size and mtime it had
+    when it was downloaded, the local path it was saved to and whether that
+    copy is 'partial' or 'complete'. If a path is given the manifest is
+    read from it and rewritten every time an entry changes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as fh:
+                    self.entries = json.load(fh)
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable transfer manifest {}. "
+                               "Reason: {}".format(path, e))
+
+    def __contains__(self, remote_path):
+        return remote_path in self.entries
+
+    def is_complete(self, remote_path, attrs, target):
+        return (self._matches(remote_path, attrs, "complete")
+                and os.path.exists(target))
+
+    def is_partial(self, remote_path, attrs):
+        return self._matches(remote_path, attrs, "partial")
+
+    def _matches(self, remote_path, attrs, status):
+        record = self.entries.get(remote_path)
+        if not record:
+            return False
+        return (record["status"] == status and
+                record["size"] == attrs.st_size and
+                record["mtime"] == attrs.st_mtime)
+
+    def update(self, remote_path, attrs, target, status):
+        with self._lock:
+            self.entries[remote_path] = {
+                "size": attrs.st_size,
+                "mtime": attrs.st_mtime,
+                "local": target,
+                "status": status
+            }
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        temp = self.path + PARTIAL_EXT
+        with open(temp, "w") as fh:
+            json.dump(self.entries, fh, indent=1, sort_keys=True)
+        os.replace(temp, self.path)
+
+
 if __name__ == "__main__":
     main()
@@ -92,7 +92,12 @@ def main():
     else:
         bids_opts = None
 
-    sessions = get_sessions(config, args)
+    if args.request_stats is not None:
+        stats = datman.xnat.RequestStats()
+    else:
+        stats = None
+
+    sessions = get_sessions(config, args, stats=stats)
 
     logger.info(f"Found {len(sessions)} sessions for study {args.study}")
 
@@ -100,15 +105,21 @@ def main():
         session = datman.scan.Scan(importer.ident, config,
                                    bids_root=args.bids_out)
 
-        if importer.resource_files:
-            export_resources(session.resource_path, xnat, importer,
-                             dry_run=args.dry_run)
+        try:
+            if importer.resource_files:
+                export_resources(session.resource_path, xnat, importer,
+                                 dry_run=args.dry_run)
+
+            if importer.scans:
+                export_scans(config, xnat, importer, session,
+                             bids_opts=bids_opts, dry_run=args.dry_run,
+                             ignore_db=args.dont_update_dashboard,
+                             wanted_tags=args.tag)
+        finally:
+            importer.close()
 
-        if importer.scans:
-            export_scans(config, xnat, importer, session,
-                         bids_opts=bids_opts, dry_run=args.dry_run,
-                         ignore_db=args.dont_update_dashboard,
-                         wanted_tags=args.tag)
+    if stats is not None:
+        report_request_stats(stats, args.request_stats)
 
 
 def read_args():
@@ -246,6 +257,15 @@ def read_args():
         default=False,
         help="Do nothing"
     )
+    g_perfm.add_argument(
+        "--request-stats", action="store", metavar="FILE",
+        nargs="?", const="", default=None,
+        help="Summarize the requests made to XNAT at the end of the run "
+             "(the summary is logged at the verbose level). If FILE is "
+             "given the statistics are also written to it, in Prometheus "
+             "text format if it ends with '.prom' or '.txt' and as JSON "
+             "otherwise."
+    )
 
     tool_opts, clean_args = parse_tool_opts(sys.argv[1:], ['--dcm2bids-'])
     args = parser.parse_args(clean_args)
@@ -336,13 +356,31 @@ def configure_logging(study, log_level):
     logging.getLogger('datman.importers').addHandler(ch)
 
 
-def get_sessions(config, args):
+def report_request_stats(stats, output=None):
+    """Log (and optionally save) a summary of the requests made to XNAT.
+
+    Args:
+        stats (:obj:`datman.xnat.RequestStats`): The collected statistics.
+        output (:obj:`str`, optional): A file to write the statistics to.
+    """
+    logger.info(stats.summary())
+    if not output:
+        return
+    try:
+        stats.write(output)
+    except OSError as e:
+        logger.error(f"Failed to write request statistics to {output} - {e}")
+
+
+def get_sessions(config, args, stats=None):
     """Get all scan sessions to be exported.
 
     Args:
         config (:obj:`datman.config.config`): The datman configuration.
         args (:obj:`argparse.ArgumentParser`): The argument parser for the
             user's input arguments.
+        stats (:obj:`datman.xnat.RequestStats`, optional): A collector to
+            record XNAT requests in. Defaults to None.
 
     Returns:
         list[(None|datman.xnat.XNAT, datman.importers.SessionImporter)]:
@@ -357,9 +395,11 @@ def get_sessions(config, args):
 
     if args.experiment:
         return collect_experiment(
-            config, args.experiment, args.study, auth=auth, url=args.server)
+            config, args.experiment, args.study, auth=auth, url=args.server,
+            stats=stats)
 
-    return collect_all_experiments(config, auth=auth, url=args.server)
+    return collect_all_experiments(config, auth=auth, url=args.server,
+                                   stats=stats)
 
 
 def collect_zips(config, args):
@@ -413,7 +453,9 @@ def collect_zips(config, args):
     return zip_files
 
 
-def collect_experiment(config, experiment_id, study, url=None, auth=None):
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def collect_experiment(config, experiment_id, study, url=None, auth=None,
+                       stats=None):
     """Get a single XNAT experiment.
 
     Args:
@@ -425,6 +467,8 @@ def collect_experiment(config, experiment_id, study, url=None, auth=None):
         auth (:obj:`tuple`, optional): A tuple containing the username and
             password to use when accessing the XNAT server. If not given,
             the XNAT_USER and XNAT_PASS environment variables will be used.
+        stats (:obj:`datman.xnat.RequestStats`, optional): A collector to
+            record XNAT requests in. Defaults to None.
 
     Return:
         list[(datman.xnat.XNAT, datman.importers.XNATExperiment)]:
@@ -434,7 +478,7 @@ def collect_experiment(config, experiment_id, study, url=None, auth=None):
     """
     ident = get_identifier(config, experiment_id)
     xnat = datman.xnat.get_connection(
-        config, site=ident.site, url=url, auth=auth)
+        config, site=ident.site, url=url, auth=auth, stats=stats)
     xnat_project = xnat.find_project(
         ident.get_xnat_subject_id(),
         config.get_xnat_projects(study)
@@ -481,7 +525,7 @@ def get_identifier(config, subid):
     return ident
 
 
-def collect_all_experiments(config, auth=None, url=None):
+def collect_all_experiments(config, auth=None, url=None, stats=None):
     """Retrieve all XNAT experiment objects for a single study.
 
     Args:
@@ -491,6 +535,8 @@ def collect_all_experiments(config, auth=None, url=None):
             password. If not provided, the XNAT_USER and XNAT_PASS variables
             will be used. Defaults to None.
         url (:obj:`str`): The URL for the XNAT server.
+        stats (:obj:`datman.xnat.RequestStats`, optional): A collector to
+            record XNAT requests in. Defaults to None.
 
     Returns:
         list[datman.importers.XNATExperiment]: A list of XNATExperiment
@@ -503,7 +549,7 @@ def collect_all_experiments(config, auth=None, url=None):
         for site in sites:
             xnat = datman.xnat.get_connection(
                 config, site=site, url=url, auth=auth,
-                server_cache=server_cache)
+                server_cache=server_cache, stats=stats)
 
             for exper_id in xnat.get_experiment_ids(project):
                 ident = get_experiment_identifier(config, project, exper_id)
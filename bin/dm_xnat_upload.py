@@ -400,34 +400,30 @@ def contains_niftis(archive):
 
 def strip_niftis(archive, temp):
     """
-    Extract the everything except niftis to temp folder, rezip, and then
+    Copy everything except niftis to a new zip in the temp folder, and then
     return the path to this temporary zip for upload
     """
-    unzip_dest = datman.utils.define_folder(os.path.join(temp, "extracted"))
     with zipfile.ZipFile(archive) as zf:
         archive_files = zf.namelist()
-        niftis = find_niftis(archive_files)
-        # Find and purge associated files too (e.g. .bvec and .bval), so they
-        # only appear in resources alongside their niftis
-        nifti_names = [datman.utils.splitext(os.path.basename(nii))[0]
-                       for nii in niftis]
-        deletable_files = [x for x in archive_files
-                           if datman.utils.splitext(os.path.basename(x))[0]
-                           in nifti_names]
-        non_niftis = [x for x in archive_files if x not in deletable_files]
-
-        # Check if any dicoms exist at all
-        non_niftis_or_paths = [i for i in non_niftis
-                               if not os.path.basename(i) == ""]
-
-        if not non_niftis_or_paths:
-            return []
-        else:
-            for item in non_niftis:
-                zf.extract(item, unzip_dest)
+    niftis = find_niftis(archive_files)
+    # Find and purge associated files too (e.g. .bvec and .bval), so they
+    # only appear in resources alongside their niftis
+    nifti_names = [datman.utils.splitext(os.path.basename(nii))[0]
+                   for nii in niftis]
+    deletable_files = [x for x in archive_files
+                       if datman.utils.splitext(os.path.basename(x))[0]
+                       in nifti_names]
+    non_niftis = [x for x in archive_files if x not in deletable_files]
+
+    # Check if any dicoms exist at all
+    non_niftis_or_paths = [i for i in non_niftis
+                           if not os.path.basename(i) == ""]
+
+    if not non_niftis_or_paths:
+        return []
 
     temp_zip = os.path.join(temp, os.path.basename(archive))
-    datman.utils.make_zip(unzip_dest, temp_zip)
+    datman.utils.copy_zip_members(archive, temp_zip, non_niftis_or_paths)
     return temp_zip
 
 
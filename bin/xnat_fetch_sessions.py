@@ -45,7 +45,6 @@ Options:
 """  # noqa: E501
 import os
 import sys
-import glob
 import shutil
 import logging
 import logging.handlers
@@ -289,23 +288,47 @@ def restructure_zip(temp_zip, output_zip):
     # Only one found so far
     bad_prefix = 'resources/MISC/'
 
-    temp_path, _ = os.path.split(temp_zip)
-    extract_dir = datman.utils.define_folder(os.path.join(temp_path,
-                                                          "extracted"))
-
     with ZipFile(temp_zip, 'r') as zip_handle:
         if not bad_folders_exist(zip_handle, bad_prefix):
             # No work to do, move downloaded zip and return
             move(temp_zip, output_zip)
             return
-        zip_handle.extractall(extract_dir)
+        members = get_restructured_paths(zip_handle.namelist(), bad_prefix)
+
+    datman.utils.copy_zip_members(temp_zip, output_zip, members)
+
+
+def get_restructured_paths(archive_files, bad_prefix):
+    """
+    Map each archive path to keep to its new location. Files inside the bad
+    prefix are moved up to the top level, while snapshots and anything else
+    left in the 'resources' folder are dropped. If a moved file would
+    replace one already at the top level, the top level file is kept.
+    """
+    members = {}
+    to_move = []
+    for item in archive_files:
+        if item.endswith('/') or is_snapshot(item):
+            continue
+        if item.startswith(bad_prefix):
+            to_move.append(item)
+        elif not item.startswith('resources/'):
+            members[item] = item
+
+    claimed = set(members.values())
+    for item in to_move:
+        new_path = item[len(bad_prefix):]
+        if new_path in claimed:
+            logger.error("Couldnt move {} to destination {}".format(
+                item, new_path))
+            continue
+        claimed.add(new_path)
+        members[item] = new_path
+    return members
 
-    for item in glob.glob(os.path.join(extract_dir, bad_prefix, "*")):
-        move(item, extract_dir)
 
-    remove_snapshots(extract_dir)
-    remove_empty_dirs(extract_dir)
-    datman.utils.make_zip(extract_dir, output_zip)
+def is_snapshot(path):
+    return 'SNAPSHOTS' in path.split('/')[:-1]
 
 
 def bad_folders_exist(zip_handle, prefix):
@@ -315,24 +338,6 @@ def bad_folders_exist(zip_handle, prefix):
     return False
 
 
-def remove_snapshots(base_dir):
-    """
-    Snapshots arent needed for anything but get pulled down for every series
-    when they exist.
-    """
-    for cur_path, folders, files in os.walk(base_dir):
-        if folders and 'SNAPSHOTS' in folders:
-            shutil.rmtree(os.path.join(cur_path, 'SNAPSHOTS'))
-
-
-def remove_empty_dirs(base_dir):
-    empty_dir = os.path.join(base_dir, 'resources')
-    try:
-        shutil.rmtree(empty_dir)
-    except OSError as e:
-        logger.info("Cant delete {}. Reason: {}".format(empty_dir, e))
-
-
 def move(source, dest):
     try:
         shutil.move(source, dest)
@@ -9,9 +9,11 @@ switch between multiple installations of datman or different computing systems.
 These can both be overridden at ``__init__.py``
 """
 
+import functools
 import inspect
 import logging
 import os
+import re
 
 import wrapt
 import yaml
@@ -504,6 +506,80 @@ class config(object):
         return "<datman.config.config DEFAULTS>"
 
 
+@functools.lru_cache(maxsize=None)
+def compile_pattern(pattern, flags=re.IGNORECASE):
+    """Compile a tag pattern and keep it for the rest of the process.
+
+    Python's own cache only holds a few hundred compiled patterns, which a
+    study with many tags and sites can exceed.
+    """
+    return re.compile(pattern, flags)
+
+
+class TagMatcher(object):
+    """Matches series against the 'Pattern' settings of every tag.
+
+    Each tag is matched on its 'SeriesDescription' pattern or, if it has
+    none, its 'XnatType' pattern. These patterns are compiled once, when the
+    matcher is made, instead of for each series that's checked. Get one from
+    TagInfo.matcher.
+
+    Args:
+        series_map (:obj:`dict`): Tag names mapped to their 'Pattern'
+            settings, as from TagInfo.series_map.
+    """
+
+    # The Pattern fields tags can be matched on, in order of preference
+    fields = ("SeriesDescription", "XnatType")
+
+    def __init__(self, series_map):
+        self.series_map = series_map
+        self._tag_fields = {}
+        self._regexes = {field: {} for field in self.fields}
+        for tag, pattern in series_map.items():
+            if not isinstance(pattern, dict):
+                continue
+            field = next(
+                (item for item in self.fields if item in pattern), None)
+            if field:
+                regex = pattern[field]
+                try:
+                    self._regexes[field][tag] = compile_pattern(
+                        "|".join(regex) if isinstance(regex, list) else regex
+                    )
+                except (re.error, TypeError) as e:
+                    logger.error(f"Ignoring tag {tag}. Invalid pattern - {e}")
+                    continue
+            self._tag_fields[tag] = field
+
+    def field(self, tag):
+        """Get the Pattern field a tag is matched on.
+
+        Returns:
+            str: The field name, or None if the tag has no pattern for any
+                field in TagMatcher.fields.
+        """
+        return self._tag_fields[tag]
+
+    def search(self, field, value):
+        """Find every tag matched on a field whose pattern is found in a value.
+
+        Args:
+            field (:obj:`str`): The field to check (e.g. 'SeriesDescription').
+            value (:obj:`str`): The series' value for the field.
+
+        Returns:
+            list: The names of all matching tags, in configuration order.
+        """
+        return [tag for tag, regex in self._regexes[field].items()
+                if regex.search(value)]
+
+    def items(self):
+        """Get each usable tag with its 'Pattern' settings.
+        """
+        return [(tag, self.series_map[tag]) for tag in self._tag_fields]
+
+
 class TagInfo(object):
     def __init__(self, export_settings, site_settings=None):
         if not site_settings:
@@ -548,6 +624,12 @@ class TagInfo(object):
             series_map[tag] = pattern
         return series_map
 
+    @functools.cached_property
+    def matcher(self):
+        """A TagMatcher for the 'Pattern' settings of all tags.
+        """
+        return TagMatcher(self.series_map)
+
     def keys(self):
         return list(self.tags)
 
@@ -1,5 +1,9 @@
+import atexit
 import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from functools import wraps
 
@@ -14,9 +18,25 @@ except ImportError:
     dash_found = False
     logger.error("Dashboard not found, proceeding without it.")
 else:
-    connect_db()
     dash_found = True
 
+# The database connection is made by the first function that needs it (see
+# dashboard_required) so that importing datman doesn't open one.
+_connected = False
+_connect_lock = threading.Lock()
+
+
+def connect():
+    """Connect to the dashboard database, if not already connected.
+    """
+    global _connected
+    if _connected:
+        return
+    with _connect_lock:
+        if not _connected:
+            connect_db()
+            _connected = True
+
 
 def dashboard_required(f):
     @wraps(f)
@@ -31,11 +51,164 @@ def dashboard_required(f):
                     "Can't add record. Dashboard not installed or configured"
                 )
             return None
+        connect()
         return f(*args, **kwargs)
 
     return decorated_function
 
 
+class LookupCache:
+    """A per-process read-through cache for dashboard lookups.
+
+    Entries expire after 'ttl' seconds, in case records are changed by
+    something other than this process. Any write made through this module
+    clears the whole cache.
+    """
+
+    # How many lookups between debug log messages with the hit rate
+    report_every = 100
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a (found, value) tuple for a cache key.
+        """
+        with self._lock:
+            try:
+                expires, value = self._entries[key]
+            except KeyError:
+                found = False
+            else:
+                found = expires > time.monotonic()
+                if not found:
+                    del self._entries[key]
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            lookups = self.hits + self.misses
+        if lookups % self.report_every == 0:
+            self.log_stats()
+        return found, value if found else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def log_stats(self):
+        logger.debug(
+            f"Dashboard cache hit rate {self.hit_rate:.1%} ({self.hits} hits, "
+            f"{self.misses} misses, {len(self._entries)} entries)"
+        )
+
+
+_cache = None
+
+
+def enable_cache(ttl=300):
+    """Cache the results of dashboard lookups for the rest of this process.
+
+    Only get_project, get_subject, get_session and get_scan are cached, and
+    only when they're not asked to create records. Meant for long running
+    scripts that look up the same records many times.
+
+    Args:
+        ttl (int, optional): How many seconds a result may be reused for.
+            Defaults to 300.
+
+    Returns:
+        :obj:`LookupCache`: The cache in use.
+    """
+    global _cache
+    if _cache is None:
+        _cache = LookupCache(ttl)
+        atexit.register(_log_cache_stats)
+    else:
+        _cache.ttl = ttl
+    return _cache
+
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+
+def clear_cache():
+    if _cache is not None:
+        _cache.clear()
+
+
+def _log_cache_stats():
+    if _cache is not None:
+        _cache.log_stats()
+
+
+def read_through(f):
+    """Serve the decorated lookup from the cache, when it's enabled.
+
+    Calls that set 'create' may add records, so they always go to the
+    database and clear the cache. Lookups that find nothing aren't cached,
+    so records made by other processes are seen straight away.
+
+    This must be applied below scanid_required or filename_required, so that
+    the different ways of naming the same record share a cache entry.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        cache = _cache
+        if cache is None:
+            return f(*args, **kwargs)
+        if kwargs.get("create"):
+            try:
+                return f(*args, **kwargs)
+            finally:
+                cache.clear()
+
+        key = (
+            f.__name__,
+            tuple(str(arg) for arg in args),
+            tuple(sorted((k, str(v)) for k, v in kwargs.items())),
+        )
+        found, value = cache.get(key)
+        if found:
+            return value
+        value = f(*args, **kwargs)
+        if value is not None:
+            cache.set(key, value)
+        return value
+
+    return decorated_function
+
+
+def invalidates_cache(f):
+    """Clear the lookup cache after a function that writes to the database.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        finally:
+            clear_cache()
+
+    return decorated_function
+
+
 def scanid_required(f):
     """
     This decorator checks that the wrapped function's first argument is an
@@ -143,6 +316,7 @@ def release_db(f):
 
 
 @dashboard_required
+@invalidates_cache
 def set_study_status(name, is_open):
     studies = queries.get_studies(name=name)
     if not studies:
@@ -161,6 +335,7 @@ def set_study_status(name, is_open):
 
 @dashboard_required
 @scanid_required
+@read_through
 def get_subject(name, create=False):
     found = queries.get_timepoint(name.get_full_subjectid_with_timepoint())
     if found:
@@ -188,12 +363,44 @@ def get_study_subjects(study, site=None, phantoms=False):
     return queries.get_study_timepoints(study, site, phantoms)
 
 
+@dashboard_required
+def get_study_timepoints(study):
+    """Get all timepoints of a study with their sessions already loaded.
+
+    Walking study.timepoints directly issues a query for each timepoint's
+    sessions and each session's reviewer. Here they're loaded in bulk.
+
+    Args:
+        study (:obj:`str`): A study name (e.g. 'SPINS').
+
+    Returns:
+        list: The timepoint records of the study.
+    """
+    # sqlalchemy is only guaranteed to be installed alongside the dashboard
+    from sqlalchemy import inspect
+    from sqlalchemy.orm import selectinload, with_parent
+
+    db_study = get_project(study)
+    timepoint = inspect(type(db_study)).relationships["timepoints"].mapper
+    session = timepoint.relationships["sessions"].mapper
+    loader = selectinload(timepoint.class_.sessions)
+    if "reviewer" in session.relationships:
+        loader = loader.joinedload(session.class_.reviewer)
+    return (
+        queries.db.session.query(timepoint.class_)
+        .filter(with_parent(db_study, type(db_study).timepoints))
+        .options(loader)
+        .all()
+    )
+
+
 @dashboard_required
 def get_bids_subject(bids_name, bids_session, study=None):
     return queries.get_timepoint(bids_name, bids_session, study)
 
 
 @dashboard_required
+@invalidates_cache
 @scanid_required
 def add_subject(name):
     studies = queries.get_studies(tag=name.study, site=name.site)
@@ -214,6 +421,7 @@ def add_subject(name):
 
 @dashboard_required
 @scanid_required
+@read_through
 def get_session(name, create=False, date=None):
     try:
         sess_num = datman.scanid.get_session_num(name)
@@ -234,6 +442,7 @@ def get_session(name, create=False, date=None):
 
 
 @dashboard_required
+@invalidates_cache
 @scanid_required
 def add_session(name, date=None):
     timepoint = get_subject(name, create=True)
@@ -274,6 +483,7 @@ def add_session(name, date=None):
 
 @dashboard_required
 @filename_required
+@read_through
 def get_scan(
     name, tag=None, series=None, description=None, source_id=None, create=False
 ):
@@ -317,6 +527,7 @@ def get_bids_scan(name):
 
 
 @dashboard_required
+@invalidates_cache
 @filename_required
 def add_scan(name, tag=None, series=None, description=None, source_id=None):
     session = get_session(name, create=True)
@@ -343,6 +554,181 @@ def add_scan(name, tag=None, series=None, description=None, source_id=None):
 
 
 @dashboard_required
+@scanid_required
+def get_session_scans(name, file_names=None):
+    """Get all scans recorded for a session.
+
+    The scans are loaded together instead of with one query per scan.
+
+    Args:
+        name (:obj:`datman.scanid.Identifier` or :obj:`str`): The session
+            to get scans for.
+        file_names (:obj:`list`, optional): Datman style file names to look
+            up. If given, only scans matching these names are returned,
+            keyed by the file name. Names that can't be parsed are ignored.
+
+    Returns:
+        :obj:`dict`: Scan records keyed by their dashboard name (or by file
+            name, if file_names is given). Empty if the session doesn't
+            exist.
+    """
+    session = get_session(name)
+    if not session:
+        return {}
+    scans = {scan.name: scan for scan in session.scans}
+    if file_names is None:
+        return scans
+
+    found = {}
+    for file_name in file_names:
+        try:
+            ident, tag, series, _ = datman.scanid.parse_filename(file_name)
+        except datman.scanid.ParseException:
+            continue
+        scan = scans.get(_get_scan_name(ident, tag, series))
+        if scan:
+            found[file_name] = scan
+    return found
+
+
+@dashboard_required
+@invalidates_cache
+@scanid_required
+def upsert_scans(name, scans, source=None):
+    """Add or update many scans of a session in a single transaction.
+
+    Args:
+        name (:obj:`datman.scanid.Identifier` or :obj:`str`): The session
+            the scans belong to. It will be created if needed.
+        scans (:obj:`list`): One :obj:`dict` per scan. Each must have a
+            'name' key holding a datman style file name. 'bids_name',
+            'json_path' and 'conv_errors' are optional and, if present, are
+            used to update the scan. Setting 'conv_errors' to None clears
+            previously recorded errors.
+        source (:obj:`str`, optional): The name of a session these scans
+            are shared from. Each scan is linked to the source scan with
+            the same series number and tag.
+
+    Returns:
+        :obj:`dict`: The updated scan records, keyed by the given file
+            names. Scans that couldn't be added are logged and left out.
+    """
+    session = get_session(name, create=True)
+    existing = {scan.name: scan for scan in session.scans}
+    source_scans = None
+    if source:
+        source_scans = list(get_session_scans(source).values())
+
+    allowed_tags = None
+    results = {}
+    with _single_transaction() as db_session:
+        for record in scans:
+            try:
+                ident, tag, series, descr = datman.scanid.parse_filename(
+                    record["name"])
+            except datman.scanid.ParseException:
+                logger.error(f"Can't add scan {record['name']} to dashboard. "
+                             "Not a datman file name.")
+                continue
+
+            scan_name = _get_scan_name(ident, tag, series)
+            scan = existing.get(scan_name)
+            if not scan:
+                if allowed_tags is None:
+                    allowed_tags = _get_allowed_tags(ident)
+                if tag not in allowed_tags:
+                    logger.error(f"Can't add scan {scan_name} to dashboard. "
+                                 "Tag not configured for study.")
+                    continue
+
+            # A savepoint per scan, so a failure only undoes this scan
+            try:
+                with db_session.begin_nested():
+                    if not scan:
+                        scan = session.add_scan(scan_name, series, tag, descr)
+                    if source_scans is not None:
+                        _link_scan(scan, source_scans, source)
+                    _update_scan(scan, record, db_session)
+            except Exception as exc:
+                logger.error(f"Failed to update dashboard record for "
+                             f"{scan_name}. Reason - {exc}")
+                continue
+            existing[scan_name] = scan
+            results[record["name"]] = scan
+    return results
+
+
+@contextmanager
+def _single_transaction():
+    """Defer commits made by dashboard models until the block exits.
+
+    The model methods (add_scan, add_json, etc.) each commit their own
+    change. Inside this block those commits only flush, so all changes
+    reach the database in one transaction, or none do if an error occurs.
+    Only the current thread's database session is affected.
+
+    Yields:
+        :obj:`sqlalchemy.orm.Session`: The current thread's database session.
+    """
+    db_session = queries.db.session()
+    db_session.commit = db_session.flush
+    try:
+        yield db_session
+    except BaseException:
+        del db_session.commit
+        db_session.rollback()
+        raise
+    del db_session.commit
+    db_session.commit()
+
+
+def _get_allowed_tags(ident):
+    studies = queries.get_studies(tag=ident.study, site=ident.site)
+    if len(studies) != 1:
+        raise DashboardException(
+            f"Can't identify study for {ident}. {len(studies)} matches found."
+        )
+    return [st.scantype_id for st in studies[0].scantypes[ident.site]]
+
+
+def _link_scan(scan, source_scans, source):
+    matches = [
+        item for item in source_scans
+        if item.series == scan.series and item.tag == scan.tag
+    ]
+    if len(matches) != 1:
+        logger.error(
+            f"Failed to link shared scan {scan} to {source}. Reason - "
+            "Unable to find source scan database record."
+        )
+        return
+    if scan.source_id != matches[0].id:
+        scan.source_id = matches[0].id
+        scan.save()
+
+
+def _update_scan(scan, record, db_session):
+    if record.get("bids_name"):
+        scan.add_bids(record["bids_name"])
+
+    if record.get("json_path"):
+        try:
+            with db_session.begin_nested():
+                scan.add_json(record["json_path"])
+        except Exception as exc:
+            logger.error("Failed to add JSON side car to dashboard "
+                         f"record for {record['json_path']}. Reason - {exc}")
+
+    if "conv_errors" in record:
+        if record["conv_errors"]:
+            scan.add_error(record["conv_errors"])
+        elif scan.conv_errors:
+            # The error has been resolved
+            scan.add_error(None)
+
+
+@dashboard_required
+@read_through
 def get_project(name=None, tag=None, site=None, create=False):
     """
     Return a study from the dashboard database that either matches the
@@ -368,6 +754,54 @@ def get_project(name=None, tag=None, site=None, create=False):
     return studies[0]
 
 
+@dashboard_required
+def get_study_blacklist(study):
+    """Get the blacklist entries of a study with their scans already loaded.
+
+    Args:
+        study (:obj:`str`): A study name (e.g. 'SPINS').
+
+    Returns:
+        list: The blacklist entries (see Study.get_blacklisted_scans).
+    """
+    entries = get_project(study).get_blacklisted_scans()
+    _load_related(entries, "scan")
+    return entries
+
+
+def _load_related(records, relation):
+    """Load a many-to-one relation for many records with a single query.
+
+    Records whose relation can't be loaded this way are left alone, and
+    will load it on first access as usual.
+    """
+    from sqlalchemy import inspect
+    from sqlalchemy.orm.attributes import set_committed_value
+
+    if not records:
+        return
+    mapper = inspect(type(records[0]), raiseerr=False)
+    if mapper is None or relation not in mapper.relationships:
+        return
+    prop = mapper.relationships[relation]
+    if prop.uselist or len(prop.local_remote_pairs) != 1:
+        return
+    ((local, remote),) = prop.local_remote_pairs
+    local_key = mapper.get_property_by_column(local).key
+    remote_key = prop.mapper.get_property_by_column(remote).key
+
+    ids = {getattr(record, local_key) for record in records} - {None}
+    related = {
+        getattr(item, remote_key): item
+        for item in queries.db.session.query(prop.mapper.class_)
+        .filter(remote.in_(ids))
+    } if ids else {}
+    for record in records:
+        set_committed_value(
+            record, relation, related.get(getattr(record, local_key))
+        )
+
+
 @dashboard_required
 def get_default_user():
     try:
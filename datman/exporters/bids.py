@@ -135,6 +135,7 @@ class BidsExporter(SessionExporter):
             force_dcm2niix = self.opts.force_dcm2niix
 
         self.make_output_dir()
+        existing = self.get_sidecar_mtimes()
 
         try:
             self.run_dcm2bids(raw_data_dir, force_dcm2niix=force_dcm2niix)
@@ -151,7 +152,7 @@ class BidsExporter(SessionExporter):
                 logger.error(f"Failed to extract data. {e}")
 
         try:
-            self.add_repeat_num()
+            self.add_repeat_num(existing)
         except (PermissionError, json.JSONDecodeError):
             logger.error(
                 "Failed to add repeat numbers to sidecars in "
@@ -225,14 +226,39 @@ class BidsExporter(SessionExporter):
 
         return cmd
 
-    def add_repeat_num(self):
-        """Add the sessions 'repeat' number to all of its json sidecars.
+    def get_sidecar_mtimes(self) -> dict[Path, int]:
+        """Get the modification time of each json sidecar in the output dir.
+
+        Returns:
+            dict: A dictionary mapping each sidecar's path to its
+                modification time in nanoseconds.
+        """
+        mtimes = {}
+        for sidecar in Path(self.output_dir).rglob("*.json"):
+            try:
+                mtimes[sidecar] = sidecar.stat().st_mtime_ns
+            except OSError:
+                continue
+        return mtimes
+
+    def add_repeat_num(self, existing: dict[Path, int] | None = None):
+        """Add the sessions 'repeat' number to its new json sidecars.
 
         This is used to allow us to track which files belong to which session
         when there's more than one (i.e. if there's an 01_02 and so forth
         instead of just 01_01)
+
+        Args:
+            existing (:obj:`dict`, optional): The sidecar modification times
+                from before dcm2bids ran, as returned by get_sidecar_mtimes.
+                Sidecars listed here that haven't changed since weren't
+                produced by the current run, so they are not read or
+                rewritten. Defaults to None, which checks every sidecar.
         """
-        for sidecar in Path(self.output_dir).rglob("*.json"):
+        existing = existing or {}
+        for sidecar, mtime in self.get_sidecar_mtimes().items():
+            if existing.get(sidecar) == mtime:
+                continue
 
             contents = read_sidecar(sidecar)
             if not contents:
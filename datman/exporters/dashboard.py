@@ -9,7 +9,7 @@ import datman.dashboard
 from datman.exceptions import (ConfigException, DashboardException,
                                UndefinedSetting)
 from datman.scanid import (KCNIIdentifier, parse, parse_bids_filename,
-                           ParseException)
+                           parse_filename, ParseException)
 from datman.utils import find_tech_notes, get_extension
 from .base import SessionExporter
 
@@ -45,47 +45,69 @@ class DBExporter(SessionExporter):
         self.resources_path = resources_dir
         self.date = experiment.date
         super().__init__(config, session, experiment, **kwargs)
+        self.refresh()
 
     @property
     def names(self):
         """Gets list of valid datman-style scan names for a session.
 
+        The names are worked out once from a single listing of the nifti
+        folder and reused until export() refreshes them.
+
         Returns:
             :obj:`dict`: A dictionary of datman style scan names mapped to
                 the bids style name if one can be found, otherwise, an
                 empty string.
         """
+        if self._names is not None:
+            return self._names
+
         names = {}
         # use experiment.scans, so dashboard can report scans that didnt export
         for scan in self.experiment.scans:
             for name in scan.names:
-                names[name] = self.get_bids_name(name, self.session)
+                names[name] = self.get_bids_name(name)
 
         # Check the actual folder contents as well, in case symlinked scans
         # exist that werent named on XNAT
-        for nii in self.session.niftis:
-            fname = nii.file_name.replace(nii.ext, "")
-            if fname in names:
+        for fname in sorted(self._listing):
+            if not fname.endswith(".nii.gz"):
+                continue
+            stem = fname[:-len(".nii.gz")]
+            if stem in names:
+                continue
+            try:
+                parse_filename(stem)
+            except ParseException:
+                logger.debug(f"Ignoring misnamed nifti {fname}")
                 continue
-            names[fname] = self.get_bids_name(fname, self.session)
+            names[stem] = self.get_bids_name(stem)
 
+        self._names = names
         return names
 
-    def get_bids_name(self, dm_name, session):
+    def get_bids_name(self, dm_name):
         """Get BIDS style scan name from a datman style nifti.
 
         Returns:
             str: A valid bids style file name or an empty string if one
                 cannot be found.
         """
-        found = [item for item in session.find_files(dm_name)
-                 if ".nii.gz" in item]
-        if not found or not os.path.islink(found[0]):
+        found = sorted(item for item in self._listing
+                       if item.startswith(dm_name) and ".nii.gz" in item)
+        if not found or not self._listing[found[0]]:
             return ""
-        bids_src = os.readlink(found[0])
+        bids_src = os.readlink(os.path.join(self.nii_path, found[0]))
         bids_name = os.path.basename(bids_src)
         return bids_name.replace(get_extension(bids_name), "")
 
+    def refresh(self):
+        """Re-read the nifti folder, dropping any previously found names.
+        """
+        self._listing = list_dir(self.nii_path)
+        self._blacklisted = None
+        self._names = None
+
     def export(self, *args, **kwargs):
         if self.dry_run:
             logger.info("Dry run: Skipping database update for "
@@ -97,13 +119,15 @@ class DBExporter(SessionExporter):
                            f"{str(self.ident)} and its contents.")
             return
 
+        # Other exporters may have changed the nifti folder since this one
+        # was created
+        self.refresh()
         session = self.make_session()
 
         if not session.tech_notes and session.expects_notes():
             self.add_tech_notes(session)
 
-        for file_stem in self.names:
-            self.make_scan(file_stem)
+        self.make_scans(self.names)
 
     def outputs_exist(self):
         try:
@@ -121,16 +145,21 @@ class DBExporter(SessionExporter):
         if not session.tech_notes and session.expects_notes():
             return False
 
+        try:
+            scans = datman.dashboard.get_session_scans(
+                self.ident, file_names=self.names)
+        except DashboardException:
+            return False
+
         for name in self.names:
             try:
-                scan = datman.dashboard.get_scan(name)
-            except DashboardException:
-                return False
+                parse_filename(name)
             except ParseException:
                 logger.error(
                     f"Scan name {name} is not datman format. Ignoring.")
                 continue
 
+            scan = scans.get(name)
             if not scan:
                 return False
 
@@ -232,43 +261,27 @@ class DBExporter(SessionExporter):
         Args:
             file_stem (:obj:`str`): A valid datman-style file name.
         """
-        logger.debug(f"Adding scan {file_stem} to dashboard.")
-        try:
-            scan = datman.dashboard.get_scan(file_stem, create=True)
-        except datman.dashboard.DashboardException as exc:
-            logger.error(f"Failed adding scan {file_stem} to dashboard "
-                         f"with error: {exc}")
-            return
-        if self.experiment.is_shared():
-            source_session = self._get_source_session()
-            self._make_linked(scan, source_session)
-        self._add_bids_scan_name(scan, file_stem)
-        self._add_side_car(scan, file_stem)
-        self._update_conversion_errors(scan, file_stem)
+        self.make_scans({file_stem: self.names.get(file_stem, "")})
 
-    def _make_linked(self, scan, source_session):
-        try:
-            source_session = datman.dashboard.get_session(source_session)
-        except datman.dashboard.DashboardException as exc:
-            logger.error(
-                f"Failed to link shared scan {scan} to source "
-                f"{source_session}. Reason - {exc}"
-            )
-            return
-        matches = [
-            source_scan for source_scan in source_session.scans
-            if (source_scan.series == scan.series and
-                source_scan.tag == scan.tag)
-        ]
-        if not matches or len(matches) > 1:
-            logger.error(
-                f"Failed to link shared scan {scan} to {source_session}."
-                " Reason - Unable to find source scan database record."
-            )
-            return
+    def make_scans(self, names):
+        """Add or update all given scans in one database transaction.
 
-        scan.source_id = matches[0].id
-        scan.save()
+        Args:
+            names (:obj:`dict`): Valid datman-style file names mapped to
+                their bids-style name, or an empty string if there isn't
+                one (see DBExporter.names).
+        """
+        logger.debug(f"Adding {len(names)} scans to dashboard.")
+        records = [self._get_scan_record(file_stem, bids_stem)
+                   for file_stem, bids_stem in names.items()]
+        source = None
+        if self.experiment.is_shared():
+            source = self._get_source_session()
+        try:
+            datman.dashboard.upsert_scans(self.ident, records, source=source)
+        except DashboardException as exc:
+            logger.error(f"Failed adding scans for {str(self.ident)} to "
+                         f"dashboard with error: {exc}")
 
     def _get_source_session(self):
         """Get the ID of the source experiment for a shared XNATExperiment."""
@@ -284,69 +297,43 @@ class DBExporter(SessionExporter):
 
         return str(parse(self.experiment.source_name, id_map))
 
-    def _add_bids_scan_name(self, scan, dm_stem):
-        """Add a bids format file name to a series in the QC database.
+    def _get_scan_record(self, file_stem, bids_stem):
+        """Collect the details of a scan to send to the QC database.
 
         Args:
-            scan (:obj:`dashboard.models.Scan`): A QC dashboard scan.
-            dm_stem (:obj:`str`): A valid bids format scan name, or an
-                empty string if the update should be skipped.
-        """
-        bids_stem = self.names[dm_stem]
-        if not bids_stem:
-            return
-
-        try:
-            bids_ident = parse_bids_filename(bids_stem)
-        except ParseException:
-            logger.debug(f"Failed to parse bids file name {bids_stem}")
-            return
-        scan.add_bids(str(bids_ident))
-
-    def _add_side_car(self, scan, file_stem):
-        """Add the JSON side car contents to the QC database.
+            file_stem (:obj:`str`): A valid datman-style file name.
+            bids_stem (:obj:`str`): A bids-style file name, or an empty
+                string if there isn't one.
 
-        Args:
-            scan (:obj:`dashboard.models.Scan`): A QC dashboard scan.
-            file_stem (:obj:`str`): A valid datman-style file name. Used to
-                find the json side car file.
+        Returns:
+            :obj:`dict`: A scan record for datman.dashboard.upsert_scans.
         """
-        nii_file = self._get_file(file_stem, ".nii.gz")
-        if not nii_file:
-            # File exists on xnat but hasnt been generated.
-            return
-
-        side_car = self._get_file(file_stem, ".json")
-        if not side_car:
-            logger.error(f"Missing json side car for {file_stem}")
-            return
+        record = {"name": file_stem}
 
-        try:
-            scan.add_json(side_car)
-        except Exception as exc:
-            logger.error("Failed to add JSON side car to dashboard "
-                         f"record for {side_car}. Reason - {exc}")
+        if bids_stem:
+            try:
+                record["bids_name"] = str(parse_bids_filename(bids_stem))
+            except ParseException:
+                logger.debug(f"Failed to parse bids file name {bids_stem}")
 
-    def _update_conversion_errors(self, scan, file_stem):
-        """Add any dcm2niix conversion errors to the QC database.
+        # Files may exist on xnat that havent been generated yet
+        if self._get_file(file_stem, ".nii.gz"):
+            side_car = self._get_file(file_stem, ".json")
+            if side_car:
+                record["json_path"] = side_car
+            else:
+                logger.error(f"Missing json side car for {file_stem}")
 
-        Args:
-            scan (:obj:`dashboard.models.Scan`): A QC dashboard scan.
-            file_stem (:obj:`str`): A valid datman style file name. Used to
-                find the conversion error file (if one exists).
-        """
         convert_errors = self._get_file(file_stem, ".err")
-        if not convert_errors:
-            if scan.conv_errors:
-                # Erase the error message from the DB, because it
-                # has been resolved.
-                scan.add_error(None)
-            return
-        message = self._read_file(convert_errors)
-        scan.add_error(message)
+        if convert_errors:
+            record["conv_errors"] = self._read_file(convert_errors)
+        else:
+            record["conv_errors"] = None
+
+        return record
 
     def _get_file(self, fname, ext):
-        """Find a file on the file system.
+        """Find a file in the nifti folder (or its blacklisted folder).
 
         Args:
             fname (:obj:`str`): A file name (minus extension).
@@ -356,14 +343,18 @@ class DBExporter(SessionExporter):
             str: The full path to the file matching the given name and
                 extension, otherwise None.
         """
-        found = os.path.join(self.nii_path, fname + ext)
-        if not os.path.exists(found):
-            bl_found = os.path.join(self.nii_path, 'blacklisted', fname + ext)
-            if os.path.exists(bl_found):
-                return bl_found
-            logger.debug(f"File not found {found}")
-            return None
-        return found
+        if fname + ext in self._listing:
+            return os.path.join(self.nii_path, fname + ext)
+
+        if self._blacklisted is None:
+            self._blacklisted = list_dir(
+                os.path.join(self.nii_path, 'blacklisted'))
+        if fname + ext in self._blacklisted:
+            return os.path.join(self.nii_path, 'blacklisted', fname + ext)
+
+        logger.debug(f"File not found {os.path.join(self.nii_path, fname)}"
+                     f"{ext}")
+        return None
 
     def _read_file(self, fpath):
         """Read the contents of a file.
@@ -397,3 +388,20 @@ class DBExporter(SessionExporter):
                 message = "\n".join(message)
             return message != scan.conv_errors
         return False
+
+
+def list_dir(path):
+    """List a folder's contents with a single scandir call.
+
+    Args:
+        path (:obj:`str`): The folder to read.
+
+    Returns:
+        :obj:`dict`: Each file name mapped to True if it's a symlink, or
+            an empty dict if the folder doesn't exist.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return {entry.name: entry.is_symlink() for entry in entries}
+    except FileNotFoundError:
+        return {}
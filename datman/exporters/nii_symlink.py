@@ -1,18 +1,25 @@
 """Populate the 'nii' folder with symlinks to the bids folder.
 """
+import json
 import logging
 import os
-import re
+from collections import OrderedDict
 from glob import glob
 from pathlib import Path
 
+from datman.config import UndefinedSetting, compile_pattern
 from datman.scanid import make_filename
-from datman.utils import (read_blacklist, get_relative_source, get_extension)
+from datman.utils import (read_blacklist, get_relative_source, get_extension,
+                          replace_file)
 from .base import SessionExporter, read_sidecar
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["NiiLinkExporter"]
+__all__ = ["NiiLinkExporter", "SidecarIndex"]
+
+# The name of the file (in a session's nii folder) that a SidecarIndex is
+# saved to when the 'SidecarIndex' setting is enabled.
+INDEX_FILE = ".bids_sidecars.json"
 
 
 class NiiLinkExporter(SessionExporter):
@@ -30,6 +37,15 @@ class NiiLinkExporter(SessionExporter):
         self.config = config
         self.tags = config.get_tags(site=session.site)
 
+        try:
+            persist = config.get_key("SidecarIndex")
+        except UndefinedSetting:
+            persist = False
+        index_file = os.path.join(self.output_dir, INDEX_FILE) \
+            if persist else None
+        self.index = get_sidecar_index(
+            self.bids_path, index_file, fields=self.get_sidecar_fields())
+
         super().__init__(config, session, importer, **kwargs)
 
     @classmethod
@@ -67,6 +83,7 @@ class NiiLinkExporter(SessionExporter):
             return
 
         self.make_output_dir()
+        self.index.save()
 
         for dm_name, bids_name in name_map.items():
             self.link_scan(dm_name, bids_name)
@@ -98,17 +115,16 @@ class NiiLinkExporter(SessionExporter):
     def get_bids_sidecars(self) -> dict[int, list]:
         """Get all sidecars from the session's BIDS folder.
 
+        Sidecars are read through the session's SidecarIndex, so only new
+        or changed files are parsed again.
+
         Returns:
             :obj:`dict`: A map from the series number to a list of the JSON
                 sidecar contents that result from that series.
         """
         sidecars = {}
-        bids_folder = Path(self.bids_path)
-        for sidecar in bids_folder.rglob("*.json"):
-
-            contents = read_sidecar(sidecar)
-            if not contents:
-                continue
+        for contents in self.index.read():
+            sidecar = contents["Path"]
 
             if not self.matches_repeat(contents):
                 continue
@@ -130,10 +146,19 @@ class NiiLinkExporter(SessionExporter):
 
             sidecars.setdefault(series_num, []).append(contents)
 
+        self.index.save()
         self.fix_split_series_nums(sidecars)
 
         return sidecars
 
+    def get_sidecar_fields(self) -> set[str]:
+        """Get the names of all sidecar fields needed to tag a session.
+        """
+        fields = {"SeriesNumber", "SeriesDescription", "Repeat", "EchoNumber"}
+        for reqs in self.get_tag_requirements().values():
+            fields.update(reqs)
+        return fields
+
     def matches_repeat(self, sidecar: dict) -> bool:
         """Check if a sidecar matches the current session's 'repeat'.
 
@@ -373,12 +398,13 @@ class NiiLinkExporter(SessionExporter):
                 if not isinstance(actual, str):
                     actual = str(actual)
 
+                regex = compile_pattern(pattern)
                 if is_regex:
-                    comparator = re.search
+                    comparator = regex.search
                 else:
-                    comparator = re.fullmatch
+                    comparator = regex.fullmatch
 
-                if not comparator(pattern, actual, re.IGNORECASE):
+                if not comparator(actual):
                     match = False
                 elif exclude:
                     # Tag does match, but settings indicate to take inverse
@@ -466,3 +492,157 @@ def make_link(source: str, target: str):
         pass
     except OSError as e:
         logger.error(f"Failed to create {target} - {e}")
+
+
+class SidecarIndex:
+    """The parsed JSON sidecars of a BIDS folder.
+
+    Each sidecar is kept with the modification time and size of its file,
+    so reading the folder again only parses files that are new or changed.
+    If an index file is given the index is loaded from it, and save() writes
+    it back, so later runs can skip parsing unchanged sidecars too.
+
+    Args:
+        bids_path (:obj:`str`): The folder to find sidecars in.
+        index_file (:obj:`str`, optional): A file to keep the index in.
+        fields (:obj:`set`, optional): The sidecar fields to keep. All
+            fields are kept if not given.
+    """
+
+    version = 1
+
+    def __init__(self, bids_path: str, index_file: str | None = None,
+                 fields: set[str] | None = None):
+        self.bids_path = bids_path
+        self.index_file = index_file
+        self.fields = set(fields) if fields else None
+        self.parsed = 0
+        self._entries = {}
+        self._changed = False
+        if index_file:
+            self._load()
+
+    def read(self) -> list[dict]:
+        """Get the contents of every readable sidecar in the folder.
+
+        Returns:
+            list: The contents of each sidecar, as from read_sidecar.
+        """
+        entries = {}
+        for sidecar in Path(self.bids_path).rglob("*.json"):
+            try:
+                stat = sidecar.stat()
+            except OSError:
+                continue
+            key = str(sidecar)
+            file_id = [stat.st_mtime_ns, stat.st_size]
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != file_id:
+                entry = (file_id, self._parse(sidecar))
+                self.parsed += 1
+                self._changed = True
+            entries[key] = entry
+
+        if entries.keys() != self._entries.keys():
+            self._changed = True
+        self._entries = entries
+        return [dict(contents) for _, contents in entries.values()
+                if contents]
+
+    def _parse(self, sidecar):
+        contents = read_sidecar(sidecar)
+        if not (contents and self.fields):
+            return contents
+        return {field: value for field, value in contents.items()
+                if field in self.fields or field == "Path"}
+
+    def save(self):
+        """Write the index to its file, if it has one and has changed.
+
+        Nothing is written if the file's folder doesn't exist yet.
+        """
+        if not (self.index_file and self._changed):
+            return
+        if not os.path.isdir(os.path.dirname(self.index_file)):
+            return
+        sidecars = {}
+        for key, (file_id, contents) in self._entries.items():
+            contents = {field: value for field, value in contents.items()
+                        if field != "Path"}
+            sidecars[key] = [file_id, contents]
+        # The index is only a cache, so failures aren't retried
+        try:
+            replace_file(
+                [json.dumps({
+                    "version": self.version,
+                    "fields": sorted(self.fields) if self.fields else None,
+                    "sidecars": sidecars
+                })],
+                self.index_file
+            )
+        except OSError as e:
+            logger.debug(f"Failed to save sidecar index {self.index_file} "
+                         f"- {e}")
+            return
+        self._changed = False
+
+    def _load(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as fh:
+                saved = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.debug(f"Ignoring unreadable sidecar index {self.index_file}"
+                         f" - {e}")
+            return
+        try:
+            self._entries = self._read_saved(saved)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.debug(f"Ignoring malformed sidecar index {self.index_file}"
+                         f" - {e}")
+
+    def _read_saved(self, saved):
+        """Get the entries from a saved index, if they can be reused.
+        """
+        if saved.get("version") != self.version:
+            return {}
+        saved_fields = saved.get("fields")
+        if saved_fields is not None and (
+                self.fields is None or not self.fields <= set(saved_fields)):
+            # Saved with fewer fields than are needed now
+            return {}
+        entries = {}
+        for key, (file_id, contents) in saved["sidecars"].items():
+            if contents:
+                contents = dict(contents, Path=Path(key))
+            entries[key] = (list(file_id), contents)
+        return entries
+
+
+# Indexes are shared by every exporter working on the same BIDS folder. Only
+# the most recently used few are kept, since a run may cover a whole study.
+_indexes = OrderedDict()
+MAX_INDEXES = 4
+
+
+def get_sidecar_index(bids_path: str, index_file: str | None = None,
+                      fields: set[str] | None = None) -> SidecarIndex:
+    """Get the shared SidecarIndex for a BIDS folder.
+
+    Args:
+        bids_path (:obj:`str`): The BIDS session folder.
+        index_file (:obj:`str`, optional): A file to keep the index in.
+        fields (:obj:`set`, optional): The sidecar fields to keep.
+
+    Returns:
+        :obj:`SidecarIndex`: The index for the folder.
+    """
+    key = (bids_path, index_file, frozenset(fields or ()))
+    try:
+        _indexes.move_to_end(key)
+    except KeyError:
+        _indexes[key] = SidecarIndex(bids_path, index_file, fields=fields)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return _indexes[key]
@@ -6,6 +6,7 @@ create the files and database contents users may actually interact with.
 """
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import glob
 import json
@@ -13,11 +14,15 @@ import logging
 import os
 import re
 import shutil
+import threading
 from pathlib import Path
 from zipfile import ZipFile, BadZipFile
 
+import pydicom as dcm
+
+from datman.config import TagMatcher, compile_pattern
 from datman.exceptions import ParseException, XnatException
-from datman.utils import is_dicom, get_archive_headers
+from datman.utils import is_dicom
 
 
 logger = logging.getLogger(__name__)
@@ -86,6 +91,10 @@ class SessionImporter(ABC):
         """Retrieve all of the session's dcm files and place them in dest_dir.
         """
 
+    def close(self):
+        """Release any files or connections held open by the importer.
+        """
+
     def assign_scan_names(self, config, ident):
         """Assign a datman style name to each scan in this experiment.
 
@@ -830,24 +839,18 @@ class XNATScan(SeriesImporter, XNATObject):
         return False
 
     def set_tag(self, tag_map):
-        matches = {}
-        for tag, pattern in tag_map.items():
-
-            if 'SeriesDescription' in pattern:
-                regex = pattern['SeriesDescription']
-                search_target = self.description
-            elif 'XnatType' in pattern:
-                regex = pattern['XnatType']
-                search_target = self.type
-            else:
-                raise KeyError(
-                    "Missing keys 'SeriesDescription' or 'XnatType'"
-                    " for Pattern!")
+        if not isinstance(tag_map, TagMatcher):
+            tag_map = TagMatcher(tag_map)
+
+        if any(tag_map.field(tag) is None for tag, _ in tag_map.items()):
+            raise KeyError(
+                "Missing keys 'SeriesDescription' or 'XnatType'"
+                " for Pattern!")
 
-            if isinstance(regex, list):
-                regex = "|".join(regex)
-            if re.search(regex, search_target, re.IGNORECASE):
-                matches[tag] = pattern
+        found = set(tag_map.search('SeriesDescription', self.description))
+        found.update(tag_map.search('XnatType', self.type))
+        matches = {tag: pattern for tag, pattern in tag_map.items()
+                   if tag in found}
 
         if len(matches) == 1 or (len(matches) == 2 and self.multiecho):
             self.tags = list(matches.keys())
@@ -858,7 +861,8 @@ class XNATScan(SeriesImporter, XNATObject):
         try:
             for tag, pattern in tag_map.items():
                 if tag in matches:
-                    if not re.search(pattern["ImageType"], self.image_type):
+                    regex = compile_pattern(pattern["ImageType"], 0)
+                    if not regex.search(self.image_type):
                         del matches[tag]
         except (re.error, TypeError) as e:
             logger.error(f"Error applying FMAP tags: {e}. Ignoring tag.")
@@ -872,7 +876,7 @@ class XNATScan(SeriesImporter, XNATObject):
     def set_datman_name(self, base_name, tags):
         mangled_descr = self._mangle_descr()
         padded_series = self.series.zfill(2)
-        tag_settings = self.set_tag(tags.series_map)
+        tag_settings = self.set_tag(tags.matcher)
 
         if not tag_settings:
             raise ParseException(
@@ -1061,14 +1065,130 @@ class XNATScan(SeriesImporter, XNATObject):
         return self.__str__()
 
 
+# The number of threads used to extract members from a zip file
+ZIP_EXTRACT_WORKERS = 4
+
+
+class ZipIndex:
+    """The contents of a zip file, read once and shared by its importers.
+
+    The zip's central directory and the header (without pixel data) of the
+    first dicom in each folder are read when the index is made. Extracting
+    members reopens the zip a single time, and it's then kept open for all
+    later extractions until close() is called.
+
+    Args:
+        path (:obj:`str`): The full path to a zip file.
+        workers (int, optional): The number of threads to use when
+            extracting members. Defaults to ZIP_EXTRACT_WORKERS.
+
+    Attributes:
+        path (:obj:`str`): The full path to the zip file.
+        members (:obj:`list`): The :obj:`zipfile.ZipInfo` for every file
+            (i.e. not directories) in the zip, in archive order.
+        headers (:obj:`dict`): A dictionary mapping each folder that contains
+            a readable dicom to that dicom's header.
+    """
+
+    def __init__(self, path, workers=ZIP_EXTRACT_WORKERS):
+        self.path = path
+        self.workers = workers
+        self._handle = None
+        self._lock = threading.Lock()
+        with ZipFile(path, "r") as fh:
+            self.members = [item for item in fh.infolist()
+                            if not item.is_dir()]
+            self.headers = self._read_headers(fh)
+
+    def _read_headers(self, fh):
+        headers = {}
+        for item in self.members:
+            dirname = os.path.dirname(item.filename)
+            if dirname in headers:
+                continue
+            try:
+                with fh.open(item) as member:
+                    headers[dirname] = dcm.dcmread(
+                        member, stop_before_pixels=True)
+            except dcm.filereader.InvalidDicomError:
+                continue
+            except BadZipFile:
+                logger.warning(f"Error in zipfile:{self.path}")
+                break
+        return headers
+
+    def _open(self):
+        with self._lock:
+            if self._handle is None:
+                self._handle = ZipFile(self.path, "r")
+            return self._handle
+
+    def extract(self, names, dest_dir):
+        """Extract members of the zip file.
+
+        Members are extracted by a pool of threads that share a single
+        open handle on the zip file.
+
+        Args:
+            names (:obj:`list`): The archive paths of the members to extract.
+            dest_dir (:obj:`str`): The full path to the folder to extract
+                them into. Archive paths are preserved beneath it.
+        """
+        fh = self._open()
+        if self.workers is None or self.workers < 2 or len(names) < 2:
+            for name in names:
+                self._extract_member(fh, name, dest_dir)
+            return
+        with ThreadPoolExecutor(self.workers) as pool:
+            # list() so any exceptions are raised here
+            list(pool.map(
+                lambda name: self._extract_member(fh, name, dest_dir), names
+            ))
+
+    @staticmethod
+    def _extract_member(fh, name, dest_dir):
+        # Sanitize the path the same way ZipFile.extract does, and make
+        # folders in a way that's safe when threads race to create them.
+        parts = [part for part in name.split("/")
+                 if part not in ("", ".", "..")]
+        target = os.path.join(dest_dir, *parts)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with fh.open(name) as source, open(target, "wb") as dest:
+            shutil.copyfileobj(source, dest, 1024 * 1024)
+
+    def close(self):
+        """Close the zip file, if it's open.
+        """
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+    def __str__(self):
+        return f"<ZipIndex {self.path}>"
+
+    def __repr__(self):
+        return self.__str__()
+
+
 class ZipImporter(SessionImporter):
     """A zip file to be managed by datman.
+
+    The zip's contents are indexed once, and the index is shared with all of
+    its ZipSeriesImporters.
+
+    Args:
+        ident (:obj:`datman.scanid.Identifier`): The session's ID.
+        zip_path (:obj:`str`): The full path to the zip file.
+        workers (int, optional): The number of threads to use when
+            extracting files. Defaults to ZIP_EXTRACT_WORKERS.
     """
 
-    def __init__(self, ident, zip_path):
+    def __init__(self, ident, zip_path, workers=ZIP_EXTRACT_WORKERS):
         self.ident = ident
         self.name = zip_path
         self.path = zip_path
+        self.index = ZipIndex(zip_path, workers=workers)
         self.contents = self.parse_contents()
         self.scans = self.get_scans()
         self.resource_files = self.contents['resources']
@@ -1148,22 +1268,28 @@ class ZipImporter(SessionImporter):
         Args:
             dest_dir (str): The full path to the location to extract into.
         """
+        names = []
+        for item in self.scans:
+            names.extend(item.contents)
+        self.index.extract(names + self.resource_files, dest_dir)
         for item in self.scans:
-            item.get_files(dest_dir)
-        self.get_resources(dest_dir)
+            item.dcm_dir = os.path.join(dest_dir, item.series_dir)
 
     def get_resources(self, dest_dir: str, fname: str = None):
         """Unpack resource (non-dicom) files at the given location.
 
         Args:
             dest_dir (str): The full path to the location to extract into.
+            fname (str, optional): A single resource file to extract.
+                Defaults to all resource files.
         """
-        with ZipFile(self.path, "r") as fh:
-            if fname:
-                fh.extract(fname, path=dest_dir)
-                return
-            for item in self.resource_files:
-                fh.extract(item, path=dest_dir)
+        if fname:
+            self.index.extract([fname], dest_dir)
+            return
+        self.index.extract(self.resource_files, dest_dir)
+
+    def close(self):
+        self.index.close()
 
     def parse_contents(self) -> dict:
         """Read and organize the contents of the zip file.
@@ -1172,17 +1298,13 @@ class ZipImporter(SessionImporter):
             'scans': {},
             'resources': []
         }
-        with ZipFile(self.path, "r") as fh:
-            for item in fh.filelist:
-                if item.is_dir():
-                    continue
-
-                if self.is_scan(item.filename):
-                    folder, _ = os.path.split(item.filename)
-                    contents['scans'].setdefault(folder, []).append(
-                        item.filename)
-                else:
-                    contents['resources'].append(item.filename)
+        for item in self.index.members:
+            if self.is_scan(item.filename):
+                folder, _ = os.path.split(item.filename)
+                contents['scans'].setdefault(folder, []).append(
+                    item.filename)
+            else:
+                contents['resources'].append(item.filename)
         return contents
 
     def is_scan(self, fname):
@@ -1207,14 +1329,14 @@ class ZipImporter(SessionImporter):
     def get_scans(self) -> list['ZipSeriesImporter']:
         """Get ZipSeriesImporters for each scan in the session.
         """
-        headers = get_archive_headers(self.path)
         scans = {}
         duplicate_series = set()
-        for sub_path, header in headers.items():
+        for sub_path, header in self.index.headers.items():
             try:
                 zip_scan = ZipSeriesImporter(
                         self.ident, self.path, sub_path,
-                        header, self.contents['scans'][sub_path]
+                        header, self.contents['scans'][sub_path],
+                        index=self.index
                 )
             except KeyError:
                 logger.error(f"Subdirectory {sub_path} not found in contents for {self.path}.")
@@ -1248,11 +1370,13 @@ class ZipSeriesImporter(SeriesImporter):
     """
 
     # pylint: disable-next=too-many-arguments,too-many-positional-arguments
-    def __init__(self, ident, zip_file, series_dir, header, zip_items):
+    def __init__(self, ident, zip_file, series_dir, header, zip_items,
+                 index=None):
         self.ident = ident
         self.subject = ident.get_full_subjectid()
         self.experiment = ident.get_full_subjectid_with_timepoint_session()
         self.zip_file = zip_file
+        self.index = index
         self.series_dir = series_dir
         self.header = header
         self.contents = zip_items
@@ -1358,15 +1482,19 @@ class ZipSeriesImporter(SeriesImporter):
         return any(item.endswith(".dcm") for item in self.contents)
 
     def get_files(self, dest_dir: str, *args, **kwargs):
-        with ZipFile(self.zip_file, "r") as fh:
-            for item in self.contents:
-                fh.extract(item, path=dest_dir)
+        if self.index is not None:
+            self.index.extract(self.contents, dest_dir)
+        else:
+            # Without a shared index, only open the zip to extract this series
+            with ZipFile(self.zip_file, "r") as fh:
+                for item in self.contents:
+                    fh.extract(item, path=dest_dir)
         self.dcm_dir = os.path.join(dest_dir, self.series_dir)
 
     def set_datman_name(self, base_name: str, tags: 'datman.config.TagInfo'
                         ) -> list[str]:
         mangled_descr = self._mangle_descr()
-        tag_settings = self.set_tag(tags.series_map)
+        tag_settings = self.set_tag(tags.matcher)
         if not tag_settings:
             raise ParseException(
                 f"Can't identify tag for series {self.series}")
@@ -1381,18 +1509,16 @@ class ZipSeriesImporter(SeriesImporter):
         return names
 
     def set_tag(self, tag_map):
-        matches = {}
-        for tag, pattern in tag_map.items():
-            if 'SeriesDescription' not in pattern:
-                raise KeyError(
-                    "Missing key 'SeriesDescription' for 'Pattern'!")
-
-            regex = pattern['SeriesDescription']
-            if isinstance(regex, list):
-                regex = "|".join(regex)
-
-            if re.search(regex, self.description, re.IGNORECASE):
-                matches[tag] = pattern
+        if not isinstance(tag_map, TagMatcher):
+            tag_map = TagMatcher(tag_map)
+
+        if any(tag_map.field(tag) != 'SeriesDescription'
+               for tag, _ in tag_map.items()):
+            raise KeyError(
+                "Missing key 'SeriesDescription' for 'Pattern'!")
+
+        found = tag_map.search('SeriesDescription', self.description)
+        matches = {tag: tag_map.series_map[tag] for tag in found}
 
         if (len(matches) == 1 or
                 all('EchoNumber' in conf for conf in matches.values())):
@@ -31,6 +31,8 @@ import os
 from abc import ABCMeta, abstractmethod
 from collections import defaultdict
 
+import pandas as pd
+
 from datman.utils import get_archive_headers
 
 logger = logging.getLogger(os.path.basename(__file__))
@@ -119,6 +121,58 @@ def update_scans_csv(output, new_entries):
         scan_csv.writelines(new_entries)
 
 
+class ScanLookup:
+    """
+    A scans.csv lookup table indexed by source_name.
+
+    The table is indexed once when it's loaded, so finding the entries for
+    an archive doesn't require a scan of every row. If a source_name appears
+    more than once, the first row is used for its target_name.
+
+    table:                  A DataFrame with at least source_name and
+                            target_name columns
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._index = table.groupby("source_name", sort=False).indices
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Read a whitespace delimited lookup table (e.g. scans.csv).
+        """
+        return cls(pd.read_csv(path, sep=r"\s+", dtype=str))
+
+    def __contains__(self, source_name):
+        return source_name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def get_rows(self, source_name):
+        """
+        Return a DataFrame of all rows for source_name, or None if it's
+        not in the table.
+        """
+        try:
+            rows = self._index[source_name]
+        except KeyError:
+            return None
+        return self.table.iloc[rows]
+
+    def get_target(self, source_name):
+        """
+        Return the target_name for source_name, or None if it's not in
+        the table.
+        """
+        try:
+            row = self._index[source_name][0]
+        except KeyError:
+            return None
+        return self.table["target_name"].iat[row]
+
+
 class ScanEntryABC(object, metaclass=ABCMeta):
     def __init__(self, scan_path):
         self.source_name = os.path.basename(scan_path).replace(".zip", "")
@@ -1,7 +1,10 @@
 """
 A collection of utilities for generally munging imaging data.
 """
+import collections
+import concurrent.futures
 import contextlib
+import fcntl
 import io
 import json
 import logging
@@ -9,12 +12,16 @@ import os
 import random
 import re
 import shutil
+import stat
+import struct
 import subprocess as proc
 import sys
 import tarfile
 import tempfile
 import time
+import warnings
 import zipfile
+import zlib
 
 import pydicom as dcm
 import pyxnat
@@ -198,9 +205,8 @@ def _fetch_checklist(
     if config and not study:
         study = config.study_name
 
-    db_study = dashboard.get_project(study)
     entries = {}
-    for timepoint in db_study.timepoints:
+    for timepoint in dashboard.get_study_timepoints(study):
         if timepoint.is_phantom or not len(timepoint.sessions):
             continue
         session = list(timepoint.sessions.values())[0]
@@ -309,9 +315,8 @@ def update_checklist(entries, study=None, config=None, path=None):
     checklist_path = locate_metadata(
         "checklist.csv", study=study, config=config, path=path
     )
-    old_entries = read_checklist(path=checklist_path)
 
-    # Merge with existing list
+    new_entries = {}
     for subject in entries:
         try:
             i = scanid.parse(subject)
@@ -319,12 +324,14 @@ def update_checklist(entries, study=None, config=None, path=None):
             raise MetadataException(
                 f"Attempt to add invalid subject ID {subject} to QC checklist"
             )
-        old_entries[i.get_full_subjectid_with_timepoint()] = entries[subject]
+        new_entries[i.get_full_subjectid_with_timepoint()] = entries[subject]
 
-    # Reformat to expected checklist line format
-    lines = [f"qc_{sub}.html {old_entries[sub]}\n" for sub in old_entries]
-
-    write_metadata(sorted(lines), checklist_path)
+    merge_metadata(
+        checklist_path,
+        new_entries,
+        lambda path: read_checklist(path=path),
+        lambda sub, comment: f"qc_{sub}.html {comment}\n",
+    )
 
 
 def _update_qc_reviewers(entries):
@@ -479,8 +486,7 @@ def _fetch_blacklist(
     else:
         if config:
             study = config.study_name
-        db_study = dashboard.get_project(study)
-        blacklist = db_study.get_blacklisted_scans()
+        blacklist = dashboard.get_study_blacklist(study)
 
     entries = {}
     for entry in blacklist:
@@ -559,8 +565,8 @@ def update_blacklist(entries, study=None, config=None, path=None):
     blacklist_path = locate_metadata(
         "blacklist.csv", study=study, config=config, path=path
     )
-    old_entries = read_blacklist(path=blacklist_path)
 
+    new_entries = {}
     for scan_name in entries:
         try:
             scanid.parse_filename(scan_name)
@@ -574,12 +580,15 @@ def update_blacklist(entries, study=None, config=None, path=None):
                 f"Skipping {scan_name}"
             )
             continue
-        old_entries[scan_name] = entries[scan_name]
-
-    lines = [f"{sub} {old_entries[sub]}\n" for sub in old_entries]
-    new_list = ["series\treason\n"]
-    new_list.extend(sorted(lines))
-    write_metadata(new_list, blacklist_path)
+        new_entries[scan_name] = entries[scan_name]
+
+    merge_metadata(
+        blacklist_path,
+        new_entries,
+        lambda path: read_blacklist(path=path),
+        lambda scan, comment: f"{scan} {comment}\n",
+        header="series\treason\n",
+    )
 
 
 def _update_scan_checklist(entries):
@@ -607,18 +616,90 @@ def _update_scan_checklist(entries):
         )
 
 
+@contextlib.contextmanager
+def lock_metadata(path):
+    """Hold an exclusive lock on a metadata file until the block exits.
+
+    The lock is taken on a '<path>.lock' file beside the metadata file,
+    since the metadata file itself may be replaced while the lock is held.
+    Every process updating the file through datman takes this lock, so
+    updates from concurrent jobs are applied one at a time.
+    """
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def merge_metadata(path, entries, read_entries, make_line, header=None):
+    """Add or update entries in a metadata file while holding its lock.
+
+    All the given entries are written at once. If they're all new they're
+    appended to the file, otherwise the file is rewritten (sorted, and
+    without duplicate entries) and then moved into place.
+
+    Args:
+        path (:obj:`str`): The full path to the metadata file. It will be
+            created if it doesn't exist.
+        entries (:obj:`dict`): Entry names mapped to their new comment.
+        read_entries (:obj:`function`): A function that takes the path
+            and returns a dictionary of the file's current entries.
+        make_line (:obj:`function`): A function that takes an entry name
+            and comment and returns the line to write for them.
+        header (:obj:`str`, optional): A header line the file should start
+            with. Defaults to None.
+    """
+    with lock_metadata(path):
+        if os.path.exists(path):
+            old_entries = read_entries(path)
+        else:
+            old_entries = {}
+
+        if any(old_entries.get(name, comment) != comment
+               for name, comment in entries.items()):
+            old_entries.update(entries)
+            lines = [header] if header else []
+            lines.extend(sorted(
+                make_line(name, comment)
+                for name, comment in old_entries.items()
+            ))
+            write_metadata(lines, path)
+            return
+
+        lines = [make_line(name, comment)
+                 for name, comment in entries.items()
+                 if name not in old_entries]
+        if lines:
+            _append_metadata(lines, path, header=header)
+
+
+def _append_metadata(lines, path, header=None):
+    with open(path, "a+") as meta_file:
+        meta_file.seek(0)
+        contents = meta_file.read()
+        if not contents and header:
+            lines.insert(0, header)
+        elif contents and not contents.endswith("\n"):
+            lines.insert(0, "\n")
+        meta_file.writelines(lines)
+
+
 def write_metadata(lines, path, retry=3):
     """
     Repeatedly attempts to write lines to <path>. The destination file
     will be overwritten with <lines> so any contents you wish to preserve
     should be contained within the list.
+
+    The lines are written to a temporary file that is then moved into
+    place, so readers never see a partially written file.
     """
     if not retry:
         raise MetadataException(f"Failed to update {path}")
 
     try:
-        with open(path, "w") as meta_file:
-            meta_file.writelines(lines)
+        replace_file(lines, path)
     except Exception:
         logger.error(
             f"Failed to write metadata file {path}. Tries remaining - {retry}"
@@ -628,6 +709,38 @@ def write_metadata(lines, path, retry=3):
         write_metadata(lines, path, retry=retry - 1)
 
 
+def replace_file(lines, path):
+    """Atomically replace the contents of <path> with <lines>.
+
+    The existing file's permissions are kept. Unlike write_metadata, failures
+    are not retried.
+
+    Args:
+        lines (:obj:`list` of :obj:`str`): The new contents of the file.
+        path (:obj:`str`): The full path to the file to replace. It will be
+            created if it does not exist.
+    """
+    # Creating the file first gives the replacement the permissions any new
+    # file would get (temp files are only readable by their owner)
+    with open(path, "a"):
+        pass
+    mode = stat.S_IMODE(os.stat(path).st_mode)
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=f".{os.path.basename(path)}.",
+    )
+    try:
+        with os.fdopen(fd, "w") as meta_file:
+            meta_file.writelines(lines)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
 def get_subject_metadata(config=None, study=None, allow_partial=False):
     """Returns all QC'd session IDs mapped to any blacklisted scans they have
 
@@ -706,7 +819,8 @@ def get_extension(path):
         return os.path.splitext(path)[1]
 
 
-def get_archive_headers(path, stop_after_first=False):
+def get_archive_headers(path, stop_after_first=False, tar_index=None,
+                        workers=None):
     """
     Get dicom headers from a scan archive.
 
@@ -720,40 +834,132 @@ def get_archive_headers(path, stop_after_first=False):
     If stop_after_first == True only a single set of dicom headers are
     returned for the entire archive, which is useful if you only care about the
     exam details.
+
+    If tar_index is given and path is an uncompressed tarball, it is used as
+    the offset index file for get_tarfile_headers. If workers is given and
+    path is a folder, headers are read by a pool of that many threads.
     """
     if os.path.isdir(path):
-        return get_folder_headers(path, stop_after_first)
+        return get_folder_headers(path, stop_after_first, workers=workers)
     elif zipfile.is_zipfile(path):
         return get_zipfile_headers(path, stop_after_first)
-    elif os.path.isfile(path) and path.endswith(".tar.gz"):
-        return get_tarfile_headers(path, stop_after_first)
+    elif os.path.isfile(path) and path.endswith((".tar", ".tar.gz", ".tgz")):
+        return get_tarfile_headers(path, stop_after_first,
+                                   index_file=tar_index)
     else:
         raise Exception(f"{path} must be a file (zip/tar) or folder.")
 
 
-def get_tarfile_headers(path, stop_after_first=False):
+def get_tarfile_headers(path, stop_after_first=False, index_file=None):
     """
     Get headers for dicom files within a tarball
+
+    Members are read one at a time, so the tarball is only read (and for
+    compressed tarballs, decompressed) as far as needed.
+
+    Args:
+        path (:obj:`str`): The full path to a tarball.
+        stop_after_first (bool, optional): Whether to stop after the first
+            dicom header is found. Defaults to False.
+        index_file (:obj:`str`, optional): The full path to a JSON file
+            recording where the first dicom of each folder is stored. For
+            uncompressed tarballs, it will be created or updated and later
+            calls will read the recorded offsets directly instead of
+            scanning the tarball. Ignored for compressed tarballs. Defaults
+            to None.
+
+    Returns:
+        dict: A dictionary mapping each folder to the header of a dicom
+            within it.
     """
-    tar = tarfile.open(path)
-    members = tar.getmembers()
+    if index_file and not _is_compressed(path):
+        manifest = _read_tar_index(path, index_file, stop_after_first)
+        if manifest is not None:
+            return manifest
+    else:
+        index_file = None
 
     manifest = {}
+    offsets = {}
     # for each dir, we want to inspect files inside of it until we find a dicom
     # file that has header information
-    for f in [x for x in members if x.isfile()]:
-        dirname = os.path.dirname(f.name)
-        if dirname in manifest:
-            continue
-        try:
-            manifest[dirname] = dcm.read_file(tar.extractfile(f))
+    with tarfile.open(path) as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            dirname = os.path.dirname(member.name)
+            if dirname in manifest:
+                continue
+            try:
+                manifest[dirname] = dcm.read_file(tar.extractfile(member))
+            except dcm.filereader.InvalidDicomError:
+                continue
+            offsets[dirname] = [member.offset_data, member.size]
             if stop_after_first:
                 break
-        except dcm.filereader.InvalidDicomError:
-            continue
+
+    if index_file:
+        _write_tar_index(path, index_file, offsets,
+                         complete=not stop_after_first)
     return manifest
 
 
+def _is_compressed(path):
+    with open(path, "rb") as fh:
+        magic = fh.read(6)
+    return magic.startswith((b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00"))
+
+
+def _tar_signature(path):
+    info = os.stat(path)
+    return {"size": info.st_size, "mtime": info.st_mtime}
+
+
+def _read_tar_index(path, index_file, stop_after_first):
+    """Read dicom headers using a tar offset index.
+
+    Returns None if the index is missing, stale or doesn't cover the
+    headers requested.
+    """
+    try:
+        with open(index_file, "r") as fh:
+            index = json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+    if index.get("tarball") != _tar_signature(path):
+        logger.debug(f"Offset index {index_file} is out of date for {path}")
+        return None
+    if not index["series"] or not (stop_after_first or index["complete"]):
+        return None
+
+    manifest = {}
+    with open(path, "rb") as fh:
+        for dirname, (offset, size) in index["series"].items():
+            fh.seek(offset)
+            try:
+                manifest[dirname] = dcm.read_file(io.BytesIO(fh.read(size)))
+            except dcm.filereader.InvalidDicomError:
+                logger.debug(f"Offset index {index_file} doesn't match {path}")
+                return None
+            if stop_after_first:
+                break
+    return manifest
+
+
+def _write_tar_index(path, index_file, offsets, complete):
+    index = {
+        "tarball": _tar_signature(path),
+        "complete": complete,
+        "series": offsets
+    }
+    try:
+        with open(index_file, "w") as fh:
+            json.dump(index, fh)
+    except OSError as e:
+        logger.warning(f"Failed to write tar offset index {index_file} - {e}")
+
+
 def get_zipfile_headers(path, stop_after_first=False):
     """
     Get headers for a dicom file within a zipfile
@@ -777,57 +983,107 @@ def get_zipfile_headers(path, stop_after_first=False):
     return manifest
 
 
-def get_folder_headers(path, stop_after_first=False):
+def get_folder_headers(path, stop_after_first=False, workers=None):
     """
     Generate a dictionary of subfolders and dicom headers.
-    """
 
+    The header of the first readable dicom in path and in each folder beneath
+    it is returned, keyed by folder. If stop_after_first is set, the search
+    ends as soon as a single header is found.
+
+    If workers is given, folders are read by a pool of that many threads.
+    This helps on network filesystems, where every read waits on the server.
+    """
     manifest = {}
+    folders = _walk_folders(path, followlinks=True)
 
-    # for each dir, we want to inspect files inside of it until we find a dicom
-    # file that has header information
-    subdirs = []
-    for filename in os.listdir(path):
-        filepath = os.path.join(path, filename)
-        try:
-            if os.path.isdir(filepath):
-                subdirs.append(filepath)
+    if stop_after_first or not workers or workers < 2:
+        for folder, files in folders:
+            header = _read_first_header(files)
+            if header is None:
                 continue
-            manifest[path] = dcm.read_file(filepath)
-            break
-        except dcm.filereader.InvalidDicomError:
-            pass
-
-    if stop_after_first:
+            manifest[folder] = header
+            if stop_after_first:
+                break
         return manifest
 
-    # recurse
-    for subdir in subdirs:
-        manifest.update(get_folder_headers(subdir, stop_after_first))
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        results = [(folder, pool.submit(_read_first_header, files))
+                   for folder, files in folders]
+        for folder, result in results:
+            header = result.result()
+            if header is not None:
+                manifest[folder] = header
     return manifest
 
 
-def get_all_headers_in_folder(path, recurse=False):
+def get_all_headers_in_folder(path, recurse=False, workers=None):
     """
     Get DICOM headers for all files in the given path.
 
-    Returns a dictionary mapping path->headers for *all* files (headers == None
-    for files that are not dicoms).
+    Returns a dictionary mapping path->headers for all dicom files (files
+    that are not dicoms are omitted). If workers is given, files are read by
+    a pool of that many threads.
     """
-
-    manifest = {}
-    for dirname, dirnames, filenames in os.walk(path):
-        for filename in filenames:
-            filepath = os.path.join(dirname, filename)
-            headers = None
-            try:
-                headers = dcm.read_file(filepath)
-            except dcm.filereader.InvalidDicomError:
-                continue
-            manifest[filepath] = headers
+    files = []
+    for _, folder_files in _walk_folders(path):
+        files.extend(folder_files)
         if not recurse:
             break
-    return manifest
+
+    if not workers or workers < 2:
+        headers = map(_read_header, files)
+        return {f: h for f, h in zip(files, headers) if h is not None}
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        headers = pool.map(_read_header, files)
+        return {f: h for f, h in zip(files, headers) if h is not None}
+
+
+def _walk_folders(path, followlinks=False):
+    """Yield each folder beneath path (top down) with the files it contains.
+
+    os.scandir's cached entry types are used, so on most filesystems no
+    extra stat call is needed per entry. As with os.walk, symlinks to
+    folders are only followed if followlinks is set. Each folder is then
+    visited once, so links that point back up the tree can't loop forever.
+    """
+    visited = {os.path.realpath(path)}
+    to_visit = [path]
+    while to_visit:
+        folder = to_visit.pop()
+        files = []
+        subdirs = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    files.append(entry.path)
+                    continue
+                if not followlinks:
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                real_path = os.path.realpath(entry.path)
+                if real_path not in visited:
+                    visited.add(real_path)
+                    subdirs.append(entry.path)
+        yield folder, files
+        to_visit.extend(reversed(subdirs))
+
+
+def _read_header(filepath):
+    try:
+        return dcm.read_file(filepath)
+    except dcm.filereader.InvalidDicomError:
+        return None
+
+
+def _read_first_header(files):
+    for filepath in files:
+        header = _read_header(filepath)
+        if header is not None:
+            return header
+    return None
 
 
 def define_folder(path):
@@ -1290,12 +1546,14 @@ def get_resources(open_zipfile):
     # filter files named like dicoms
     files = [f for f in files if not is_named_like_a_dicom(f)]
 
-    # filter actual dicoms :D.
+    # filter actual dicoms :D. Only the start of each member is needed,
+    # so stream it instead of decompressing the whole thing.
     resource_files = []
     for f in files:
         try:
-            if not is_dicom(io.BytesIO(open_zipfile.read(f))):
-                resource_files.append(f)
+            with open_zipfile.open(f) as member:
+                if not is_dicom(member):
+                    resource_files.append(f)
         except zipfile.BadZipfile:
             logger.error(f"Error in zipfile:{f}")
     return resource_files
@@ -1306,31 +1564,309 @@ def is_named_like_a_dicom(path):
     return any([path.lower().endswith(x) for x in dcm_exts])
 
 
+# The 128 byte preamble plus the 'DICM' prefix
+DICOM_PREFIX_SIZE = 132
+# How much of a file without a preamble to parse when looking for a header.
+DICOM_HEADER_SIZE = 4096
+
+
 def is_dicom(fileobj):
+    """Check whether a file is a dicom without reading all of it.
+
+    Files with the standard preamble are recognized from their first 132
+    bytes. Files without one are accepted if the first few KB parse as a
+    dicom header.
+
+    Args:
+        fileobj (:obj:`str` or file-like): The path to a file or a binary
+            file object positioned at the start of the file.
+
+    Returns:
+        bool: True if the file appears to be a dicom, False otherwise.
+    """
+    if isinstance(fileobj, (str, os.PathLike)):
+        try:
+            with open(fileobj, "rb") as fh:
+                return _sniff_dicom(fh)
+        except OSError:
+            return False
+    return _sniff_dicom(fileobj)
+
+
+def _sniff_dicom(fh):
     try:
-        dcm.read_file(fileobj)
-    except dcm.filereader.InvalidDicomError:
+        head = fh.read(DICOM_PREFIX_SIZE)
+    except Exception:
         return False
+
+    if head[128:132] == b"DICM":
+        return True
+
+    # Without a preamble, a file must start with a (little endian) file meta
+    # or identifying group element. Anything else isn't worth parsing.
+    if len(head) < 8 or head[:2] not in (b"\x02\x00", b"\x08\x00"):
+        return False
+
+    try:
+        head += fh.read(DICOM_HEADER_SIZE - len(head))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            header = dcm.dcmread(io.BytesIO(head), force=True,
+                                 stop_before_pixels=True)
+            sop_class = header.get("SOPClassUID") or \
+                header.file_meta.get("MediaStorageSOPClassUID")
     except Exception:
         return False
-    return True
+    # A forced read will 'succeed' on almost anything, so make sure it
+    # found something only a real dicom would have.
+    return bool(sop_class) and bool(re.fullmatch(r"[0-9.]+", str(sop_class)))
+
 
+# Compression methods that can be chosen for new zip files
+ZIP_METHODS = {"stored": zipfile.ZIP_STORED, "deflate": zipfile.ZIP_DEFLATED}
+# Files bigger than this are compressed in the main thread, so that workers
+# never hold a huge file in memory.
+_MAX_PARALLEL_ZIP_SIZE = 64 * 1024 * 1024
+
+
+def get_zip_settings(config, site=None):
+    """Get the settings to use when making zip files.
+
+    Args:
+        config (:obj:`datman.config.config`): A datman configuration.
+        site (:obj:`str`, optional): A site to search for site-specific
+            settings. Defaults to None.
+
+    Returns:
+        dict: The 'compression', 'level' and 'workers' arguments to pass to
+            :func:`make_zip`. Unset settings are omitted.
+    """
+    settings = {}
+    for key, arg in [("ZipCompression", "compression"),
+                     ("ZipCompressionLevel", "level"),
+                     ("ZipWorkers", "workers")]:
+        try:
+            settings[arg] = config.get_key(key, site=site)
+        except datman.config.UndefinedSetting:
+            pass
+    return settings
+
+
+def make_zip(source_dir, dest_zip, compression="deflate", level=None,
+             workers=1):
+    """Zip up the contents of a folder.
+
+    Archive paths are relative to source_dir. Any existing file at dest_zip
+    will be overwritten.
+
+    Args:
+        source_dir (:obj:`str`): The full path to the folder to zip.
+        dest_zip (:obj:`str`): The full path of the zip file to create.
+        compression (:obj:`str`, optional): The compression method, either
+            'deflate' or 'stored' (i.e. uncompressed). Defaults to 'deflate'.
+        level (int, optional): The deflate compression level, from 0 (none)
+            to 9 (best). Defaults to zlib's default level.
+        workers (int, optional): The number of threads to compress files
+            with. Files are still written to the zip in order. Defaults to 1.
+
+    Raises:
+        ValueError: If an unknown compression method is given.
+    """
+    try:
+        compress_type = ZIP_METHODS[compression.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown zip compression method {compression}. Must be one of "
+            f"{', '.join(ZIP_METHODS)}") from None
 
-def make_zip(source_dir, dest_zip):
     # Can't use shutil.make_archive here because for python 2.7 it fails on
     # large zip files (seemingly > 2GB) and zips with more than about 65000
     # files. Soooo, doing it the hard way. Can change this if we ever move to
     # py3
+    items = []
+    for current_dir, _, files in os.walk(source_dir):
+        for item in files:
+            item_path = os.path.join(current_dir, item)
+            archive_path = item_path.replace(source_dir + "/", "")
+            items.append((item_path, archive_path))
+
+    # We want this to use 'w' flag, since it should overwrite any existing
+    # zip of the same name
     with zipfile.ZipFile(
-        dest_zip, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True
+        dest_zip, "w", compression=compress_type, compresslevel=level,
+        allowZip64=True
     ) as zip_handle:
-        # We want this to use 'w' flag, since it should overwrite any existing
-        # zip of the same name
-        for current_dir, folders, files in os.walk(source_dir):
-            for item in files:
-                item_path = os.path.join(current_dir, item)
-                archive_path = item_path.replace(source_dir + "/", "")
+        if compress_type == zipfile.ZIP_STORED or not workers or workers < 2:
+            for item_path, archive_path in items:
                 zip_handle.write(item_path, archive_path)
+            return
+        _write_compressed_parallel(zip_handle, items, level, workers)
+
+
+def _write_compressed_parallel(zip_handle, items, level, workers):
+    """Deflate files in a thread pool and write them to the zip in order.
+
+    zlib releases the GIL while compressing, so threads run in parallel.
+    """
+    def compress(item_path, archive_path):
+        info = zipfile.ZipInfo.from_file(item_path, archive_path)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        compressor = zlib.compressobj(
+            -1 if level is None else level, zlib.DEFLATED, -15)
+        with open(item_path, "rb") as fh:
+            data = fh.read()
+        compressed = compressor.compress(data) + compressor.flush()
+        info.CRC = zlib.crc32(data)
+        info.file_size = len(data)
+        info.compress_size = len(compressed)
+        return info, compressed
+
+    # Only a few files per worker are held in memory at once
+    window = workers * 2
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        for item_path, archive_path in items:
+            if os.path.getsize(item_path) > _MAX_PARALLEL_ZIP_SIZE:
+                pending.append((item_path, archive_path))
+            else:
+                pending.append(pool.submit(compress, item_path, archive_path))
+            while len(pending) > window:
+                _write_next(zip_handle, pending.popleft())
+        while pending:
+            _write_next(zip_handle, pending.popleft())
+
+
+def _write_next(zip_handle, job):
+    if isinstance(job, tuple):
+        zip_handle.write(*job)
+        return
+    info, compressed = job.result()
+    _write_raw_member(zip_handle, info, [compressed])
+
+
+# The fixed size part of a zip local file header
+_ZIP_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_ZIP64_EXTRA_ID = 0x0001
+
+
+def copy_zip_members(source_zip, dest_zip, members=None):
+    """Copy members of one zip file into a new one without recompressing.
+
+    The compressed bytes of each member are copied as-is, so this is much
+    faster than extracting and re-zipping an archive and needs no scratch
+    space. Members can be given new archive paths as they're copied.
+
+    Args:
+        source_zip (:obj:`str`): The full path to the zip file to read.
+        dest_zip (:obj:`str`): The full path of the zip file to create. Any
+            existing file will be overwritten.
+        members (:obj:`list` or :obj:`dict`, optional): The archive paths to
+            copy, or a dictionary mapping the archive paths to copy to the
+            path to give each in the new zip file. Directory entries are
+            always skipped. Defaults to every file in source_zip.
+
+    Raises:
+        KeyError: If a member isn't found in source_zip.
+        zipfile.BadZipFile: If a member's local header is corrupt or it is
+            encrypted.
+
+    Returns:
+        list: The archive paths written to dest_zip.
+    """
+    with zipfile.ZipFile(source_zip) as src:
+        if members is None:
+            members = src.namelist()
+        if not isinstance(members, dict):
+            members = {name: name for name in members}
+        to_copy = [
+            (src.getinfo(name), new_name)
+            for name, new_name in members.items()
+            if not name.endswith("/")
+        ]
+
+    written = []
+    with open(source_zip, "rb") as src_fh, \
+            zipfile.ZipFile(dest_zip, "w", allowZip64=True) as dest:
+        for info, new_name in to_copy:
+            _copy_raw_member(src_fh, info, dest, new_name)
+            written.append(new_name)
+    return written
+
+
+def _copy_raw_member(src_fh, info, dest, new_name):
+    if info.flag_bits & 0x1:
+        raise zipfile.BadZipFile(
+            f"Can't copy encrypted member {info.filename}")
+
+    src_fh.seek(info.header_offset)
+    header = src_fh.read(_ZIP_LOCAL_HEADER.size)
+    if len(header) != _ZIP_LOCAL_HEADER.size or \
+            header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+    fields = _ZIP_LOCAL_HEADER.unpack(header)
+    src_fh.seek(fields[10] + fields[11], os.SEEK_CUR)
+
+    new_info = zipfile.ZipInfo(new_name, date_time=info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.comment = info.comment
+    new_info.create_system = info.create_system
+    new_info.external_attr = info.external_attr
+    new_info.CRC = info.CRC
+    new_info.file_size = info.file_size
+    new_info.compress_size = info.compress_size
+    # Sizes are known up front so no trailing data descriptor is needed
+    new_info.flag_bits = info.flag_bits & ~0x8
+    new_info.extra = _strip_zip64_extra(info.extra)
+
+    def read_data():
+        remaining = info.compress_size
+        while remaining:
+            chunk = src_fh.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise zipfile.BadZipFile(
+                    f"Unexpected end of data for {info.filename}")
+            yield chunk
+            remaining -= len(chunk)
+
+    _write_raw_member(dest, new_info, read_data())
+
+
+def _write_raw_member(dest, info, chunks):
+    """Add an already compressed member to an open zip file.
+
+    Args:
+        dest (:obj:`zipfile.ZipFile`): A zip file opened for writing.
+        info (:obj:`zipfile.ZipInfo`): The member's info, with its CRC,
+            compression type and sizes already set.
+        chunks (iterable): The compressed data, as bytes.
+    """
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+    # zipfile has no public API for writing pre-compressed data, so this
+    # mirrors what ZipFile.open(..., 'w') does.
+    # pylint: disable=protected-access
+    with dest._lock:
+        dest.fp.seek(dest.start_dir)
+        info.header_offset = dest.fp.tell()
+        dest._writecheck(info)
+        dest._didModify = True
+        dest.fp.write(info.FileHeader(zip64))
+        for chunk in chunks:
+            dest.fp.write(chunk)
+        dest.filelist.append(info)
+        dest.NameToInfo[info.filename] = info
+        dest.start_dir = dest.fp.tell()
+    # pylint: enable=protected-access
+
+
+def _strip_zip64_extra(extra):
+    # The zip64 field is recalculated when the header is written.
+    result = b""
+    while len(extra) >= 4:
+        field_id, size = struct.unpack("<HH", extra[:4])
+        if field_id != _ZIP64_EXTRA_ID:
+            result += extra[:size + 4]
+        extra = extra[size + 4:]
+    return result
 
 
 def find_tech_notes(folder):
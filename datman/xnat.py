@@ -1,9 +1,13 @@
 """Module to interact with the xnat server"""
 
+import fcntl
 import getpass
+import json
 import logging
 import os
+import re
 import tempfile
+import threading
 import time
 import urllib.parse
 from xml.etree import ElementTree
@@ -134,7 +138,9 @@ def get_auth(username=None, file_path=None):
     return (username, password)
 
 
-def get_connection(config, site=None, url=None, auth=None, server_cache=None):
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def get_connection(config, site=None, url=None, auth=None, server_cache=None,
+                   stats=None):
     """Create (or retrieve) a connection to an XNAT server
 
     Args:
@@ -152,6 +158,9 @@ def get_connection(config, site=None, url=None, auth=None, server_cache=None):
             open XNAT connections. If given, connections will be retrieved
             from the cache as needed or added if a new URL is requested.
             Defaults to None.
+        stats (:obj:`RequestStats`, optional): A collector to record the
+            connection's requests in. If not given, no statistics are
+            recorded. Defaults to None.
 
     Raises:
         XnatException: If a connection can't be made.
@@ -170,8 +179,11 @@ def get_connection(config, site=None, url=None, auth=None, server_cache=None):
 
     server_url = get_server(url=url)
 
+    session_cache = get_session_cache(config, site=site)
+
     if auth:
-        connection = XNAT(server_url, auth[0], auth[1])
+        connection = XNAT(server_url, auth[0], auth[1],
+                          session_cache=session_cache, stats=stats)
     else:
         try:
             auth_file = config.get_key("XnatCredentials", site=site)
@@ -183,7 +195,8 @@ def get_connection(config, site=None, url=None, auth=None, server_cache=None):
                 # User probably provided metadata file name only
                 auth_file = os.path.join(config.get_path("meta"), auth_file)
         username, password = get_auth(file_path=auth_file)
-        connection = XNAT(server_url, username, password)
+        connection = XNAT(server_url, username, password,
+                          session_cache=session_cache, stats=stats)
 
     if server_cache is not None:
         server_cache[url] = connection
@@ -191,21 +204,447 @@ def get_connection(config, site=None, url=None, auth=None, server_cache=None):
     return connection
 
 
+def get_session_cache(config, site=None):
+    """Get the shared XNAT session cache, if one has been configured.
+
+    Args:
+        config (:obj:`datman.config.config`): A study's configuration.
+        site (:obj:`str`, optional): A site to search for site-specific
+            settings. Defaults to None.
+
+    Returns:
+        :obj:`SessionCache` or None: A session cache using the file named by
+            the 'XnatSessionCache' setting, or None if it's not set.
+    """
+    if config is None:
+        return None
+    try:
+        cache_file = config.get_key("XnatSessionCache", site=site)
+    except UndefinedSetting:
+        return None
+    return SessionCache(cache_file)
+
+
+class SessionCache:
+    """A file of XNAT session IDs that can be shared between processes.
+
+    Session IDs are stored as JSON, keyed by user and server URL. The file
+    is only readable by its owner and is locked while being read or
+    modified so that many jobs can share it safely.
+
+    Args:
+        path (:obj:`str`): The full path to the cache file. It will be
+            created if it doesn't exist.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    @staticmethod
+    def _key(server, username):
+        return f"{username}@{server}"
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Tighten permissions in case the file was made by something else
+        os.fchmod(fd, 0o600)
+        return os.fdopen(fd, "r+", encoding="utf-8")
+
+    @staticmethod
+    def _read(cache_file):
+        cache_file.seek(0)
+        contents = cache_file.read()
+        if not contents:
+            return {}
+        try:
+            return json.loads(contents)
+        except json.JSONDecodeError:
+            logger.warning("Malformed XNAT session cache, ignoring contents.")
+            return {}
+
+    def _update(self, key, value):
+        with self._open() as cache_file:
+            fcntl.flock(cache_file, fcntl.LOCK_EX)
+            sessions = self._read(cache_file)
+            if value is None:
+                sessions.pop(key, None)
+            else:
+                sessions[key] = value
+            cache_file.seek(0)
+            cache_file.truncate()
+            json.dump(sessions, cache_file)
+            cache_file.flush()
+
+    def get(self, server, username):
+        """Get the cached session ID for a user on a server, if any.
+        """
+        try:
+            with self._open() as cache_file:
+                fcntl.flock(cache_file, fcntl.LOCK_SH)
+                sessions = self._read(cache_file)
+        except OSError as e:
+            logger.warning(f"Can't read XNAT session cache {self.path} - {e}")
+            return None
+        return sessions.get(self._key(server, username))
+
+    def set(self, server, username, session_id):
+        """Store a session ID for a user on a server.
+        """
+        try:
+            self._update(self._key(server, username), session_id)
+        except OSError as e:
+            logger.warning(
+                f"Can't update XNAT session cache {self.path} - {e}")
+
+    def remove(self, server, username):
+        """Forget the session ID for a user on a server.
+        """
+        self.set(server, username, None)
+
+    def __repr__(self):
+        return f"<datman.xnat.SessionCache {self.path}>"
+
+
+# Maps URL paths to the logical XNAT endpoint they access. Order matters,
+# the first match is used.
+_ENDPOINTS = [
+    ("session", re.compile(r"/data/JSESSION/?$")),
+    ("import", re.compile(r"/data/services/import/?$")),
+    ("workflow", re.compile(r"/data/workflows/")),
+    ("share", re.compile(r"/(subjects|experiments)/[^/]+/projects/[^/]+$")),
+    ("scan_zip", re.compile(r"/scans/[^/]+/resources/DICOM/files/?$")),
+    ("resource_file", re.compile(r"/resources/[^/]+/files/.+")),
+    ("resource_zip", re.compile(r"/resources/[^/]+/files/?$")),
+    ("resource_catalog", re.compile(r"/resources/[^/]+/?$")),
+    ("resource_list", re.compile(r"/resources/?$")),
+    ("scan_list", re.compile(r"/scans/?$")),
+    ("experiment", re.compile(r"/experiments/[^/]+/?$")),
+    ("experiment_list", re.compile(r"/experiments/?$")),
+    ("subject", re.compile(r"/subjects/[^/]+/?$")),
+    ("subject_list", re.compile(r"/subjects/?$")),
+    ("project", re.compile(r"/projects/[^/]*$")),
+]
+
+
+def get_endpoint(url):
+    """Get the name of the logical XNAT endpoint a URL accesses.
+
+    Args:
+        url (:obj:`str`): A URL on an XNAT server.
+
+    Returns:
+        str: A short name for the endpoint (e.g. 'experiment' or
+            'scan_zip'). 'other' is returned for unrecognized URLs.
+    """
+    path = urllib.parse.urlsplit(url).path
+    for name, regex in _ENDPOINTS:
+        if regex.search(path):
+            return name
+    return "other"
+
+
+class RequestStats:
+    """Collect per-endpoint statistics for requests made to XNAT.
+
+    Requests are grouped by HTTP method and the logical endpoint accessed
+    (see :func:`get_endpoint`). A single instance may be shared by several
+    connections and threads.
+    """
+
+    _fields = ["requests", "errors", "retries", "seconds", "max_seconds",
+               "bytes_received", "bytes_sent"]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.start = time.time()
+
+    def _get_entry(self, method, url):
+        key = (method.upper(), get_endpoint(url))
+        try:
+            return self.endpoints[key]
+        except KeyError:
+            entry = dict.fromkeys(self._fields, 0)
+            entry["status_codes"] = {}
+            self.endpoints[key] = entry
+            return entry
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def record(self, method, url, seconds, status=None, received=0, sent=0):
+        """Record a completed (or failed) request.
+
+        Args:
+            method (:obj:`str`): The HTTP method used.
+            url (:obj:`str`): The URL requested.
+            seconds (float): How long the request took.
+            status (int, optional): The HTTP status code of the response. If
+                None, the request is counted as an error (e.g. a timeout).
+            received (int, optional): Bytes received. Defaults to 0.
+            sent (int, optional): Bytes sent. Defaults to 0.
+        """
+        with self._lock:
+            entry = self._get_entry(method, url)
+            entry["requests"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["bytes_received"] += received
+            entry["bytes_sent"] += sent
+            if status is None or status >= 400:
+                entry["errors"] += 1
+            if status is not None:
+                codes = entry["status_codes"]
+                codes[status] = codes.get(status, 0) + 1
+
+    def record_retry(self, method, url):
+        """Record that a request is being repeated.
+        """
+        with self._lock:
+            self._get_entry(method, url)["retries"] += 1
+
+    def record_transfer(self, method, url, received, seconds):
+        """Record bytes streamed (and time spent) after a response arrived.
+        """
+        with self._lock:
+            entry = self._get_entry(method, url)
+            entry["bytes_received"] += received
+            entry["seconds"] += seconds
+
+    def totals(self):
+        """Get the totals of each statistic across all endpoints.
+        """
+        with self._lock:
+            totals = dict.fromkeys(self._fields, 0)
+            for entry in self.endpoints.values():
+                for field in self._fields:
+                    if field == "max_seconds":
+                        totals[field] = max(totals[field], entry[field])
+                    else:
+                        totals[field] += entry[field]
+        return totals
+
+    def as_dict(self):
+        """Get all statistics in a JSON serializable format.
+        """
+        with self._lock:
+            endpoints = [
+                {"method": method, "endpoint": endpoint, **entry}
+                for (method, endpoint), entry in sorted(
+                    self.endpoints.items())
+            ]
+        return {
+            "elapsed": time.time() - self.start,
+            "totals": self.totals(),
+            "endpoints": endpoints
+        }
+
+    def summary(self):
+        """Get a one line, human readable summary of all requests.
+        """
+        totals = self.totals()
+        parts = [
+            f"{totals['requests']} XNAT requests in "
+            f"{totals['seconds']:.1f}s ({totals['retries']} retries, "
+            f"{totals['errors']} errors, "
+            f"{totals['bytes_received'] / 1e6:.1f}MB received, "
+            f"{totals['bytes_sent'] / 1e6:.1f}MB sent)"
+        ]
+        for item in self.as_dict()["endpoints"]:
+            mean = item["seconds"] / item["requests"] if item["requests"] \
+                else 0
+            parts.append(
+                f"{item['method']} {item['endpoint']}: "
+                f"n={item['requests']} mean={mean:.3f}s "
+                f"max={item['max_seconds']:.3f}s retries={item['retries']} "
+                f"errors={item['errors']} "
+                f"bytes={item['bytes_received'] + item['bytes_sent']}"
+            )
+        return "; ".join(parts)
+
+    def to_prometheus(self):
+        """Format all statistics in the Prometheus text exposition format.
+        """
+        metrics = [
+            ("requests", "requests_total", "counter",
+             "Requests sent to XNAT."),
+            ("errors", "errors_total", "counter",
+             "Requests that failed or returned an error status."),
+            ("retries", "retries_total", "counter",
+             "Requests that were repeated."),
+            ("seconds", "request_seconds_total", "counter",
+             "Total time spent on requests."),
+            ("max_seconds", "request_seconds_max", "gauge",
+             "Slowest single request."),
+            ("bytes_received", "received_bytes_total", "counter",
+             "Bytes received from XNAT."),
+            ("bytes_sent", "sent_bytes_total", "counter",
+             "Bytes sent to XNAT."),
+        ]
+        endpoints = self.as_dict()["endpoints"]
+        lines = []
+        for field, name, kind, description in metrics:
+            lines.append(f"# HELP datman_xnat_{name} {description}")
+            lines.append(f"# TYPE datman_xnat_{name} {kind}")
+            for item in endpoints:
+                lines.append(
+                    f'datman_xnat_{name}{{method="{item["method"]}",'
+                    f'endpoint="{item["endpoint"]}"}} {item[field]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, output):
+        """Write all statistics to a file.
+
+        Args:
+            output (:obj:`str`): The path of the file to write. If it ends
+                with '.prom' or '.txt' the Prometheus text format is used,
+                otherwise the statistics are written as JSON.
+        """
+        if output.endswith((".prom", ".txt")):
+            contents = self.to_prometheus()
+        else:
+            contents = json.dumps(self.as_dict(), indent=4)
+        with open(output, "w", encoding="utf-8") as fh:
+            fh.write(contents)
+
+    def __repr__(self):
+        return f"<datman.xnat.RequestStats {len(self.endpoints)} endpoints>"
+
+
+class ConcurrencyLimiter:
+    """Adaptively limit the number of requests in flight to an XNAT server.
+
+    The limit follows an additive-increase / multiplicative-decrease (AIMD)
+    scheme. Each request that finishes within ``latency_target`` seconds
+    raises the limit by ``1 / limit`` (i.e. by about one per round of
+    requests), while a timeout or a 503/504 response cuts it by
+    ``backoff``. Only one cut is made for a burst of failures, requests that
+    started before the most recent cut don't cut it again.
+
+    A limiter may be shared by any number of threads. Separate processes
+    each adapt their own limit.
+
+    Args:
+        initial (int, optional): The starting limit. Defaults to 4.
+        minimum (int, optional): The lowest the limit may drop to. Defaults
+            to 1.
+        maximum (int, optional): The highest the limit may grow to.
+            Defaults to 32.
+        backoff (float, optional): The factor to multiply the limit by when
+            the server is overloaded. Defaults to 0.5.
+        latency_target (float, optional): The longest a request may take,
+            in seconds, and still be considered healthy. Defaults to 10.
+        max_delay (float, optional): The longest to wait, in seconds, before
+            retrying an overloaded request. Defaults to 30.
+    """
+
+    overload_codes = (503, 504)
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(self, initial=4, minimum=1, maximum=32, backoff=0.5,
+                 latency_target=10.0, max_delay=30.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.max_delay = max_delay
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._overloads = 0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free request slot.
+
+        Returns:
+            float: The (monotonic) time the slot was acquired. This must be
+                passed to :meth:`release` once the request completes.
+        """
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, overloaded=False):
+        """Free a request slot and adjust the limit.
+
+        Args:
+            started (float): The value returned by :meth:`acquire`.
+            overloaded (bool, optional): Whether the request indicated that
+                the server is overloaded. Defaults to False.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self._overloads += 1
+                if started >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = now
+                    logger.debug("XNAT appears overloaded, reducing "
+                                 f"concurrency limit to {int(self.limit)}")
+            else:
+                self._overloads = 0
+                if now - started <= self.latency_target:
+                    self.limit = min(self.maximum,
+                                     self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def retry_delay(self):
+        """Get the number of seconds to wait before retrying after overload.
+
+        The delay starts at one second and doubles for each consecutive
+        overloaded response, up to ``max_delay``.
+        """
+        with self._cond:
+            exponent = max(self._overloads - 1, 0)
+        return min(self.max_delay, 2 ** exponent)
+
+    def __repr__(self):
+        return (f"<datman.xnat.ConcurrencyLimiter limit={int(self.limit)} "
+                f"in_flight={self.in_flight}>")
+
+
+def _body_size(data):
+    """Find the size (in bytes) of a request body.
+    """
+    if data is None:
+        return 0
+    if isinstance(data, (bytes, str)):
+        return len(data)
+    try:
+        return os.fstat(data.fileno()).st_size
+    except (AttributeError, OSError):
+        return 0
+
+
 # pylint: disable-next=too-many-public-methods
 class XNAT:
     """Manage a connection to an XNAT server.
+
+    Every request passes through a :obj:`ConcurrencyLimiter`, so a single
+    connection may be safely shared by several threads. The limiter only
+    covers the wait for a response, streamed content is read outside of it.
     """
 
     server = None
     auth = None
     headers = None
     session = None
+    session_cache = None
+    stats = None
+    limiter = None
 
-    def __init__(self, server, username, password):
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(self, server, username, password, session_cache=None,
+                 stats=None, limiter=None):
         if server.endswith("/"):
             server = server[:-1]
         self.server = server
         self.auth = (username, password)
+        self.session_cache = session_cache
+        self.stats = stats
+        self.limiter = limiter or ConcurrencyLimiter()
         try:
             self.open_session()
         except Exception as e:
@@ -217,18 +656,27 @@ class XNAT:
         return self
 
     def __exit__(self, *args):
+        if self.session_cache:
+            # Other processes may still be using this session
+            return
         # Ends the session on the server side
         url = f"{self.server}/data/JSESSION"
-        self.session.delete(url)
+        self._request("DELETE", url)
 
     def open_session(self):
-        """Open a session with the XNAT server."""
+        """Open a session with the XNAT server.
+
+        If a session cache is in use, a still valid session from the cache
+        will be reused instead of logging in again.
+        """
+        if self.session_cache and self._reuse_cached_session():
+            return
 
         url = f"{self.server}/data/JSESSION"
 
         s = requests.Session()
 
-        response = s.post(url, auth=self.auth)
+        response = self._request("POST", url, session=s, auth=self.auth)
 
         if response.status_code != 200:
             logger.warning(f"Failed connecting to xnat server {self.server} "
@@ -249,6 +697,48 @@ class XNAT:
         # out other session info
         self.session = s
 
+        if self.session_cache:
+            session_id = s.cookies.get("JSESSIONID") or response.text.strip()
+            self.session_cache.set(self.server, self.auth[0], session_id)
+
+    def _reuse_cached_session(self):
+        """Try to resume a session from the session cache.
+
+        Returns:
+            bool: True if a valid cached session is now in use.
+        """
+        session_id = self.session_cache.get(self.server, self.auth[0])
+        if not session_id:
+            return False
+
+        if self.session and \
+                self.session.cookies.get("JSESSIONID") == session_id:
+            # This is the session that just failed, so it can't be reused
+            self.session_cache.remove(self.server, self.auth[0])
+            return False
+
+        s = requests.Session()
+        s.cookies.set("JSESSIONID", session_id)
+
+        # A valid session echoes its own ID back, an expired one results in
+        # a 401 or a brand new (anonymous) session ID.
+        try:
+            response = self._request("GET", f"{self.server}/data/JSESSION",
+                                     session=s, timeout=30)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"Failed to validate cached XNAT session - {e}")
+            return False
+
+        if response.status_code != 200 or \
+                response.text.strip() != session_id:
+            logger.debug(f"Cached session for {self.server} has expired")
+            self.session_cache.remove(self.server, self.auth[0])
+            return False
+
+        logger.debug(f"Reusing cached session for {self.server}")
+        self.session = s
+        return True
+
     def get_projects(self, project=""):
         """Query the XNAT server for project metadata.
 
@@ -715,6 +1205,7 @@ class XNAT:
         except requests.exceptions.Timeout as e:
             if retries == 1:
                 raise e
+            self._record_retry("POST", upload_url)
             self.put_dicoms(project, subject, experiment, filename,
                             retries=retries-1, timeout=timeout+1200)
         except XnatException as e:
@@ -1094,14 +1585,61 @@ class XNAT:
                            "?wrk:workflowData/status=Complete")
             self._make_xnat_put(dismiss_url)
 
+    def _request(self, method, url, session=None, **kwargs):
+        """Send a request to XNAT, respecting the concurrency limit.
+
+        Statistics are also recorded for the request, if enabled.
+
+        Args:
+            method (:obj:`str`): The HTTP method to use.
+            url (:obj:`str`): The URL to send the request to.
+            session (:obj:`requests.Session`, optional): The session to send
+                the request with. Defaults to the connection's open session.
+            **kwargs: Any other arguments accepted by
+                :meth:`requests.Session.request`.
+
+        Returns:
+            :obj:`requests.Response`: The server's response.
+        """
+        if session is None:
+            session = self.session
+
+        overloaded = False
+        started = self.limiter.acquire()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            overloaded = isinstance(e, requests.exceptions.Timeout)
+            if self.stats is not None:
+                self.stats.record(method, url, time.monotonic() - started)
+            raise
+        else:
+            overloaded = (
+                response.status_code in self.limiter.overload_codes)
+        finally:
+            self.limiter.release(started, overloaded=overloaded)
+
+        if self.stats is not None:
+            # Streamed content is counted as it's read
+            received = 0 if kwargs.get("stream") else len(response.content)
+            self.stats.record(method, url, time.monotonic() - started,
+                              status=response.status_code, received=received,
+                              sent=_body_size(kwargs.get("data")))
+        return response
+
+    def _record_retry(self, method, url):
+        if self.stats is not None:
+            self.stats.record_retry(method, url)
+
     def get_xnat_stream(self, url, filename, retries=3, timeout=300):
         """Get large objects from XNAT in a stream.
         """
         logger.debug(f"Getting {url} from XNAT")
         try:
-            response = self.session.get(url, stream=True, timeout=timeout)
+            response = self._request("GET", url, stream=True, timeout=timeout)
         except requests.exceptions.Timeout as e:
             if retries > 0:
+                self._record_retry("GET", url)
                 return self.get_xnat_stream(url,
                                             filename,
                                             retries=retries - 1,
@@ -1111,6 +1649,7 @@ class XNAT:
         if response.status_code == 401:
             logger.info("Session may have expired, resetting")
             self.open_session()
+            self._record_retry("GET", url)
             return self.get_xnat_stream(
                     url, filename, retries=retries, timeout=timeout)
 
@@ -1122,7 +1661,8 @@ class XNAT:
         if response.status_code == 504:
             if retries:
                 logger.warning("xnat server timed out, retrying")
-                time.sleep(30)
+                time.sleep(self.limiter.retry_delay())
+                self._record_retry("GET", url)
                 self.get_xnat_stream(url,
                                      filename,
                                      retries=retries - 1,
@@ -1134,23 +1674,31 @@ class XNAT:
             logger.error(f"xnat error: {response.status_code} at data upload")
             response.raise_for_status()
 
+        received = 0
+        start = time.perf_counter()
         with open(filename, "wb") as f:
             try:
                 for chunk in response.iter_content(1024):
                     f.write(chunk)
+                    received += len(chunk)
             except requests.exceptions.RequestException as e:
                 logger.error("Failed reading from xnat")
                 raise e
             except IOError as e:
                 logger.error("Failed writing to file")
                 raise e
+            finally:
+                if self.stats is not None:
+                    self.stats.record_transfer(
+                        "GET", url, received, time.perf_counter() - start)
         return None
 
     def _make_xnat_query(self, url, retries=3, timeout=150):
         try:
-            response = self.session.get(url, timeout=timeout)
+            response = self._request("GET", url, timeout=timeout)
         except requests.exceptions.Timeout as e:
             if retries > 0:
+                self._record_retry("GET", url)
                 return self._make_xnat_query(
                     url, retries=retries - 1, timeout=timeout * 2
                 )
@@ -1161,7 +1709,8 @@ class XNAT:
             # possibly the session has timed out
             logger.info("Session may have expired, resetting")
             self.open_session()
-            response = self.session.get(url, timeout=timeout)
+            self._record_retry("GET", url)
+            response = self._request("GET", url, timeout=timeout)
 
         if response.status_code == 404:
             logger.info(
@@ -1178,9 +1727,10 @@ class XNAT:
 
     def _make_xnat_xml_query(self, url, retries=3):
         try:
-            response = self.session.get(url)
+            response = self._request("GET", url)
         except requests.exceptions.Timeout as e:
             if retries > 0:
+                self._record_retry("GET", url)
                 return self._make_xnat_xml_query(url, retries=retries - 1)
             raise e
 
@@ -1188,7 +1738,8 @@ class XNAT:
             # possibly the session has timed out
             logger.info("Session may have expired, resetting")
             self.open_session()
-            response = self.session.get(url)
+            self._record_retry("GET", url)
+            response = self._request("GET", url)
 
         if response.status_code == 404:
             logger.info(f"No records returned from xnat server to query {url}")
@@ -1210,15 +1761,17 @@ class XNAT:
             )
 
         try:
-            response = self.session.put(url, timeout=30)
+            response = self._request("PUT", url, timeout=30)
         except requests.exceptions.Timeout:
+            self._record_retry("PUT", url)
             return self._make_xnat_put(url, retries=retries - 1)
 
         if response.status_code == 401:
             # possibly the session has timed out
             logger.info("Session may have expired, resetting")
             self.open_session()
-            response = self.session.put(url, timeout=30)
+            self._record_retry("PUT", url)
+            response = self._request("PUT", url, timeout=30)
 
         if response.status_code not in [200, 201]:
             logger.warning(
@@ -1231,10 +1784,10 @@ class XNAT:
         """Add data to XNAT.
         """
         logger.debug(f"POSTing data to xnat, {retries} retries left")
-        response = self.session.post(url,
-                                     headers=headers,
-                                     data=data,
-                                     timeout=timeout)
+        response = self._request("POST", url,
+                                 headers=headers,
+                                 data=data,
+                                 timeout=timeout)
 
         reply = str(response.content)
 
@@ -1242,12 +1795,14 @@ class XNAT:
             # possibly the session has timed out
             logger.info("Session may have expired, resetting")
             self.open_session()
-            response = self.session.post(url, headers=headers, data=data)
+            self._record_retry("POST", url)
+            response = self._request("POST", url, headers=headers, data=data)
 
         if response.status_code == 504:
             if retries:
                 logger.warning("xnat server timed out, retrying")
-                time.sleep(30)
+                time.sleep(self.limiter.retry_delay())
+                self._record_retry("POST", url)
                 self.make_xnat_post(url, data, retries=retries - 1)
             else:
                 logger.warning("xnat server timed out, giving up")
@@ -1269,15 +1824,17 @@ class XNAT:
 
     def _make_xnat_delete(self, url, retries=3):
         try:
-            response = self.session.delete(url, timeout=30)
+            response = self._request("DELETE", url, timeout=30)
         except requests.exceptions.Timeout:
+            self._record_retry("DELETE", url)
             return self._make_xnat_delete(url, retries=retries - 1)
 
         if response.status_code == 401:
             # possibly the session has timed out
             logger.info("Session may have expired, resetting")
             self.open_session()
-            response = self.session.delete(url, timeout=30)
+            self._record_retry("DELETE", url)
+            response = self._request("DELETE", url, timeout=30)
 
         if response.status_code not in [200, 201]:
             logger.warning(
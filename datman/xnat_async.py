@@ -0,0 +1,377 @@
+"""Module to run many concurrent metadata queries against an XNAT server.
+
+This provides :obj:`AsyncXNAT`, an asyncio counterpart to the query methods
+of :obj:`datman.xnat.XNAT`, and :func:`run_queries`, which lets synchronous
+scripts fan out a batch of queries without managing an event loop.
+
+Requires the optional dependency 'aiohttp' (``pip install datman[async]``).
+"""
+
+import asyncio
+import base64
+import logging
+
+from datman.exceptions import XnatException, InputException
+from datman.importers import XNATExperiment
+
+try:
+    import aiohttp
+except ImportError:
+    AIOHTTP_FOUND = False
+else:
+    AIOHTTP_FOUND = True
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncXNAT:
+    """Manage an asynchronous connection to an XNAT server.
+
+    At most ``max_requests`` requests will be in flight at once, no matter
+    how many queries are awaited concurrently. Must be used as an async
+    context manager, which opens and closes the underlying session.
+
+    Args:
+        server (:obj:`str`): The full URL of the XNAT server.
+        username (:obj:`str`): The user to log in as.
+        password (:obj:`str`): The user's password.
+        max_requests (int, optional): The maximum number of requests to
+            have in flight at once. Defaults to 20.
+        session_id (:obj:`str`, optional): The JSESSIONID of an existing
+            session to reuse instead of logging in. Defaults to None.
+        session_cache (:obj:`datman.xnat.SessionCache`, optional): A cache
+            of sessions shared between processes. If given, a cached
+            session will be reused and new sessions will be added to it.
+            Defaults to None.
+    """
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(self, server, username, password, max_requests=20,
+                 session_id=None, session_cache=None):
+        if not AIOHTTP_FOUND:
+            raise XnatException(
+                "aiohttp is not installed. It's required to use AsyncXNAT.")
+        if server.endswith("/"):
+            server = server[:-1]
+        self.server = server
+        self.auth = (username, password)
+        self.max_requests = max_requests
+        self.session_cache = session_cache
+        self.session = None
+        self._session_id = session_id
+        self._semaphore = None
+        self._login_lock = None
+
+    async def __aenter__(self):
+        await self.open_session()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def open_session(self):
+        """Open a session with the XNAT server.
+        """
+        self._semaphore = asyncio.Semaphore(self.max_requests)
+        self._login_lock = asyncio.Lock()
+        # 'unsafe' allows cookies for servers given as an IP address
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_requests),
+            cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+        if not self._session_id and self.session_cache:
+            self._session_id = self.session_cache.get(
+                self.server, self.auth[0])
+
+        if self._session_id:
+            self._use_session_id(self._session_id)
+            return
+
+        try:
+            await self._login()
+        except Exception as e:
+            await self.close()
+            raise XnatException(
+                f"Failed to open session with server {self.server}. "
+                f"Reason - {e}") from e
+
+    async def close(self):
+        """Close the connection.
+
+        The session is left open on the server side, as it may be shared.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _use_session_id(self, session_id):
+        self.session.cookie_jar.update_cookies({"JSESSIONID": session_id})
+
+    async def _login(self):
+        url = f"{self.server}/data/JSESSION"
+        credentials = base64.b64encode(
+            ":".join(self.auth).encode("utf-8")).decode("ascii")
+        headers = {"Authorization": f"Basic {credentials}"}
+        async with self.session.post(url, headers=headers) as response:
+            text = await response.text()
+            if response.status != 200:
+                logger.warning(
+                    f"Failed connecting to xnat server {self.server} "
+                    f"with response code {response.status}")
+                response.raise_for_status()
+
+        # See datman.xnat.XNAT.open_session
+        if '<html' in text:
+            raise XnatException(
+                f"Password for user {self.auth[0]} on server {self.server} "
+                "has expired. Please update it."
+            )
+
+        self._session_id = text.strip()
+        self._use_session_id(self._session_id)
+        if self.session_cache:
+            self.session_cache.set(self.server, self.auth[0],
+                                   self._session_id)
+
+    async def _refresh_session(self, expired_id):
+        # Many queries may find the session expired at once, only the first
+        # needs to log in again.
+        async with self._login_lock:
+            if self._session_id == expired_id:
+                logger.info("Session may have expired, resetting")
+                await self._login()
+
+    async def get_projects(self, project=""):
+        """Query the XNAT server for project metadata.
+
+        See :meth:`datman.xnat.XNAT.get_projects`.
+        """
+        url = f"{self.server}/data/archive/projects/{project}?format=json"
+
+        try:
+            result = await self._make_xnat_query(url)
+        except Exception as e:
+            raise XnatException(
+                f"Failed getting projects from server with search URL {url}"
+                ) from e
+
+        if not result:
+            logger.debug(f"No projects found on server {self.server}")
+            return []
+
+        if not project:
+            return result["ResultSet"]["Result"]
+
+        return result["items"]
+
+    async def get_subject_ids(self, project):
+        """Retrieve the IDs for all subjects within an XNAT project.
+
+        See :meth:`datman.xnat.XNAT.get_subject_ids`.
+        """
+        if not await self.get_projects(project):
+            raise XnatException(f"Invalid XNAT project: {project}")
+
+        url = f"{self.server}/data/archive/projects/{project}/subjects/"
+
+        try:
+            result = await self._make_xnat_query(url)
+        except Exception as e:
+            raise XnatException(f"Failed getting xnat subjects with URL {url}"
+                                ) from e
+
+        if not result:
+            return []
+
+        try:
+            subids = [item["label"] for item in result["ResultSet"]["Result"]]
+        except KeyError as e:
+            raise XnatException(f"get_subject_ids - Malformed response. {e}"
+                                ) from None
+
+        return subids
+
+    async def get_experiment_ids(self, project, subject=""):
+        """Retrieve all experiment IDs belonging to an XNAT subject.
+
+        See :meth:`datman.xnat.XNAT.get_experiment_ids`.
+        """
+        if subject:
+            subject = f"subjects/{subject}/"
+
+        url = (f"{self.server}/data/projects/{project}/{subject}"
+               "experiments/?format=json")
+
+        try:
+            result = await self._make_xnat_query(url)
+        except Exception as e:
+            raise XnatException(
+                f"Failed getting experiment IDs for subject {subject}"
+                f" with URL {url}") from e
+
+        if not result:
+            return []
+
+        return [item.get("label") for item in result["ResultSet"]["Result"]]
+
+    async def get_experiment(self, project, subject_id=None, exper_id=None,
+                             ident=None):
+        """Get an experiment from the XNAT server.
+
+        See :meth:`datman.xnat.XNAT.get_experiment`. Unlike the synchronous
+        version, missing experiments are never created.
+        """
+        if not (subject_id and exper_id):
+            if not ident:
+                raise InputException(
+                    "Must be given either 1) subject ID and "
+                    "experiment ID or 2) A datman.scanid.Identifier")
+            subject_id = ident.get_xnat_subject_id()
+            exper_id = ident.get_xnat_experiment_id()
+
+        url = (f"{self.server}/data/archive/projects/{project}/subjects/"
+               f"{subject_id}/experiments/{exper_id}?format=json")
+
+        try:
+            result = await self._make_xnat_query(url)
+        except Exception as e:
+            raise XnatException(f"Failed getting experiment with URL {url}"
+                                ) from e
+
+        if not result:
+            raise XnatException(
+                f"Experiment {exper_id} does not exist for subject "
+                f"{subject_id} in project {project}")
+
+        try:
+            exper_json = result["items"][0]
+        except (IndexError, KeyError) as e:
+            raise XnatException(
+                f"Could not access metadata for experiment {exper_id}") from e
+
+        return XNATExperiment(project, subject_id, exper_json, ident=ident)
+
+    async def get_scan_ids(self, project, subject, experiment):
+        """Retrieve all scan IDs for an XNAT experiment.
+
+        See :meth:`datman.xnat.XNAT.get_scan_ids`.
+        """
+        url = (
+            f"{self.server}/data/archive/projects/{project}/subjects/"
+            f"{subject}/experiments/{experiment}/scans/?format=json")
+
+        try:
+            result = await self._make_xnat_query(url)
+        except Exception as e:
+            raise XnatException(
+                f"Failed getting scan IDs for experiment {experiment} with "
+                f"URL {url}") from e
+
+        if not result:
+            return []
+
+        try:
+            scan_ids = [
+                item.get("ID") for item in result["ResultSet"]["Result"]
+            ]
+        except KeyError as e:
+            raise XnatException(f"get_scan_ids - Malformed response. {e}"
+                                ) from None
+
+        return scan_ids
+
+    async def _make_xnat_query(self, url, retries=3, timeout=150):
+        if self.session is None:
+            raise XnatException("Session not open. Use 'async with'.")
+
+        try:
+            async with self._semaphore:
+                session_id = self._session_id
+                status, result = await self._get_json(url, timeout)
+                if status == 401:
+                    # possibly the session has timed out
+                    await self._refresh_session(session_id)
+                    status, result = await self._get_json(url, timeout)
+        except asyncio.TimeoutError:
+            if retries > 0:
+                return await self._make_xnat_query(
+                    url, retries=retries - 1, timeout=timeout * 2)
+            logger.error(f"Xnat server timed out getting url {url}")
+            raise
+
+        if status == 404:
+            logger.info(
+                f"No records returned from xnat server for query: {url}")
+            return None
+
+        if status != 200:
+            logger.error(f"Failed connecting to xnat server {self.server} "
+                         f"with response code {status}")
+            raise XnatException(f"Query {url} failed with status {status}")
+
+        return result
+
+    async def _get_json(self, url, timeout):
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with self.session.get(url, timeout=client_timeout) as response:
+            if response.status != 200:
+                return response.status, None
+            return response.status, await response.json(content_type=None)
+
+    def __str__(self):
+        return f"<datman.xnat_async.AsyncXNAT {self.server}>"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def run_queries(xnat, method, arg_list, max_requests=20,
+                return_exceptions=False):
+    """Run many XNAT queries concurrently from synchronous code.
+
+    This reuses the session of an existing connection, so no extra login
+    is needed.
+
+    Args:
+        xnat (:obj:`datman.xnat.XNAT`): An open XNAT connection.
+        method (:obj:`str`): The name of the :obj:`AsyncXNAT` query method to
+            call (e.g. 'get_experiment_ids').
+        arg_list (list): The arguments for each call. Each entry may be a
+            tuple of positional arguments, a dictionary of keyword arguments
+            or a single argument.
+        max_requests (int, optional): The maximum number of requests to
+            have in flight at once. Defaults to 20.
+        return_exceptions (bool, optional): Whether to return any
+            exceptions raised by a query in place of its result, instead of
+            raising the first one encountered. Defaults to False.
+
+    Returns:
+        list: The result of each call, in the same order as arg_list.
+
+    Example:
+        >>> run_queries(xnat, "get_experiment_ids", ["STUDY1", "STUDY2"])
+        [['STUDY1_CMH_0001_01_SE01_MR'], ['STUDY2_CMH_0001_01_SE01_MR']]
+    """
+    if not hasattr(AsyncXNAT, method) or method.startswith("_"):
+        raise InputException(f"Unrecognized AsyncXNAT query '{method}'")
+
+    session_id = xnat.session.cookies.get("JSESSIONID")
+
+    async def _run():
+        async with AsyncXNAT(xnat.server, *xnat.auth,
+                             max_requests=max_requests,
+                             session_id=session_id,
+                             session_cache=xnat.session_cache) as conn:
+            query = getattr(conn, method)
+            calls = []
+            for args in arg_list:
+                if isinstance(args, dict):
+                    calls.append(query(**args))
+                elif isinstance(args, tuple):
+                    calls.append(query(*args))
+                else:
+                    calls.append(query(args))
+            return await asyncio.gather(
+                *calls, return_exceptions=return_exceptions)
+
+    return asyncio.run(_run())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Compare rewriting a zip by extracting it against copying raw members.
+
+A synthetic session zip is rewritten without its niftis twice: once by
+extracting the members to keep and re-zipping them with
+datman.utils.make_zip, as dm_xnat_upload.py used to, and once with
+datman.utils.copy_zip_members.
+
+Usage:
+    python tests/benchmarks/bench_copy_zip.py [options]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+import datman.utils  # noqa: E402
+from synthetic_data import make_session_zip  # noqa: E402
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--series", type=int, default=20,
+        help="Number of series in the archive. Default: %(default)s")
+    parser.add_argument(
+        "--files-per-series", type=int, default=100,
+        help="Dicoms in each series. Default: %(default)s")
+    parser.add_argument(
+        "--pixel-kb", type=int, default=128,
+        help="Kilobytes of pixel data per dicom. Default: %(default)s")
+    return parser.parse_args()
+
+
+def extract_and_rezip(archive, members, dest, tmp_dir):
+    extract_dir = os.path.join(tmp_dir, "extracted")
+    with zipfile.ZipFile(archive) as zf:
+        for item in members:
+            zf.extract(item, extract_dir)
+    datman.utils.make_zip(extract_dir, dest)
+
+
+def copy_members(archive, members, dest, tmp_dir):
+    datman.utils.copy_zip_members(archive, dest, members)
+
+
+def time_it(func, archive, members, tmp_dir):
+    dest = os.path.join(tmp_dir, f"{func.__name__}.zip")
+    start = time.perf_counter()
+    func(archive, members, dest, tmp_dir)
+    return time.perf_counter() - start
+
+
+def main():
+    args = read_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = os.path.join(tmp_dir, "session.zip")
+        make_session_zip(
+            archive, "SESSION",
+            series=[f"SERIES{num}" for num in range(args.series)],
+            files_per_series=args.files_per_series,
+            pixel_bytes=args.pixel_kb * 1024,
+            niftis=["DTI.nii.gz", "T1.nii.gz"])
+        with zipfile.ZipFile(archive) as zf:
+            members = [name for name in zf.namelist()
+                       if not name.endswith(".nii.gz")]
+        size = os.path.getsize(archive) / 1024 ** 2
+        print(f"{len(members)} members ({size:.1f} MB zipped)")
+
+        for func in (extract_and_rezip, copy_members):
+            elapsed = time_it(func, archive, members, tmp_dir)
+            print(f"{func.__name__:<18} {elapsed:>8.2f} s "
+                  f"{size / elapsed:>8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
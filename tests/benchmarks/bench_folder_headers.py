@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""Compare reading dicom headers from a large folder tree.
+
+A synthetic session folder (50 series x 1000 dicoms by default) is scanned
+for one header per series and for every header with the os.listdir based
+scan datman used to do, and with datman.utils.get_folder_headers and
+datman.utils.get_all_headers_in_folder, both sequentially and with a thread
+pool. --read-latency adds a delay to every header read to imitate a network
+file system, which is where the thread pool pays off.
+
+Usage:
+    python tests/benchmarks/bench_folder_headers.py [options]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+import datman.utils  # noqa: E402
+from synthetic_data import make_series  # noqa: E402
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--series", type=int, default=50,
+        help="Number of series folders. Default: %(default)s")
+    parser.add_argument(
+        "--files-per-series", type=int, default=1000,
+        help="Dicoms in each series. Default: %(default)s")
+    parser.add_argument(
+        "--workers", type=int, default=8,
+        help="Threads for the parallel scan. Default: %(default)s")
+    parser.add_argument(
+        "--read-latency", type=float, default=0,
+        help="Seconds added to every header read. Default: %(default)s")
+    return parser.parse_args()
+
+
+def legacy_folder_headers(path):
+    """One header per folder, found with os.listdir and os.path.isdir.
+    """
+    manifest = {}
+    for item in os.listdir(path):
+        subdir = os.path.join(path, item)
+        if not os.path.isdir(subdir):
+            continue
+        for name in sorted(os.listdir(subdir)):
+            filepath = os.path.join(subdir, name)
+            if os.path.isdir(filepath):
+                continue
+            try:
+                manifest[subdir] = datman.utils.dcm.read_file(filepath)
+                break
+            except datman.utils.dcm.filereader.InvalidDicomError:
+                pass
+    return manifest
+
+
+def legacy_all_headers(path):
+    """Every header below path, read one file at a time.
+    """
+    manifest = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            filepath = os.path.join(root, name)
+            try:
+                manifest[filepath] = datman.utils.dcm.read_file(filepath)
+            except datman.utils.dcm.filereader.InvalidDicomError:
+                pass
+    return manifest
+
+
+def make_tree(root, num_series, num_files):
+    for num in range(1, num_series + 1):
+        series = os.path.join(root, f"{num}-SERIES{num}")
+        os.makedirs(series)
+        contents = make_series("1.2.3", num, f"SERIES{num}", num_files)
+        for idx, data in enumerate(contents):
+            with open(os.path.join(series, f"{idx:05d}.dcm"), "wb") as fh:
+                fh.write(data)
+
+
+def slow_reader(latency):
+    read_file = datman.utils.dcm.read_file
+
+    def read(*args, **kwargs):
+        time.sleep(latency)
+        return read_file(*args, **kwargs)
+    return read
+
+
+def time_it(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    found = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:>8.2f} s {len(found):>8} headers")
+    return found
+
+
+def main():
+    args = read_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        make_tree(tmp_dir, args.series, args.files_per_series)
+        print(f"{args.series} series x {args.files_per_series} dicoms, "
+              f"{args.read_latency * 1000:.1f} ms per read")
+
+        with mock.patch.object(datman.utils.dcm, "read_file",
+                               slow_reader(args.read_latency)):
+            old = time_it("legacy folder headers", legacy_folder_headers,
+                          tmp_dir)
+            new = time_it("get_folder_headers",
+                          datman.utils.get_folder_headers, tmp_dir)
+            time_it(f"  workers={args.workers}",
+                    datman.utils.get_folder_headers, tmp_dir,
+                    workers=args.workers)
+            assert sorted(old) == sorted(new)
+
+            old = time_it("legacy all headers", legacy_all_headers, tmp_dir)
+            new = time_it("get_all_headers_in_folder",
+                          datman.utils.get_all_headers_in_folder, tmp_dir,
+                          recurse=True)
+            time_it(f"  workers={args.workers}",
+                    datman.utils.get_all_headers_in_folder, tmp_dir,
+                    recurse=True, workers=args.workers)
+            assert sorted(old) == sorted(new)
+
+
+if __name__ == "__main__":
+    main()
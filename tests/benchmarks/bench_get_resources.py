@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Measure how long datman.utils.get_resources takes on a large archive.
+
+A synthetic session zip of extensionless dicoms (plus a few resources) is
+searched for resources twice: once by fully reading and parsing every member,
+as datman used to, and once with datman.utils.get_resources.
+
+Usage:
+    python tests/benchmarks/bench_get_resources.py [options]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+import pydicom
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+import datman.utils  # noqa: E402
+from synthetic_data import make_session_zip  # noqa: E402
+
+RESOURCES = {"behav/task.log": b"x" * 4096, "physio/resp.1D": b"0\n" * 2048}
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--members", type=int, default=10000,
+        help="Number of dicoms in the archive. Default: %(default)s")
+    parser.add_argument(
+        "--series", type=int, default=50,
+        help="Number of series to split them between. Default: %(default)s")
+    parser.add_argument(
+        "--pixel-kb", type=int, default=32,
+        help="Kilobytes of pixel data per dicom. Default: %(default)s")
+    return parser.parse_args()
+
+
+def full_parse_resources(open_zipfile):
+    """Find resources by decompressing and parsing every member.
+    """
+    resources = []
+    for name in open_zipfile.namelist():
+        if name.endswith("/") or datman.utils.is_named_like_a_dicom(name):
+            continue
+        try:
+            pydicom.dcmread(io.BytesIO(open_zipfile.read(name)))
+        except Exception:
+            resources.append(name)
+    return resources
+
+
+def time_it(func, archive):
+    start = time.perf_counter()
+    with zipfile.ZipFile(archive) as zf:
+        found = func(zf)
+    return time.perf_counter() - start, found
+
+
+def main():
+    args = read_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = os.path.join(tmp_dir, "session.zip")
+        series = [f"SERIES{num}" for num in range(args.series)]
+        make_session_zip(archive, "SESSION", series=series,
+                         files_per_series=args.members // args.series,
+                         pixel_bytes=args.pixel_kb * 1024,
+                         resources=RESOURCES, dcm_ext="")
+        size = os.path.getsize(archive) / 1024 ** 2
+        print(f"{args.members} extensionless dicoms x {args.pixel_kb} KB "
+              f"({size:.1f} MB zipped)")
+
+        full_time, full_found = time_it(full_parse_resources, archive)
+        sniff_time, sniff_found = time_it(datman.utils.get_resources,
+                                          archive)
+
+    assert sorted(full_found) == sorted(sniff_found)
+    print(f"{'full parse':<12} {full_time:>8.2f} s")
+    print(f"{'sniffing':<12} {sniff_time:>8.2f} s "
+          f"({full_time / sniff_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Compare the datman.utils.make_zip compression settings.
+
+A folder of synthetic dicoms is zipped with each setting, and the time taken
+and size of the resulting zip are reported.
+
+Usage:
+    python tests/benchmarks/bench_make_zip.py [options]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+import datman.utils  # noqa: E402
+from synthetic_data import make_series  # noqa: E402
+
+SETTINGS = [
+    {"compression": "deflate"},
+    {"compression": "deflate", "level": 1},
+    {"compression": "deflate", "workers": 4},
+    {"compression": "deflate", "level": 1, "workers": 4},
+    {"compression": "stored"},
+]
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--series", type=int, default=10,
+        help="Number of series to zip. Default: %(default)s")
+    parser.add_argument(
+        "--files-per-series", type=int, default=100,
+        help="Dicoms in each series. Default: %(default)s")
+    parser.add_argument(
+        "--pixel-kb", type=int, default=256,
+        help="Kilobytes of pixel data per dicom. Default: %(default)s")
+    return parser.parse_args()
+
+
+def make_session(dest, args):
+    for num in range(args.series):
+        series_dir = os.path.join(dest, f"{num}-SERIES")
+        os.makedirs(series_dir)
+        files = make_series("1.2.3", num, "SERIES", args.files_per_series,
+                            pixel_bytes=args.pixel_kb * 1024)
+        for idx, contents in enumerate(files):
+            with open(os.path.join(series_dir, f"{idx:04d}.dcm"), "wb") as fh:
+                fh.write(contents)
+
+
+def main():
+    args = read_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, "SESSION")
+        make_session(source, args)
+        size = sum(os.path.getsize(os.path.join(root, item))
+                   for root, _, files in os.walk(source) for item in files)
+        print(f"{args.series * args.files_per_series} dicoms, "
+              f"{size / 1024 ** 2:.1f} MB")
+
+        dest = os.path.join(tmp_dir, "session.zip")
+        for settings in SETTINGS:
+            start = time.perf_counter()
+            datman.utils.make_zip(source, dest, **settings)
+            elapsed = time.perf_counter() - start
+            label = ", ".join(f"{k}={v}" for k, v in settings.items())
+            print(f"{label:<40} {elapsed:>7.2f} s "
+                  f"{os.path.getsize(dest) / 1024 ** 2:>8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Compare finding archives in a large scans.csv lookup table.
+
+A synthetic lookup table is searched for every archive name twice: once by
+filtering the whole DataFrame with a boolean mask, as dm_link.py used to,
+and once with datman.scan_list.ScanLookup.
+
+Usage:
+    python tests/benchmarks/bench_scan_lookup.py [options]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+
+# pylint: disable=wrong-import-position
+import datman.scan_list  # noqa: E402
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--rows", type=int, default=100000,
+        help="Rows in the lookup table. Default: %(default)s")
+    parser.add_argument(
+        "--archives", type=int, default=1000,
+        help="Archive names to look up. Default: %(default)s")
+    return parser.parse_args()
+
+
+def write_table(path, rows):
+    with open(path, "w") as fh:
+        fh.write("source_name\ttarget_name\tdicom_StudyID\n")
+        for num in range(rows):
+            fh.write(f"2020_{num:07d}\tSTUDY_CMH_{num:07d}_01_01\t{num}\n")
+
+
+def mask_lookup(table, names):
+    found = []
+    for name in names:
+        rows = table[table["source_name"] == name]
+        if len(rows):
+            found.append(rows["target_name"].tolist()[0])
+    return found
+
+
+def indexed_lookup(lookup, names):
+    found = []
+    for name in names:
+        rows = lookup.get_rows(name)
+        if rows is not None:
+            found.append(lookup.get_target(name))
+    return found
+
+
+def time_it(label, func, *args):
+    start = time.perf_counter()
+    found = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed:>8.3f} s")
+    return found, elapsed
+
+
+def main():
+    args = read_args()
+    rng = random.Random(0)
+    names = [f"2020_{rng.randrange(args.rows * 2):07d}"
+             for _ in range(args.archives)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "scans.csv")
+        write_table(path, args.rows)
+        print(f"{args.rows} rows, {args.archives} lookups")
+
+        table = pd.read_csv(path, sep=r"\s+", dtype=str)
+        old, old_time = time_it("boolean mask", mask_lookup, table, names)
+        start = time.perf_counter()
+        lookup = datman.scan_list.ScanLookup.from_file(path)
+        print(f"{'index build':<14} {time.perf_counter() - start:>8.3f} s "
+              "(includes reading the file)")
+        new, new_time = time_it("ScanLookup", indexed_lookup, lookup, names)
+
+    assert old == new
+    print(f"{old_time / new_time:.0f}x faster per lookup")
+
+
+if __name__ == "__main__":
+    main()
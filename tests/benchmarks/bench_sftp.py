@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Measure dm_sftp.py downloads from a high latency sftp server.
+
+A folder of synthetic sessions is served by the in-process stand-in in
+tests/mock_sftp.py, which adds a fixed delay to every call. The sessions
+are fetched with the per-file stat and get_r approach dm_sftp.py used to
+take, and then with dm_sftp.process_dir using 1 or more connections.
+
+Usage:
+    python tests/benchmarks/bench_sftp.py [options]
+"""
+import argparse
+import importlib
+import logging
+import os
+import sys
+import tempfile
+import time
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+from datman.utils import make_zip  # noqa: E402
+from mock_sftp import MockSFTPServer  # noqa: E402
+
+dm_sftp = importlib.import_module("bin.dm_sftp")
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--sessions", type=int, default=20,
+        help="Session folders on the server. Default: %(default)s")
+    parser.add_argument(
+        "--zips", type=int, default=20,
+        help="Already zipped sessions on the server. Default: %(default)s")
+    parser.add_argument(
+        "--files-per-session", type=int, default=20,
+        help="Files in each session folder. Default: %(default)s")
+    parser.add_argument(
+        "--latency", type=float, default=0.02,
+        help="Seconds of delay for every sftp call. Default: %(default)s")
+    parser.add_argument(
+        "--connections", type=int, nargs="+", default=[1, 4, 8],
+        help="Pool sizes to try. Default: %(default)s")
+    return parser.parse_args()
+
+
+def make_remote(root, args):
+    scans = os.path.join(root, "scans")
+    for num in range(args.sessions):
+        series = os.path.join(scans, f"SESSION{num:03d}", "1-T1")
+        os.makedirs(series)
+        for idx in range(args.files_per_session):
+            with open(os.path.join(series, f"{idx:04d}.dcm"), "wb") as fh:
+                fh.write(os.urandom(16 * 1024))
+    for num in range(args.zips):
+        with open(os.path.join(scans, f"EXAM{num:03d}.zip"), "wb") as fh:
+            fh.write(os.urandom(256 * 1024))
+
+
+def legacy_get_r(connection, remote_dir, local_dir):
+    os.makedirs(local_dir, exist_ok=True)
+    for name in connection.listdir(remote_dir):
+        remote = f"{remote_dir}/{name}"
+        local = os.path.join(local_dir, name)
+        if connection.isfile(remote):
+            connection.get(remote, local, preserve_mtime=True)
+        else:
+            legacy_get_r(connection, remote, local)
+
+
+def legacy_process_dir(connection, directory, zips_path):
+    """One connection, an isfile and stat per entry and get_r per folder.
+    """
+    with connection.cd(directory):
+        for name in connection.listdir():
+            target = os.path.join(zips_path, name)
+            if connection.isfile(name):
+                if dm_sftp.download_needed(connection, name, target):
+                    connection.get(name, target, preserve_mtime=True)
+                continue
+            target += ".zip"
+            if not dm_sftp.download_needed(connection, name, target):
+                continue
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                source = os.path.join(tmp_dir, name)
+                legacy_get_r(connection, name, source)
+                make_zip(source, target)
+
+
+def run(label, remote, fetch, latency):
+    server = MockSFTPServer(remote, latency=latency)
+    for attempt in ("new", "cached"):
+        with tempfile.TemporaryDirectory() as zips:
+            if attempt == "cached":
+                fetch(MockSFTPServer(remote), zips)
+                server.calls.clear()
+            start = time.perf_counter()
+            fetch(server, zips)
+            elapsed = time.perf_counter() - start
+        print(f"{label:<16} {attempt:<8} {elapsed:>8.2f} s "
+              f"{sum(server.calls.values()):>8} calls")
+
+
+def legacy(server, zips):
+    legacy_process_dir(server.connect(), "scans", zips)
+
+
+def pooled(size):
+    def fetch(server, zips):
+        with dm_sftp.ConnectionPool(server.connect, size=size) as pool:
+            dm_sftp.process_dir(pool, "scans", zips)
+    return fetch
+
+
+def main():
+    args = read_args()
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as remote:
+        make_remote(remote, args)
+        print(f"{args.sessions} session folders x {args.files_per_session} "
+              f"files, {args.zips} zips, {args.latency * 1000:.0f} ms "
+              "per call")
+        run("legacy", remote, legacy, args.latency)
+        for size in args.connections:
+            run(f"connections={size}", remote, pooled(size), args.latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""Compare re-reading a BIDS session's sidecars against using a SidecarIndex.
+
+A synthetic BIDS session is filled with dcm2niix-like sidecars. A run of
+NiiLinkExporter reads the session's sidecars three times (outputs_exist,
+then export, which checks outputs_exist again). This times those reads
+when every sidecar is parsed each time, as NiiLinkExporter used to, when
+they go through a SidecarIndex, and for a later run that loads the index
+saved by the first. The index only keeps the fields needed for tagging.
+
+Usage:
+    python tests/benchmarks/bench_sidecar_index.py [options]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+from datman.exporters.base import read_sidecar  # noqa: E402
+from datman.exporters.nii_symlink import SidecarIndex  # noqa: E402
+
+READS_PER_RUN = 3
+# The fields NiiLinkExporter keeps when tags only match on SeriesDescription
+FIELDS = {"SeriesNumber", "SeriesDescription", "Repeat", "EchoNumber"}
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--sidecars", type=int, default=200,
+        help="Number of sidecars in the session. Default: %(default)s")
+    parser.add_argument(
+        "--slices", type=int, default=72,
+        help="Length of each sidecar's SliceTiming list. Default: "
+             "%(default)s")
+    return parser.parse_args()
+
+
+def make_session(root, num_sidecars, num_slices):
+    rng = random.Random(0)
+    folders = ["anat", "func", "dwi", "fmap"]
+    for folder in folders:
+        (root / folder).mkdir(parents=True)
+    for num in range(num_sidecars):
+        contents = {
+            "Modality": "MR",
+            "SeriesNumber": num + 1,
+            "SeriesDescription": f"Series-{num}",
+            "ImageType": ["ORIGINAL", "PRIMARY", "M", "ND"],
+            "SliceTiming": [rng.random() for _ in range(num_slices)],
+            "ShimSetting": [rng.randint(-5000, 5000) for _ in range(8)],
+            "ConversionSoftware": "dcm2niix",
+        }
+        contents.update({f"Field{idx}": rng.random() for idx in range(60)})
+        folder = root / folders[num % len(folders)]
+        (folder / f"sub-CMH0000_ses-01_run-{num:03d}.json").write_text(
+            json.dumps(contents, indent=4))
+
+
+def parse_every_time(bids_path, index_file):
+    for _ in range(READS_PER_RUN):
+        [read_sidecar(item) for item in Path(bids_path).rglob("*.json")]
+
+
+def use_index(bids_path, index_file):
+    index = SidecarIndex(bids_path, index_file, fields=FIELDS)
+    for _ in range(READS_PER_RUN):
+        index.read()
+    index.save()
+    return index.parsed
+
+
+def main():
+    args = read_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bids_path = os.path.join(tmp_dir, "sub-CMH0000", "ses-01")
+        make_session(Path(bids_path), args.sidecars, args.slices)
+        index_file = os.path.join(tmp_dir, "index.json")
+        print(f"{args.sidecars} sidecars, {READS_PER_RUN} reads per run")
+
+        runs = [
+            ("parse_every_time", parse_every_time),
+            ("index_first_run", use_index),
+            ("index_later_run", use_index),
+        ]
+        for name, func in runs:
+            start = time.perf_counter()
+            func(bids_path, index_file)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<18} {elapsed * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""Compare walking a study's records against bulk loading its QC metadata.
+
+A synthetic study is written to an in-memory stand-in for the dashboard
+database. Its checklist and blacklist are then built twice: once by walking
+study.timepoints and reading each blacklist entry's scan, as
+datman.utils._fetch_checklist and _fetch_blacklist used to, and once with
+datman.dashboard.get_study_timepoints and get_study_blacklist.
+
+Usage:
+    python tests/benchmarks/bench_study_metadata.py [options]
+"""
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+import datman.dashboard  # noqa: E402
+import mock_dashboard  # noqa: E402
+from mock_dashboard import (  # noqa: E402
+    MockDashboard, Scan, ScanChecklist, Session, Study, Timepoint, User)
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--sessions", type=int, default=5000,
+        help="Number of sessions in the study. Default: %(default)s")
+    parser.add_argument(
+        "--scans", type=int, default=4,
+        help="Scans in each session. Default: %(default)s")
+    parser.add_argument(
+        "--blacklisted", type=int, default=2000,
+        help="Number of blacklisted scans. Default: %(default)s")
+    return parser.parse_args()
+
+
+def make_study(num_sessions, num_scans, num_blacklisted):
+    db_session = mock_dashboard.db.session
+    reviewers = [User(name=f"Reviewer {num}") for num in range(10)]
+    study = Study(name="STUDY", tag="STUDY", site="CMH", scantypes_str="T1")
+    db_session.add(study)
+    scans = []
+    for num in range(num_sessions):
+        subject = f"STUDY_CMH_{num:04d}_01"
+        timepoint = Timepoint(name=subject, bids_name=f"sub-CMH{num:04d}")
+        study.timepoints.append(timepoint)
+        session = Session(num=1, timepoint=timepoint, signed_off=bool(num % 2),
+                          reviewer=reviewers[num % len(reviewers)])
+        for series in range(num_scans):
+            scans.append(Scan(name=f"{subject}_01_T1_{series:02d}",
+                              series=series, tag="T1", description="MPRAGE",
+                              session=session))
+    db_session.add_all(scans)
+    db_session.add_all(
+        ScanChecklist(scan=scan, comment="motion")
+        for scan in scans[::max(1, len(scans) // num_blacklisted)]
+        [:num_blacklisted])
+    db_session.commit()
+
+
+def walk_study():
+    db_study = datman.dashboard.get_project("STUDY")
+    checklist = {}
+    for timepoint in db_study.timepoints:
+        if timepoint.is_phantom or not len(timepoint.sessions):
+            continue
+        session = list(timepoint.sessions.values())[0]
+        checklist[timepoint.name] = (
+            str(session.reviewer) if session.signed_off else "")
+    blacklist = {
+        str(entry.scan) + "_" + entry.scan.description: entry.comment
+        for entry in db_study.get_blacklisted_scans()
+    }
+    return checklist, blacklist
+
+
+def bulk_load():
+    checklist = {}
+    for timepoint in datman.dashboard.get_study_timepoints("STUDY"):
+        if timepoint.is_phantom or not len(timepoint.sessions):
+            continue
+        session = list(timepoint.sessions.values())[0]
+        checklist[timepoint.name] = (
+            str(session.reviewer) if session.signed_off else "")
+    blacklist = {
+        str(entry.scan) + "_" + entry.scan.description: entry.comment
+        for entry in datman.dashboard.get_study_blacklist("STUDY")
+    }
+    return checklist, blacklist
+
+
+def main():
+    args = read_args()
+    dashboard = MockDashboard()
+    make_study(args.sessions, args.scans, args.blacklisted)
+    print(f"{args.sessions} sessions, {args.sessions * args.scans} scans, "
+          f"{args.blacklisted} blacklisted")
+
+    results = []
+    with patch.object(datman.dashboard, "queries", mock_dashboard.queries,
+                      create=True), \
+            patch.object(datman.dashboard, "dash_found", True), \
+            patch.object(datman.dashboard, "_connected", True):
+        for func in (walk_study, bulk_load):
+            mock_dashboard.db.session.expunge_all()
+            dashboard.reset_counts()
+            start = time.perf_counter()
+            results.append(func())
+            elapsed = time.perf_counter() - start
+            print(f"{func.__name__:<12} {elapsed:>8.2f} s "
+                  f"{dashboard.statements:>8} queries")
+    dashboard.close()
+    assert results[0] == results[1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Compare tagging series with raw pattern strings against a TagMatcher.
+
+Synthetic series from many sites are tagged twice: once by searching each
+tag's raw 'Pattern' strings for every series, as the importers' set_tag
+methods used to, and once through each site's TagInfo.matcher. Sites have
+their own patterns, so a study with many sites has more distinct patterns
+than Python's regex cache can hold.
+
+Usage:
+    python tests/benchmarks/bench_tag_matching.py [options]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+from datman.config import TagInfo  # noqa: E402
+from datman.importers import ZipSeriesImporter  # noqa: E402
+
+TAG_NAMES = ["T1", "T2", "FLAIR", "DTI", "RST", "NBK", "EMP", "FMAP-AP",
+             "FMAP-PA", "ASL", "SWI", "MRS"]
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--series", type=int, default=10000,
+        help="Number of series to tag. Default: %(default)s")
+    parser.add_argument(
+        "--sites", type=int, default=60,
+        help="Number of sites, each with its own patterns. Default: "
+             "%(default)s")
+    return parser.parse_args()
+
+
+def make_tags(site):
+    return TagInfo({
+        tag: {"Pattern": {"SeriesDescription": [
+            f"{tag}_{site}_v[0-9]+", f"(?:site{site}|S{site:03d})[-_]{tag}"]}}
+        for tag in TAG_NAMES
+    })
+
+
+def make_series(num_series, num_sites):
+    rng = random.Random(0)
+    series = []
+    for _ in range(num_series):
+        site = rng.randrange(num_sites)
+        tag = rng.choice(TAG_NAMES)
+        series.append((site, SimpleNamespace(
+            description=f"{tag}_{site}_v{rng.randint(1, 9)}", tags=[])))
+    return series
+
+
+def search_raw_patterns(series, tags):
+    # How the importers' set_tag methods tagged each series before
+    for site, scan in series:
+        matches = {}
+        for tag, pattern in tags[site].series_map.items():
+            regex = pattern["SeriesDescription"]
+            if isinstance(regex, list):
+                regex = "|".join(regex)
+            if re.search(regex, scan.description, re.IGNORECASE):
+                matches[tag] = pattern
+        scan.tags = list(matches)
+
+
+def use_tag_matcher(series, tags):
+    for site, scan in series:
+        ZipSeriesImporter.set_tag(scan, tags[site].matcher)
+
+
+def main():
+    args = read_args()
+    series = make_series(args.series, args.sites)
+    print(f"{args.series} series, {args.sites} sites, "
+          f"{args.sites * len(TAG_NAMES)} distinct patterns")
+
+    results = []
+    for func in (search_raw_patterns, use_tag_matcher):
+        re.purge()
+        tags = [make_tags(site) for site in range(args.sites)]
+        start = time.perf_counter()
+        func(series, tags)
+        elapsed = time.perf_counter() - start
+        results.append([scan.tags for _, scan in series])
+        print(f"{func.__name__:<20} {elapsed:>8.2f} s")
+    assert results[0] == results[1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Measure XNAT extract and upload throughput against a local mock server.
+
+Everything runs offline: sessions are made of synthetic dicoms and served
+by tests/mock_xnat.py. For each mode the requests per session, MB/s and
+seconds per session are reported, along with any sessions that failed.
+
+Usage:
+    python tests/benchmarks/bench_xnat.py [options]
+
+Example:
+    python tests/benchmarks/bench_xnat.py --sessions 5 --latency 0.02 \\
+        --bandwidth 50
+"""
+import argparse
+import importlib
+import logging
+import os
+import sys
+import tempfile
+import time
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(TESTS))
+sys.path.insert(0, TESTS)
+
+# pylint: disable=wrong-import-position
+import datman.scanid  # noqa: E402
+import datman.xnat  # noqa: E402
+from datman.exceptions import XnatException  # noqa: E402
+from mock_xnat import MockXNAT  # noqa: E402
+from synthetic_data import make_session_zip  # noqa: E402
+
+extract = importlib.import_module("bin.dm_xnat_extract")
+upload = importlib.import_module("bin.dm_xnat_upload")
+
+PROJECT = "BENCH"
+SERIES = ["T1", "DTI", "RST", "FMAP"]
+RESOURCES = {"behav/task.log": b"x" * 4096, "physio/resp.1D": b"0\n" * 2048}
+
+
+def read_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--mode", choices=["extract", "upload", "all"], default="all",
+        help="Which operation to benchmark. Default: %(default)s")
+    parser.add_argument(
+        "--sessions", type=int, default=3,
+        help="Number of sessions to transfer. Default: %(default)s")
+    parser.add_argument(
+        "--files-per-scan", type=int, default=10,
+        help="Dicoms in each scan. Default: %(default)s")
+    parser.add_argument(
+        "--pixel-kb", type=int, default=64,
+        help="Kilobytes of pixel data per dicom. Default: %(default)s")
+    parser.add_argument(
+        "--latency", type=float, default=0.005,
+        help="Server latency per request in seconds. Default: %(default)s")
+    parser.add_argument(
+        "--bandwidth", type=float, default=None,
+        help="Server bandwidth limit in MB/s. Default: unlimited")
+    parser.add_argument(
+        "--fault-rate", type=int, default=0,
+        help="Inject a server fault (503) every N requests. Default: never")
+    return parser.parse_args()
+
+
+def session_names(num):
+    for idx in range(1, num + 1):
+        ident = datman.scanid.parse(f"{PROJECT}_CMH_{idx:04d}_01_01")
+        yield ident
+
+
+def bench_extract(server, args, tmp_dir):
+    """Download the scans and resources of every session.
+    """
+    for ident in session_names(args.sessions):
+        server.add_experiment(
+            PROJECT, ident.get_xnat_subject_id(),
+            ident.get_xnat_experiment_id(), scans=SERIES,
+            files_per_scan=args.files_per_scan,
+            pixel_bytes=args.pixel_kb * 1024, resources=RESOURCES)
+
+    xnat = datman.xnat.XNAT(server.url, "user", "pass")
+    failed = 0
+    start = time.perf_counter()
+    for ident in session_names(args.sessions):
+        try:
+            experiment = xnat.get_experiment(
+                PROJECT, ident.get_xnat_subject_id(),
+                ident.get_xnat_experiment_id())
+            dest = os.path.join(tmp_dir, "extract", experiment.name)
+            for scan in experiment.scans:
+                scan.get_files(os.path.join(dest, "dcm"), xnat)
+            extract.export_resources(os.path.join(dest, "RESOURCES"), xnat,
+                                     experiment)
+        except XnatException:
+            failed += 1
+    return time.perf_counter() - start, server.bytes_sent, failed
+
+
+def bench_upload(server, args, tmp_dir):
+    """Upload the dicoms and resources of every session.
+    """
+    server.add_project(PROJECT)
+    archives = []
+    for ident in session_names(args.sessions):
+        archive = os.path.join(tmp_dir, f"{ident}.zip")
+        make_session_zip(archive, str(ident), series=SERIES,
+                         files_per_series=args.files_per_scan,
+                         pixel_bytes=args.pixel_kb * 1024,
+                         resources=RESOURCES)
+        archives.append((ident, archive))
+
+    xnat = datman.xnat.XNAT(server.url, "user", "pass")
+    failed = 0
+    start = time.perf_counter()
+    for ident, archive in archives:
+        try:
+            xnat.get_subject(PROJECT, ident.get_xnat_subject_id(),
+                             create=True)
+            upload.upload_dicom_data(archive, PROJECT, ident, xnat)
+            upload.upload_non_dicom_data(archive, PROJECT, ident, xnat)
+        except XnatException:
+            failed += 1
+    return time.perf_counter() - start, server.bytes_received, failed
+
+
+def run(name, bench, args):
+    bandwidth = args.bandwidth * 1024 ** 2 if args.bandwidth else None
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            MockXNAT(latency=args.latency, bandwidth=bandwidth,
+                     fault_rate=args.fault_rate) as server:
+        elapsed, transferred, failed = bench(server, args, tmp_dir)
+        megabytes = transferred / 1024 ** 2
+        print(f"{name:<8} "
+              f"{server.requests / args.sessions:>14.1f} "
+              f"{megabytes / elapsed:>8.2f} "
+              f"{elapsed / args.sessions:>12.3f} "
+              f"{megabytes:>10.2f} "
+              f"{failed:>7}")
+
+
+def main():
+    args = read_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{args.sessions} sessions, {len(SERIES)} scans x "
+          f"{args.files_per_scan} files x {args.pixel_kb} KB, "
+          f"{args.latency * 1000:.0f} ms latency")
+    print(f"{'mode':<8} {'requests/sess':>14} {'MB/s':>8} "
+          f"{'sec/session':>12} {'MB total':>10} {'failed':>7}")
+    if args.mode in ("extract", "all"):
+        run("extract", bench_extract, args)
+    if args.mode in ("upload", "all"):
+        run("upload", bench_upload, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import pytest
+from mock import patch
+
+import datman.dashboard
+from mock_dashboard import MockDashboard, queries as mock_queries
+
+
+@pytest.fixture
+def dashboard():
+    """Connects datman.dashboard to an in-memory MockDashboard.
+
+    The dashboard holds one session, STUDY_CMH_0001_01, with T1 and DTI tags
+    configured. Any lookup cache enabled during the test is cleared afterward.
+    """
+    mock = MockDashboard()
+    mock.add_session("STUDY", "CMH", "STUDY_CMH_0001_01", tags=["T1", "DTI"])
+    with patch.object(datman.dashboard, "queries", mock_queries,
+                      create=True), \
+            patch.object(datman.dashboard, "dash_found", True), \
+            patch.object(datman.dashboard, "_connected", True):
+        yield mock
+    datman.dashboard.disable_cache()
+    mock.close()
@@ -0,0 +1,252 @@
+"""A SQLite backed stand-in for the QC dashboard's queries and models.
+
+Only the parts used by datman.dashboard, datman.utils and the DBExporter are
+included.
+Like the real dashboard, every model method commits its own change. Each
+SQL statement and commit is counted so tests can check how many round trips
+an operation needs.
+"""
+import json
+from collections import defaultdict
+
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer,
+                        String, Table, Text, create_engine, event)
+from sqlalchemy.orm import (attribute_keyed_dict, declarative_base,
+                            relationship, scoped_session, sessionmaker)
+
+Base = declarative_base()
+
+
+class _DB:
+    session = None
+
+
+db = _DB()
+
+
+class TableMixin:
+
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
+
+
+study_timepoints = Table(
+    "study_timepoints", Base.metadata,
+    Column("study", Integer, ForeignKey("studies.id")),
+    Column("timepoint", String, ForeignKey("timepoints.name"))
+)
+
+
+class Study(TableMixin, Base):
+    __tablename__ = "studies"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    tag = Column(String)
+    site = Column(String)
+    scantypes_str = Column(String)
+    timepoints = relationship("Timepoint", secondary=study_timepoints)
+
+    def get_blacklisted_scans(self):
+        return db.session.query(ScanChecklist).join(Scan).join(Session) \
+            .join(Timepoint).join(study_timepoints) \
+            .filter(study_timepoints.c.study == self.id,
+                    ScanChecklist.approved.is_(False)) \
+            .all()
+
+    @property
+    def scantypes(self):
+        types = defaultdict(list)
+        for tag in self.scantypes_str.split(","):
+            types[self.site].append(ScanType(tag))
+        return types
+
+
+class ScanType:
+
+    def __init__(self, tag):
+        self.scantype_id = tag
+
+
+class Timepoint(TableMixin, Base):
+    __tablename__ = "timepoints"
+    name = Column(String, primary_key=True)
+    bids_name = Column(String)
+    bids_session = Column(String)
+    kcni_name = Column(String)
+    is_phantom = Column(Boolean, default=False)
+    sessions = relationship("Session", back_populates="timepoint",
+                            collection_class=attribute_keyed_dict("num"))
+
+
+class Session(TableMixin, Base):
+    __tablename__ = "sessions"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, ForeignKey("timepoints.name"))
+    num = Column(Integer)
+    date = Column(DateTime)
+    tech_notes = Column(String)
+    kcni_name = Column(String)
+    signed_off = Column(Boolean, default=False)
+    reviewer_id = Column(Integer, ForeignKey("users.id"))
+    timepoint = relationship("Timepoint", back_populates="sessions")
+    reviewer = relationship("User")
+    scans = relationship("Scan", back_populates="session")
+
+    def expects_notes(self):
+        return False
+
+    def is_qcd(self):
+        return self.signed_off
+
+    def add_scan(self, name, series, tag, description, source_id=None):
+        scan = Scan(name=name, series=int(series), tag=tag,
+                    description=description, source_id=source_id,
+                    session=self)
+        scan.save()
+        return scan
+
+
+class Scan(TableMixin, Base):
+    __tablename__ = "scans"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"))
+    series = Column(Integer)
+    tag = Column(String)
+    description = Column(String)
+    source_id = Column(Integer)
+    bids_name = Column(String)
+    json_path = Column(String)
+    json_contents = Column(Text)
+    conv_errors = Column(Text)
+    session = relationship("Session", back_populates="scans")
+
+    def add_bids(self, name):
+        self.bids_name = name
+        self.save()
+
+    def add_json(self, path):
+        with open(path) as fh:
+            self.json_contents = json.dumps(json.load(fh))
+        self.json_path = path
+        self.save()
+
+    def add_error(self, message):
+        if isinstance(message, list):
+            message = "".join(message)
+        self.conv_errors = message
+        self.save()
+
+    def __repr__(self):
+        return f"<Scan {self.name}>"
+
+    def __str__(self):
+        return self.name
+
+
+class ScanChecklist(TableMixin, Base):
+    __tablename__ = "scan_checklist"
+    id = Column(Integer, primary_key=True)
+    scan_id = Column(Integer, ForeignKey("scans.id"))
+    comment = Column(String)
+    approved = Column(Boolean, default=False)
+    scan = relationship("Scan")
+
+
+class User(TableMixin, Base):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+    def __str__(self):
+        return self.name
+
+
+class _Queries:
+    """Mirrors the query functions of dashboard.queries.
+    """
+
+    db = db
+
+    @staticmethod
+    def get_session(name, num):
+        return db.session.query(Session).filter(
+            Session.name == name, Session.num == num).first()
+
+    @staticmethod
+    def get_scan(name, timepoint=None, session=None, bids=False):
+        column = Scan.bids_name if bids else Scan.name
+        return db.session.query(Scan).filter(column == name).all()
+
+    @staticmethod
+    def get_studies(name=None, tag=None, site=None, create=False):
+        query = db.session.query(Study)
+        if name:
+            query = query.filter(Study.name == name)
+        if tag:
+            query = query.filter(Study.tag == tag)
+        if site:
+            query = query.filter(Study.site == site)
+        return query.all()
+
+
+queries = _Queries()
+
+
+class MockDashboard:
+    """Creates an in-memory database and counts the work done on it.
+    """
+
+    def __init__(self):
+        self.engine = create_engine("sqlite://")
+        # pysqlite's own transaction handling breaks SAVEPOINTs, so let
+        # SQLAlchemy begin transactions itself
+        event.listen(self.engine, "connect", self._disable_pysqlite_begin)
+        event.listen(self.engine, "begin", self._begin)
+        Base.metadata.create_all(self.engine)
+        db.session = scoped_session(sessionmaker(bind=self.engine))
+        self.statements = 0
+        self.commits = 0
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        event.listen(self.engine, "commit", self._count_commit)
+
+    @staticmethod
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @staticmethod
+    def _begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    def _count(self, conn, cursor, statement, *args):
+        if statement != "BEGIN":
+            self.statements += 1
+
+    def _count_commit(self, *args):
+        self.commits += 1
+
+    def reset_counts(self):
+        db.session.expire_all()
+        self.statements = 0
+        self.commits = 0
+
+    def add_session(self, study, site, timepoint, num=1, tags=()):
+        db_study = db.session.query(Study).filter(
+            Study.name == study, Study.site == site).first()
+        if not db_study:
+            db_study = Study(name=study, tag=study, site=site,
+                             scantypes_str=",".join(tags))
+            db.session.add(db_study)
+        db_timepoint = db.session.get(Timepoint, timepoint)
+        if not db_timepoint:
+            db_timepoint = Timepoint(name=timepoint)
+            db_study.timepoints.append(db_timepoint)
+        session = Session(num=num, timepoint=db_timepoint)
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+    def close(self):
+        db.session.remove()
+        self.engine.dispose()
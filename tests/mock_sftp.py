@@ -0,0 +1,181 @@
+"""An in-process stand-in for a pysftp connection, backed by a local folder.
+
+MockSFTP implements the parts of pysftp.Connection that dm_sftp.py uses.
+Every call sleeps for 'latency' seconds to imitate a round trip to a remote
+scanner-side server, and is counted in 'calls' so tests and benchmarks can
+check how many round trips an operation needs. A dropped connection can be
+imitated with MockSFTPServer.interrupt_after.
+"""
+import collections
+import contextlib
+import os
+import posixpath
+import shutil
+import threading
+import time
+
+import paramiko
+
+
+class MockSFTPServer:
+    """Shared state for all connections to one fake server.
+    """
+
+    def __init__(self, root, latency=0):
+        self.root = root
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.connections = 0
+        self.bytes_sent = 0
+        self.max_in_use = 0
+        self._fail_after = None
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            self.connections += 1
+        return MockSFTP(self)
+
+    def interrupt_after(self, num_bytes):
+        """Drop the connection after another num_bytes have been read.
+        """
+        with self._lock:
+            self._fail_after = self.bytes_sent + num_bytes
+
+    def _send(self, data):
+        with self._lock:
+            if self._fail_after is not None:
+                if self.bytes_sent >= self._fail_after:
+                    self._fail_after = None
+                    raise IOError("Connection lost")
+                data = data[:self._fail_after - self.bytes_sent]
+            self.bytes_sent += len(data)
+        return data
+
+    def _start(self, method):
+        with self._lock:
+            self.calls[method] += 1
+            self._in_use += 1
+            self.max_in_use = max(self.max_in_use, self._in_use)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _finish(self):
+        with self._lock:
+            self._in_use -= 1
+
+
+class MockSFTP:
+    """A single connection. Like a real one it can't be shared by threads.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.pwd = "/"
+        self.closed = False
+        self._busy = threading.Lock()
+
+    @contextlib.contextmanager
+    def _call(self, method):
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("Connection used by two threads at once")
+        self.server._start(method)
+        try:
+            yield
+        finally:
+            self.server._finish()
+            self._busy.release()
+
+    def _local(self, path):
+        return os.path.join(self.server.root, self._abspath(path).lstrip("/"))
+
+    def _abspath(self, path):
+        return posixpath.normpath(posixpath.join(self.pwd, path))
+
+    def listdir(self, remotepath="."):
+        with self._call("listdir"):
+            return sorted(os.listdir(self._local(remotepath)))
+
+    def listdir_attr(self, remotepath="."):
+        with self._call("listdir_attr"):
+            local = self._local(remotepath)
+            # Like a real server, symlinks are reported rather than followed
+            return [
+                paramiko.SFTPAttributes.from_stat(
+                    os.lstat(os.path.join(local, name)), filename=name)
+                for name in sorted(os.listdir(local))
+            ]
+
+    def stat(self, remotepath):
+        with self._call("stat"):
+            return paramiko.SFTPAttributes.from_stat(
+                os.stat(self._local(remotepath)))
+
+    def exists(self, remotepath):
+        with self._call("stat"):
+            return os.path.exists(self._local(remotepath))
+
+    def isfile(self, remotepath):
+        with self._call("stat"):
+            return os.path.isfile(self._local(remotepath))
+
+    def open(self, remote_file, mode="r", bufsize=-1):
+        with self._call("open"):
+            return MockSFTPFile(self.server, self._local(remote_file))
+
+    def get(self, remotepath, localpath=None, callback=None,
+            preserve_mtime=False):
+        with self._call("get"):
+            source = self._local(remotepath)
+            shutil.copyfile(source, localpath)
+        if preserve_mtime:
+            attrs = self.stat(remotepath)
+            os.utime(localpath, (attrs.st_atime, attrs.st_mtime))
+
+    def cwd(self, remotepath):
+        with self._call("chdir"):
+            if not os.path.isdir(self._local(remotepath)):
+                raise IOError(f"No such folder {remotepath}")
+            self.pwd = self._abspath(remotepath)
+
+    @contextlib.contextmanager
+    def cd(self, remotepath=None):
+        original = self.pwd
+        try:
+            if remotepath is not None:
+                self.cwd(remotepath)
+            yield
+        finally:
+            self.cwd(original)
+
+    def close(self):
+        self.closed = True
+
+
+class MockSFTPFile:
+    """A remote file opened for reading. Bytes read count towards the
+    server's interrupt_after limit.
+    """
+
+    def __init__(self, server, path):
+        self.server = server
+        self._fh = open(path, "rb")
+
+    def seek(self, offset, whence=0):
+        self._fh.seek(offset, whence)
+
+    def prefetch(self, file_size=None, max_concurrent_requests=None):
+        pass
+
+    def read(self, size=-1):
+        return self.server._send(self._fh.read(size))
+
+    def close(self):
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,566 @@
+"""A local, in-process stand-in for an XNAT server.
+
+This implements just enough of XNAT's REST API for datman.xnat (and the
+scripts built on it) to list, download and upload synthetic sessions. It
+runs on a background thread and needs no network access, so it can be used
+by both the test suite and the benchmarks in tests/benchmarks.
+
+Example:
+    with MockXNAT(latency=0.01) as server:
+        server.add_experiment("STUDY", "STUDY_CMH_0001",
+                              "STUDY_CMH_0001_01_SE01_MR")
+        xnat = datman.xnat.XNAT(server.url, "user", "pass")
+        ...
+"""
+import io
+import json
+import re
+import threading
+import time
+import urllib.parse
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pydicom.uid import generate_uid
+
+from synthetic_data import make_series
+
+CATALOG_NS = "http://nrg.wustl.edu/catalog"
+
+_EXPERIMENT = (r"/data/archive/projects/(?P<project>[^/]+)/subjects/"
+               r"(?P<subject>[^/]+)/experiments/(?P<experiment>[^/]+)")
+
+
+class MockExperiment:
+    """The contents of a single synthetic XNAT experiment.
+    """
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(self, project, subject, name, scans=None, files_per_scan=2,
+                 pixel_bytes=0, resources=None):
+        self.project = project
+        self.subject = subject
+        self.name = name
+        self.id = f"XNAT_E{abs(hash(name)) % 10 ** 8:08d}"
+        self.uid = generate_uid()
+        self.files_per_scan = files_per_scan
+        self.pixel_bytes = pixel_bytes
+        self.scans = {}
+        for num, descr in enumerate(scans or [], start=1):
+            self.scans[str(num)] = {"description": descr, "uid": None,
+                                    "zip": None}
+        # Resource folder label -> {file name: contents}
+        self.resources = {}
+        if resources:
+            self.resources["MISC"] = dict(resources)
+        self.uploaded = 0
+
+    def resource_id(self, label):
+        return str(list(self.resources).index(label) + 1000)
+
+    def resource_label(self, resource_id):
+        for label in self.resources:
+            if self.resource_id(label) == resource_id or label == resource_id:
+                return label
+        return None
+
+    def scan_zip(self, scan_id):
+        """Get (and cache) the zip XNAT would serve for a scan's dicoms.
+        """
+        scan = self.scans[scan_id]
+        if scan["zip"] is None:
+            files = make_series(self.uid, int(scan_id), scan["description"],
+                                self.files_per_scan,
+                                pixel_bytes=self.pixel_bytes)
+            output = io.BytesIO()
+            folder = (f"{self.name}/scans/{scan_id}-{scan['description']}/"
+                      "resources/DICOM/files")
+            with zipfile.ZipFile(output, "w") as zf:
+                for idx, contents in enumerate(files):
+                    zf.writestr(f"{folder}/{idx:04d}.dcm", contents)
+            scan["zip"] = output.getvalue()
+        return scan["zip"]
+
+    def as_json(self):
+        scans = []
+        for scan_id, scan in self.scans.items():
+            if scan["uid"] is None:
+                scan["uid"] = generate_uid()
+            scans.append({
+                "data_fields": {
+                    "ID": scan_id, "UID": scan["uid"],
+                    "type": scan["description"],
+                    "series_description": scan["description"],
+                    "parameters/imageType": "ORIGINAL\\PRIMARY\\M\\ND"
+                },
+                "children": [{
+                    "field": "file",
+                    "items": [{"data_fields": {
+                        "label": "DICOM", "format": "DICOM",
+                        "content": "RAW",
+                        "xnat_abstractresource_id": int(scan_id) + 100
+                    }}]
+                }]
+            })
+        resources = [
+            {"data_fields": {"label": label,
+                             "xnat_abstractresource_id":
+                                 self.resource_id(label)}}
+            for label in self.resources
+        ]
+        children = []
+        if scans:
+            children.append({"field": "scans/scan", "items": scans})
+        if resources:
+            children.append({"field": "resources/resource",
+                             "items": resources})
+        return {
+            "data_fields": {"ID": self.id, "label": self.name,
+                            "UID": self.uid, "date": "2020-01-01",
+                            "subject_ID": self.subject},
+            "children": children
+        }
+
+
+class MockXNAT:
+    """A threaded HTTP server that mimics XNAT.
+
+    Args:
+        latency (float, optional): Seconds to wait before answering each
+            request. Defaults to 0.
+        bandwidth (float, optional): Bytes per second to limit response
+            bodies to. Defaults to None (unlimited).
+        fail_status (int, optional): The status code returned by injected
+            faults. Defaults to 503.
+        fault_rate (int, optional): If set, every nth (non-login) request
+            fails with ``fail_status``. Defaults to None.
+
+    Attributes:
+        overloaded (:obj:`threading.Event`): While set, every request except
+            logins fails with ``fail_status``.
+        requests (int): The number of requests received.
+        logins (int): The number of sessions opened.
+        max_in_flight (int): The most requests handled at once.
+        bytes_sent (int): Response body bytes sent.
+        bytes_received (int): Request body bytes received.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, fail_status=503,
+                 fault_rate=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fail_status = fail_status
+        self.fault_rate = fault_rate
+        self.overloaded = threading.Event()
+        self.projects = {}
+        self.session_ids = set()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.logins = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._faults = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_project(self, project):
+        return self.projects.setdefault(project, {})
+
+    def add_subject(self, project, subject):
+        return self.add_project(project).setdefault(subject, {})
+
+    def add_experiment(self, project, subject, experiment, **kwargs):
+        """Add a synthetic experiment.
+
+        Keyword arguments are passed to :obj:`MockExperiment`.
+        """
+        exper = MockExperiment(project, subject, experiment, **kwargs)
+        self.add_subject(project, subject)[experiment] = exper
+        return exper
+
+    def get_experiment(self, project, subject, experiment):
+        try:
+            return self.projects[project][subject][experiment]
+        except KeyError:
+            return None
+
+    def inject_faults(self, count):
+        """Fail the next 'count' (non-login) requests with fail_status.
+        """
+        with self.lock:
+            self._faults += count
+
+    def expire_sessions(self):
+        """Forget all sessions, so clients must log in again.
+        """
+        with self.lock:
+            self.session_ids.clear()
+
+    def _take_fault(self):
+        with self.lock:
+            if self._faults:
+                self._faults -= 1
+                return True
+            if self.fault_rate and self.requests % self.fault_rate == 0:
+                return True
+        return self.overloaded.is_set()
+
+
+# pylint: disable-next=too-many-public-methods
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def log_message(self, *args):
+        pass
+
+    # Plumbing ###############################################################
+
+    def _reply(self, status, body=b"", content_type="application/json",
+               headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        elif isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        self._write(body)
+
+    def _write(self, body):
+        bandwidth = self.mock.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+        else:
+            chunk_size = max(int(bandwidth / 20), 1024)
+            for start in range(0, len(body), chunk_size):
+                chunk = body[start:start + chunk_size]
+                self.wfile.write(chunk)
+                time.sleep(len(chunk) / bandwidth)
+        with self.mock.lock:
+            self.mock.bytes_sent += len(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        with self.mock.lock:
+            self.mock.bytes_received += len(body)
+        return body
+
+    def _session_valid(self):
+        cookies = self.headers.get("Cookie", "")
+        found = re.search(r"JSESSIONID=([^;\s]+)", cookies)
+        return bool(found) and found.group(1) in self.mock.session_ids
+
+    def _handle(self):
+        mock = self.mock
+        with mock.lock:
+            mock.requests += 1
+            mock.in_flight += 1
+            mock.max_in_flight = max(mock.max_in_flight, mock.in_flight)
+        try:
+            if mock.latency:
+                time.sleep(mock.latency)
+            parsed = urllib.parse.urlsplit(self.path)
+            path = self._normalize(parsed.path)
+            query = dict(urllib.parse.parse_qsl(parsed.query))
+            body = self._read_body() if self.command in ("POST", "PUT") \
+                else b""
+
+            if path == "/data/JSESSION":
+                self._session(body)
+                return
+            if not self._session_valid():
+                self._reply(401)
+                return
+            if mock._take_fault():
+                self._reply(mock.fail_status)
+                return
+            self._route(path, query, body)
+        finally:
+            with mock.lock:
+                mock.in_flight -= 1
+
+    do_GET = do_PUT = do_POST = do_DELETE = _handle
+
+    @staticmethod
+    def _normalize(path):
+        path = re.sub(r"^/REST/", "/data/", path)
+        path = re.sub(r"^/data/projects/", "/data/archive/projects/", path)
+        if len(path) > 1:
+            path = path.rstrip("/")
+        return path
+
+    def _session(self, body):
+        mock = self.mock
+        if self.command == "POST":
+            with mock.lock:
+                mock.logins += 1
+                session_id = f"MOCKSESSION{mock.logins:06d}"
+                mock.session_ids.add(session_id)
+            self._reply(200, session_id, content_type="text/plain",
+                        headers={"Set-Cookie":
+                                 f"JSESSIONID={session_id}; Path=/"})
+        elif self.command == "DELETE":
+            self._reply(200)
+        elif self._session_valid():
+            found = re.search(r"JSESSIONID=([^;\s]+)",
+                              self.headers.get("Cookie", ""))
+            self._reply(200, found.group(1), content_type="text/plain")
+        else:
+            self._reply(401)
+
+    # Routing ################################################################
+
+    def _route(self, path, query, body):
+        routes = [
+            (r"/data/services/import", self._import),
+            (r"/data/search", self._search),
+            (r"/data/workflows/.+", self._ok),
+            (r"/data/archive/projects", self._projects),
+            (r"/data/archive/projects/(?P<project>[^/]+)", self._project),
+            (r"/data/archive/projects/(?P<project>[^/]+)/subjects",
+             self._subjects),
+            (r"/data/archive/projects/(?P<project>[^/]+)/subjects/"
+             r"(?P<subject>[^/]+)", self._subject),
+            (r"/data/archive/projects/(?P<project>[^/]+)"
+             r"(/subjects/(?P<subject>[^/]+))?/experiments",
+             self._experiments),
+            (_EXPERIMENT, self._experiment),
+            (_EXPERIMENT + r"/scans", self._scans),
+            (_EXPERIMENT + r"/scans/(?P<scan>[^/]+)/resources/DICOM/files",
+             self._scan_zip),
+            (_EXPERIMENT + r"/resources", self._resources),
+            (_EXPERIMENT + r"/resources/(?P<resource>[^/]+)",
+             self._resource),
+            (_EXPERIMENT + r"/resources/(?P<resource>[^/]+)/files",
+             self._resource_zip),
+            (_EXPERIMENT + r"/resources/(?P<resource>[^/]+)/files/"
+             r"(?P<fname>.+)", self._resource_file),
+        ]
+        for pattern, handler in routes:
+            match = re.fullmatch(pattern, path)
+            if match:
+                handler(query=query, body=body,
+                        **{k: urllib.parse.unquote(v) if v else v
+                           for k, v in match.groupdict().items()})
+                return
+        self._reply(404)
+
+    def _lookup(self, project, subject, experiment):
+        exper = self.mock.get_experiment(project, subject, experiment)
+        if exper is None:
+            self._reply(404)
+        return exper
+
+    def _ok(self, **kwargs):
+        self._reply(200)
+
+    def _search(self, **kwargs):
+        self._reply(200, {"ResultSet": {"Result": []}})
+
+    def _projects(self, **kwargs):
+        self._reply(200, {"ResultSet": {"Result": [
+            {"ID": name, "name": name} for name in self.mock.projects]}})
+
+    def _project(self, project, **kwargs):
+        if project not in self.mock.projects:
+            self._reply(404)
+            return
+        self._reply(200, {"items": [{"data_fields": {"ID": project,
+                                                     "name": project}}]})
+
+    def _subjects(self, project, **kwargs):
+        subjects = self.mock.projects.get(project)
+        if subjects is None:
+            self._reply(404)
+            return
+        self._reply(200, {"ResultSet": {"Result": [
+            {"label": name, "ID": name} for name in subjects]}})
+
+    def _subject(self, project, subject, query, **kwargs):
+        if self.command == "PUT":
+            if "label" in query:
+                self._reply(200)
+                return
+            self.mock.add_subject(project, subject)
+            self._reply(201)
+            return
+        try:
+            experiments = self.mock.projects[project][subject]
+        except KeyError:
+            self._reply(404)
+            return
+        self._reply(200, {"items": [{
+            "data_fields": {"label": subject, "ID": subject,
+                            "project": project},
+            "children": [{
+                "field": "experiments/experiment",
+                "items": [exp.as_json() for exp in experiments.values()]
+            }]
+        }]})
+
+    def _experiments(self, project, subject=None, **kwargs):
+        subjects = self.mock.projects.get(project)
+        if subjects is None or (subject and subject not in subjects):
+            self._reply(404)
+            return
+        found = []
+        for sub_name, experiments in subjects.items():
+            if subject and sub_name != subject:
+                continue
+            found.extend({"label": name, "ID": exp.id}
+                         for name, exp in experiments.items())
+        self._reply(200, {"ResultSet": {"Result": found}})
+
+    def _experiment(self, project, subject, experiment, query, **kwargs):
+        if self.command == "PUT":
+            if "label" not in query and not self.mock.get_experiment(
+                    project, subject, experiment):
+                self.mock.add_experiment(project, subject, experiment)
+            self._reply(200)
+            return
+        exper = self._lookup(project, subject, experiment)
+        if exper:
+            self._reply(200, {"items": [exper.as_json()]})
+
+    def _scans(self, project, subject, experiment, **kwargs):
+        exper = self._lookup(project, subject, experiment)
+        if exper:
+            self._reply(200, {"ResultSet": {"Result": [
+                {"ID": scan_id} for scan_id in exper.scans]}})
+
+    def _scan_zip(self, project, subject, experiment, scan, **kwargs):
+        exper = self._lookup(project, subject, experiment)
+        if not exper:
+            return
+        if scan not in exper.scans:
+            self._reply(404)
+            return
+        self._reply(200, exper.scan_zip(scan), content_type="application/zip")
+
+    def _resources(self, project, subject, experiment, **kwargs):
+        exper = self._lookup(project, subject, experiment)
+        if exper:
+            results = [{"label": label,
+                        "xnat_abstractresource_id": exper.resource_id(label)}
+                       for label in exper.resources]
+            self._reply(200, {"ResultSet": {
+                "Result": results, "totalRecords": str(len(results))}})
+
+    def _resource(self, project, subject, experiment, resource, **kwargs):
+        exper = self._lookup(project, subject, experiment)
+        if not exper:
+            return
+        if self.command == "PUT":
+            exper.resources.setdefault(resource, {})
+            self._reply(200)
+            return
+        label = exper.resource_label(resource)
+        if label is None:
+            self._reply(404)
+            return
+        entries = "".join(
+            f'<cat:entry URI="{name}" name="{name.split("/")[-1]}" '
+            f'ID="{name}"/>' for name in exper.resources[label])
+        catalog = (f'<cat:DCMCatalog xmlns:cat="{CATALOG_NS}">'
+                   f"<cat:entries>{entries}</cat:entries></cat:DCMCatalog>")
+        self._reply(200, catalog, content_type="text/xml")
+
+    def _resource_zip(self, project, subject, experiment, resource,
+                      **kwargs):
+        exper = self._lookup(project, subject, experiment)
+        if not exper:
+            return
+        label = exper.resource_label(resource)
+        if label is None:
+            self._reply(404)
+            return
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w") as zf:
+            for name, contents in exper.resources[label].items():
+                zf.writestr(name, contents)
+        self._reply(200, output.getvalue(), content_type="application/zip")
+
+    # pylint: disable-next=too-many-arguments
+    def _resource_file(self, project, subject, experiment, resource, fname,
+                       body, **kwargs):
+        exper = self._lookup(project, subject, experiment)
+        if not exper:
+            return
+        label = exper.resource_label(resource)
+        if label is None:
+            self._reply(404)
+            return
+        if self.command == "POST":
+            exper.resources[label][fname] = body
+            self._reply(200)
+            return
+        if self.command == "DELETE":
+            exper.resources[label].pop(fname, None)
+            self._reply(200)
+            return
+        try:
+            contents = exper.resources[label][fname]
+        except KeyError:
+            self._reply(404)
+            return
+        self._reply(200, contents, content_type="application/octet-stream")
+
+    def _import(self, query, body, **kwargs):
+        try:
+            project = query["project"]
+            subject = query["subject"]
+            session = query["session"]
+        except KeyError:
+            self._reply(400, "Missing project, subject or session")
+            return
+        exper = self.mock.get_experiment(project, subject, session)
+        if exper is None:
+            exper = self.mock.add_experiment(project, subject, session)
+        try:
+            with zipfile.ZipFile(io.BytesIO(body)) as zf:
+                series = sorted({name.split("/")[-2] for name in zf.namelist()
+                                 if "/" in name})
+        except zipfile.BadZipFile:
+            self._reply(400, "Unparsable archive")
+            return
+        for descr in series:
+            exper.scans[str(len(exper.scans) + 1)] = {
+                "description": descr, "uid": None, "zip": None}
+        exper.uploaded += len(body)
+        self._reply(200, f"/data/prearchive/projects/{project}/{session}")
@@ -0,0 +1,121 @@
+"""Generators for synthetic scan data used by the tests and benchmarks.
+
+Nothing here needs real scan data or network access.
+"""
+import io
+import os
+import random
+import zipfile
+
+import pydicom
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+MR_IMAGE_STORAGE = "1.2.840.10008.5.1.4.1.1.4"
+
+
+# pylint: disable-next=too-many-arguments
+def make_dicom(study_uid, series_uid, series_num, description, instance=1,
+               pixel_bytes=0, preamble=True, seed=None):
+    """Make the bytes of a small, valid MR dicom file.
+
+    Args:
+        study_uid (str): The StudyInstanceUID to use.
+        series_uid (str): The SeriesInstanceUID to use.
+        series_num (int): The SeriesNumber to use.
+        description (str): The SeriesDescription to use.
+        instance (int, optional): The InstanceNumber. Defaults to 1.
+        pixel_bytes (int, optional): The number of (random, so mostly
+            incompressible) bytes of pixel data to add. Defaults to 0.
+        preamble (bool, optional): Whether to write the 128 byte preamble and
+            'DICM' prefix. Defaults to True.
+        seed (int, optional): A seed for the pixel data. Defaults to None.
+
+    Returns:
+        bytes: The contents of the dicom file.
+    """
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = MR_IMAGE_STORAGE
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = FileDataset(None, {}, file_meta=meta,
+                     preamble=b"\0" * 128 if preamble else None)
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.SOPClassUID = MR_IMAGE_STORAGE
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = "MR"
+    ds.StudyInstanceUID = study_uid
+    ds.StudyDate = "20200101"
+    ds.SeriesInstanceUID = series_uid
+    ds.SeriesNumber = series_num
+    ds.SeriesDescription = description
+    ds.InstanceNumber = instance
+    ds.ImageType = ["ORIGINAL", "PRIMARY", "M", "ND"]
+    ds.PatientName = "SYNTHETIC"
+    if pixel_bytes:
+        rng = random.Random(seed)
+        ds.add_new(0x7FE00010, "OB",
+                   rng.randbytes(pixel_bytes + pixel_bytes % 2))
+
+    output = io.BytesIO()
+    pydicom.dcmwrite(output, ds, write_like_original=not preamble)
+    return output.getvalue()
+
+
+def make_series(study_uid, series_num, description, num_files,
+                pixel_bytes=0, **kwargs):
+    """Make the contents of every dicom in a series.
+
+    Returns:
+        list[bytes]: The contents of each dicom file.
+    """
+    series_uid = generate_uid()
+    return [
+        make_dicom(study_uid, series_uid, series_num, description,
+                   instance=num + 1, pixel_bytes=pixel_bytes, seed=num,
+                   **kwargs)
+        for num in range(num_files)
+    ]
+
+
+# pylint: disable-next=too-many-arguments
+def make_session_zip(dest, session, series=None, files_per_series=2,
+                     pixel_bytes=0, resources=None, niftis=None,
+                     compression=zipfile.ZIP_DEFLATED, dcm_ext=".dcm"):
+    """Write a scan session zip in the layout datman receives from scanners.
+
+    Args:
+        dest (str or file-like): Where to write the zip.
+        session (str): The session name, used as the top level folder.
+        series (list, optional): A list of series descriptions. Defaults to
+            ['T1', 'DTI', 'RST'].
+        files_per_series (int, optional): Dicoms per series. Defaults to 2.
+        pixel_bytes (int, optional): Pixel data bytes per dicom.
+        resources (dict, optional): Archive paths (relative to the session
+            folder) mapped to their contents for non-dicom files.
+        niftis (list, optional): Archive paths (relative to the session
+            folder) of fake nifti files to add.
+        compression (int, optional): The zipfile compression to use.
+        dcm_ext (str, optional): The extension to give dicoms. Use '' to
+            make extensionless dicoms. Defaults to '.dcm'.
+
+    Returns:
+        str: The StudyInstanceUID of the session.
+    """
+    if series is None:
+        series = ["T1", "DTI", "RST"]
+    study_uid = generate_uid()
+    with zipfile.ZipFile(dest, "w", compression=compression) as zf:
+        for num, descr in enumerate(series, start=1):
+            files = make_series(study_uid, num, descr, files_per_series,
+                                pixel_bytes=pixel_bytes)
+            for idx, contents in enumerate(files):
+                zf.writestr(
+                    f"{session}/{num}-{descr}/{idx:04d}{dcm_ext}", contents)
+        for path, contents in (resources or {}).items():
+            zf.writestr(f"{session}/{path}", contents)
+        for path in niftis or []:
+            zf.writestr(f"{session}/{path}", os.urandom(64))
+    return study_uid
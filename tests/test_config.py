@@ -14,3 +14,44 @@ def test_initialise_from_environ():
     os.environ['DM_CONFIG'] = os.path.join(FIXTURE_DIR, 'site_config.yml')
     os.environ['DM_SYSTEM'] = 'test'
     config.config()
+
+
+TAGS = {
+    "T1": {"Pattern": {"SeriesDescription": ["T1", "MPRAGE"]}, "Count": 1},
+    "DTI": {"Pattern": {"SeriesDescription": "dti"}, "Count": 1},
+    "RST": {"Pattern": {"XnatType": "rest"}, "Count": 1},
+    "BAD": {"Pattern": {"SeriesDescription": "(unclosed"}, "Count": 1},
+    "FMAP": {"Pattern": {"SeriesDescription": "fmap", "XnatType": "rest",
+                         "ImageType": "(unclosed"}, "Count": 1},
+}
+
+
+def test_tag_matcher_finds_all_matching_tags():
+    matcher = config.TagInfo(TAGS).matcher
+
+    assert matcher.search("SeriesDescription", "Sag_MPRAGE_DTI") == \
+        ["T1", "DTI"]
+    assert matcher.search("XnatType", "REST_BOLD") == ["RST"]
+    assert matcher.search("SeriesDescription", "localizer") == []
+
+
+def test_tag_matcher_skips_tags_with_invalid_patterns():
+    matcher = config.TagInfo(TAGS).matcher
+
+    assert [tag for tag, _ in matcher.items()] == ["T1", "DTI", "RST", "FMAP"]
+
+
+def test_tag_matcher_prefers_series_description():
+    matcher = config.TagInfo(TAGS).matcher
+
+    assert matcher.field("FMAP") == "SeriesDescription"
+    assert matcher.field("RST") == "XnatType"
+    assert matcher.search("XnatType", "REST_BOLD") == ["RST"]
+
+
+def test_tag_matcher_built_once_per_tag_info():
+    tags = config.TagInfo(TAGS)
+
+    assert tags.matcher is tags.matcher
+    assert config.compile_pattern("T1|MPRAGE") is \
+        config.compile_pattern("T1|MPRAGE")
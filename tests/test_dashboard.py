@@ -0,0 +1,213 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from mock import patch
+
+import datman.dashboard
+import datman.scanid
+import mock_dashboard
+from mock_dashboard import Scan, queries as mock_queries
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stands in for the dashboard package. Connecting is slow, like a real
+# database on a busy cluster, and each connection is counted.
+FAKE_DASHBOARD = """
+import time
+
+queries = monitors = None
+connections = 0
+
+
+def connect_db():
+    global connections
+    time.sleep(2)
+    connections += 1
+"""
+
+SCRIPT = """
+import json
+import time
+
+start = time.perf_counter()
+import datman
+import datman.config
+import datman.dashboard
+import datman.scanid
+elapsed = time.perf_counter() - start
+
+import dashboard
+after_import = dashboard.connections
+datman.dashboard.get_default_user = datman.dashboard.dashboard_required(
+    lambda: None)
+datman.dashboard.get_default_user()
+datman.dashboard.get_default_user()
+print(json.dumps({"elapsed": elapsed, "after_import": after_import,
+                  "after_calls": dashboard.connections}))
+"""
+
+
+@pytest.fixture(scope="module")
+def import_results(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("fake_dashboard")
+    fake = tmp_path / "dashboard"
+    fake.mkdir()
+    (fake / "__init__.py").write_text(textwrap.dedent(FAKE_DASHBOARD))
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([str(tmp_path), REPO]))
+    output = subprocess.run([sys.executable, "-c", SCRIPT], env=env,
+                            check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def test_importing_datman_does_not_connect_to_dashboard(import_results):
+    assert import_results["after_import"] == 0
+    # Connecting takes 2s, so a slower import means it happened anyway
+    assert import_results["elapsed"] < 2
+
+
+def test_first_dashboard_call_connects_once(import_results):
+    assert import_results["after_calls"] == 1
+
+
+class TestLookupCache:
+
+    SESSION = "STUDY_CMH_0001_01_01"
+
+    def test_lookups_not_cached_by_default(self, dashboard):
+        datman.dashboard.get_session(self.SESSION)
+        dashboard.reset_counts()
+
+        datman.dashboard.get_session(self.SESSION)
+
+        assert dashboard.statements == 1
+
+    def test_repeated_lookups_served_from_cache(self, dashboard):
+        cache = datman.dashboard.enable_cache()
+        first = datman.dashboard.get_session(self.SESSION)
+        project = datman.dashboard.get_project(tag="STUDY", site="CMH")
+        dashboard.reset_counts()
+
+        again = datman.dashboard.get_session(datman.scanid.parse(self.SESSION))
+
+        assert again is first
+        assert datman.dashboard.get_project(tag="STUDY",
+                                            site="CMH") is project
+        assert dashboard.statements == 0
+        assert (cache.hits, cache.misses) == (2, 2)
+        assert cache.hit_rate == 0.5
+
+    def test_writes_invalidate_cache(self, dashboard):
+        datman.dashboard.enable_cache()
+        name = f"{self.SESSION}_T1_02_MPRAGE"
+        assert datman.dashboard.get_scan(name) is None
+
+        datman.dashboard.add_scan(name)
+
+        assert datman.dashboard.get_scan(name).tag == "T1"
+
+    def test_file_names_and_paths_share_entries(self, dashboard):
+        name = f"{self.SESSION}_T1_02_MPRAGE"
+        datman.dashboard.add_scan(name)
+        cache = datman.dashboard.enable_cache()
+        scan = datman.dashboard.get_scan(name)
+        dashboard.reset_counts()
+
+        again = datman.dashboard.get_scan(
+            f"/archive/STUDY/data/nii/{self.SESSION}/{name}.nii.gz")
+
+        assert again is scan
+        assert dashboard.statements == 0
+        assert cache.hits == 1
+
+    def test_missing_records_not_cached(self, dashboard):
+        cache = datman.dashboard.enable_cache()
+        name = f"{self.SESSION}_T1_02_MPRAGE"
+        assert datman.dashboard.get_scan(name) is None
+        dashboard.reset_counts()
+
+        assert datman.dashboard.get_scan(name) is None
+
+        assert dashboard.statements == 1
+        assert cache.hits == 0
+
+    def test_entries_expire_after_ttl(self, dashboard):
+        cache = datman.dashboard.enable_cache(ttl=60)
+        with patch("time.monotonic", return_value=1000):
+            datman.dashboard.get_session(self.SESSION)
+        with patch("time.monotonic", return_value=1061):
+            dashboard.reset_counts()
+            datman.dashboard.get_session(self.SESSION)
+
+        assert dashboard.statements == 1
+        assert cache.hits == 0
+
+
+class TestUpsertScans:
+
+    SESSION = "STUDY_CMH_0001_01_01"
+
+    @pytest.fixture
+    def records(self, tmp_path):
+        records = []
+        for series in range(1, 4):
+            name = f"{self.SESSION}_T1_{series:02d}_MPRAGE"
+            sidecar = tmp_path / f"{name}.json"
+            sidecar.write_text(json.dumps({"SeriesNumber": series}))
+            records.append({"name": name, "json_path": str(sidecar),
+                            "bids_name": f"sub-CMH0001_run-{series}_T1w"})
+        return records
+
+    def test_failed_sidecar_only_loses_its_own_json(self, dashboard, records):
+        add_json = Scan.add_json
+
+        def fail_second_json(scan, path):
+            if "_T1_02_" in path:
+                # Breaks the unique scan name constraint when flushed
+                mock_dashboard.db.session.add(
+                    Scan(name=f"{self.SESSION}_T1_01"))
+            add_json(scan, path)
+
+        with patch.object(Scan, "add_json", autospec=True,
+                          side_effect=fail_second_json):
+            results = datman.dashboard.upsert_scans(self.SESSION, records)
+
+        mock_dashboard.db.session.expire_all()
+        scans = datman.dashboard.get_session_scans(self.SESSION)
+        assert len(results) == len(scans) == 3
+        assert scans[f"{self.SESSION}_T1_02"].json_path is None
+        assert scans[f"{self.SESSION}_T1_02"].bids_name == (
+            "sub-CMH0001_run-2_T1w")
+        assert scans[f"{self.SESSION}_T1_03"].json_path == (
+            records[2]["json_path"])
+
+    def test_commit_restored_after_interrupt(self, dashboard):
+        with pytest.raises(KeyboardInterrupt):
+            with datman.dashboard._single_transaction() as db_session:
+                raise KeyboardInterrupt
+
+        assert "commit" not in vars(db_session)
+
+    def test_other_threads_commit_normally(self, dashboard):
+        with datman.dashboard._single_transaction() as db_session:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                other = executor.submit(mock_queries.db.session).result()
+
+            assert db_session.commit == db_session.flush
+            assert other is not db_session
+            assert other.commit != other.flush
+
+    def test_scans_found_by_file_name(self, dashboard, records):
+        datman.dashboard.upsert_scans(self.SESSION, records[:2])
+        names = [record["name"] for record in records] + ["not_datman"]
+
+        found = datman.dashboard.get_session_scans(self.SESSION,
+                                                   file_names=names)
+
+        assert sorted(found) == [records[0]["name"], records[1]["name"]]
+        assert found[records[1]["name"]].name == f"{self.SESSION}_T1_02"
@@ -1,9 +1,12 @@
+import json
 import os
 
 import pytest
 from mock import Mock, patch, mock_open
 
+import datman.dashboard
 import datman.exporters as exporters
+import datman.exporters.bids
 from datman.config import TagInfo
 from datman.scanid import parse
 
@@ -286,6 +289,283 @@ class TestNiiLinkExporter:
         return exp
 
 
+class TestSidecarIndex:
+
+    @pytest.fixture
+    def bids_dir(self, tmp_path):
+        bids = tmp_path / "bids" / "sub-CMH0000" / "ses-01"
+        (bids / "anat").mkdir(parents=True)
+        (bids / "dwi").mkdir()
+        (bids / "anat" / "sub-CMH0000_ses-01_T1w.json").write_text(
+            '{"SeriesNumber": 3, "SeriesDescription": "T1w"}')
+        (bids / "anat" / "sub-CMH0000_ses-01_T1w.nii.gz").write_text("")
+        (bids / "dwi" / "sub-CMH0000_ses-01_dwi.json").write_text(
+            '{"SeriesNumber": 5, "SeriesDescription": "DTI"}')
+        (bids / "dwi" / "broken.json").write_text('{"SeriesNumber":')
+        return bids
+
+    def test_unchanged_sidecars_parsed_once(self, bids_dir):
+        index = exporters.SidecarIndex(str(bids_dir))
+
+        first = index.read()
+        second = index.read()
+
+        assert index.parsed == 3
+        assert sorted(item["SeriesNumber"] for item in first) == [3, 5]
+        assert first == second
+
+    def test_changed_and_removed_sidecars_noticed(self, bids_dir):
+        index = exporters.SidecarIndex(str(bids_dir))
+        index.read()
+        (bids_dir / "anat" / "sub-CMH0000_ses-01_T1w.json").write_text(
+            '{"SeriesNumber": 30, "SeriesDescription": "T1w"}')
+        (bids_dir / "dwi" / "sub-CMH0000_ses-01_dwi.json").unlink()
+
+        found = index.read()
+
+        assert index.parsed == 4
+        assert [item["SeriesNumber"] for item in found] == [30]
+
+    def test_saved_index_reused_by_later_runs(self, bids_dir, tmp_path):
+        index_file = str(tmp_path / "index.json")
+        index = exporters.SidecarIndex(str(bids_dir), index_file)
+        expected = index.read()
+        index.save()
+
+        reloaded = exporters.SidecarIndex(str(bids_dir), index_file)
+
+        assert reloaded.read() == expected
+        assert reloaded.parsed == 0
+
+    def test_saved_index_ignored_if_fields_missing(self, bids_dir, tmp_path):
+        index_file = str(tmp_path / "index.json")
+        index = exporters.SidecarIndex(str(bids_dir), index_file,
+                                       fields={"SeriesNumber"})
+        index.read()
+        index.save()
+
+        reloaded = exporters.SidecarIndex(
+            str(bids_dir), index_file,
+            fields={"SeriesNumber", "SeriesDescription"})
+
+        assert {"SeriesNumber", "SeriesDescription", "Path"} == set(
+            reloaded.read()[0])
+        assert reloaded.parsed == 3
+
+    @pytest.mark.parametrize("saved", [
+        [],
+        {"version": 1, "fields": None},
+        {"version": 1, "fields": None, "sidecars": []},
+        {"version": 1, "fields": None, "sidecars": {"a.json": 3}},
+        {"version": 1, "fields": None, "sidecars": {"a.json": [[1, 2], 5]}},
+        {"version": 1, "fields": 3, "sidecars": {}},
+    ])
+    def test_malformed_saved_index_ignored(self, bids_dir, tmp_path, saved):
+        index_file = tmp_path / "index.json"
+        index_file.write_text(json.dumps(saved))
+
+        index = exporters.SidecarIndex(str(bids_dir), str(index_file),
+                                       fields={"SeriesNumber"})
+
+        assert sorted(item["SeriesNumber"] for item in index.read()) == [3, 5]
+        assert index.parsed == 3
+
+    def test_failed_save_not_retried(self, bids_dir, tmp_path):
+        # A folder can't be replaced by the index, even when run as root
+        index_file = tmp_path / "index.json"
+        index_file.mkdir()
+        index = exporters.SidecarIndex(str(bids_dir), str(index_file))
+        index.read()
+
+        with patch("time.sleep") as mock_sleep:
+            index.save()
+
+        assert not mock_sleep.called
+        assert index_file.is_dir()
+
+    def test_exporter_calls_share_index(self, bids_dir, tmp_path):
+        config = Mock()
+        config.get_tags.return_value = TagInfo({
+            "T1": {"Pattern": {"SeriesDescription": "T1"}, "Count": 1}})
+        config.get_key.return_value = True
+        session = Mock()
+        session._ident = parse("STUDY01_CMH_0000_01_01")
+        session.session = "01"
+        session.nii_path = str(tmp_path / "nii" / "STUDY01_CMH_0000_01")
+        session.bids_path = str(bids_dir)
+        exporter = exporters.NiiLinkExporter(config, session, Mock())
+
+        with patch("datman.exporters.nii_symlink.read_blacklist",
+                   return_value=None):
+            assert not exporter.outputs_exist()
+            exporter.export()
+            assert exporter.outputs_exist()
+
+        assert exporter.index.parsed == 3
+        assert os.path.islink(os.path.join(
+            session.nii_path, "STUDY01_CMH_0000_01_01_T1_03_T1w.json"))
+        assert os.path.exists(os.path.join(
+            session.nii_path, exporters.nii_symlink.INDEX_FILE))
+
+
+class TestBidsExporter:
+
+    def test_add_repeat_num_only_updates_sidecars_from_current_run(
+            self, exporter, bids_dir):
+        tagged = bids_dir / "anat" / "sub-CMH0000_ses-01_T1w.json"
+        untagged = bids_dir / "dwi" / "sub-CMH0000_ses-01_dwi.json"
+        new = bids_dir / "anat" / "sub-CMH0000_ses-01_run-02_T1w.json"
+        orig_mtimes = {
+            path: path.stat().st_mtime_ns for path in (tagged, untagged)}
+
+        def run_dcm2bids(*args, **kwargs):
+            new.write_text('{"SeriesNumber": 2}')
+
+        with patch.object(exporter, "run_dcm2bids",
+                          side_effect=run_dcm2bids) as mock_run:
+            exporter.export("/some/raw/dcms")
+
+        assert mock_run.call_count == 2
+        for path, mtime in orig_mtimes.items():
+            assert path.stat().st_mtime_ns == mtime
+        assert "Repeat" not in json.loads(untagged.read_text())
+        assert json.loads(new.read_text()) == {
+            "SeriesNumber": 2, "Repeat": "02"}
+
+    def test_add_repeat_num_without_existing_checks_all_sidecars(
+            self, exporter, bids_dir):
+        exporter.add_repeat_num()
+
+        untagged = bids_dir / "dwi" / "sub-CMH0000_ses-01_dwi.json"
+        assert json.loads(untagged.read_text())["Repeat"] == "02"
+
+    @pytest.fixture
+    def bids_dir(self, tmp_path):
+        bids = tmp_path / "bids" / "sub-CMH0000" / "ses-01"
+        (bids / "anat").mkdir(parents=True)
+        (bids / "dwi").mkdir()
+        (bids / "anat" / "sub-CMH0000_ses-01_T1w.json").write_text(
+            '{"SeriesNumber": 1, "Repeat": "01"}')
+        (bids / "dwi" / "sub-CMH0000_ses-01_dwi.json").write_text(
+            '{"SeriesNumber": 5}')
+        for sidecar in bids.rglob("*.json"):
+            os.utime(sidecar, (1000000000, 1000000000))
+        return bids
+
+    @pytest.fixture
+    def exporter(self, bids_dir):
+        session = Mock()
+        session._ident = parse("STUDY01_CMH_0000_01_02")
+        session._bids_inventory = {}
+        session.bids_root = str(bids_dir.parent.parent)
+        session.bids_path = str(bids_dir)
+        opts = Mock(refresh=False, clobber=False, force_dcm2niix=False)
+        return datman.exporters.bids.BidsExporter(
+            Mock(), session, Mock(), bids_opts=opts)
+
+
+class TestDBExporter:
+
+    SESSION = "STUDY_CMH_0001_01_01"
+
+    def test_export_adds_scans_in_one_transaction(
+            self, dashboard, config, tmp_path):
+        exporter = self.make_exporter(config, tmp_path, num_scans=30)
+
+        dashboard.reset_counts()
+        exporter.make_scans(exporter.names)
+
+        scans = datman.dashboard.get_session_scans(self.SESSION)
+        assert len(scans) == 30
+        assert dashboard.commits == 1
+        t1 = scans[f"{self.SESSION}_T1_01"]
+        assert t1.json_path.endswith("_T1_01_SERIES.json")
+        assert t1.conv_errors == "dcm2niix failed\n"
+
+    def test_export_updates_existing_scans(self, dashboard, config, tmp_path):
+        exporter = self.make_exporter(config, tmp_path, num_scans=4)
+        exporter.make_scans(exporter.names)
+        os.remove(tmp_path / f"{self.SESSION}_T1_01_SERIES.err")
+
+        exporter.export()
+
+        scans = datman.dashboard.get_session_scans(self.SESSION)
+        assert len(scans) == 4
+        assert scans[f"{self.SESSION}_T1_01"].conv_errors is None
+
+    def test_names_read_nifti_folder_once(self, config, tmp_path):
+        exporter = self.make_exporter(config, tmp_path, num_scans=3)
+        bids = tmp_path / "sub-CMH0001_ses-01_run-1_T1w.nii.gz"
+        bids.write_text("")
+        os.remove(tmp_path / f"{self.SESSION}_T1_03_SERIES.nii.gz")
+        os.symlink(bids, tmp_path / f"{self.SESSION}_T1_03_SERIES.nii.gz")
+        (tmp_path / f"{self.SESSION}_DTI_04_EXTRA.nii.gz").write_text("")
+
+        with patch("os.scandir", wraps=os.scandir) as mock_scandir, \
+                patch("glob.glob") as mock_glob:
+            exporter.refresh()
+            names = exporter.names
+            for name in names:
+                exporter._get_file(name, ".nii.gz")
+                exporter.errors_outdated(Mock(conv_errors=None), name)
+
+        assert mock_scandir.call_count == 2  # nii folder + blacklisted
+        assert not mock_glob.called
+        assert names[f"{self.SESSION}_T1_03_SERIES"] == (
+            "sub-CMH0001_ses-01_run-1_T1w")
+        assert names[f"{self.SESSION}_DTI_04_EXTRA"] == ""
+        assert len(names) == 4
+
+    def test_outputs_exist_query_count_does_not_grow_with_scans(
+            self, dashboard, config, tmp_path):
+        counts = []
+        for num_scans in (5, 40):
+            exporter = self.make_exporter(config, tmp_path, num_scans)
+            exporter.make_scans(exporter.names)
+
+            dashboard.reset_counts()
+            assert exporter.outputs_exist()
+            counts.append(dashboard.statements)
+
+        assert counts[0] == counts[1]
+
+    def test_outputs_exist_false_when_scan_missing(
+            self, dashboard, config, tmp_path):
+        exporter = self.make_exporter(config, tmp_path, num_scans=3)
+        exporter.make_scans(exporter.names)
+        exporter.experiment.scans.append(
+            Mock(names=[f"{self.SESSION}_T1_09_EXTRA"]))
+        exporter.refresh()
+
+        assert not exporter.outputs_exist()
+
+    def make_exporter(self, config, nii_path, num_scans):
+        session = Mock()
+        session._ident = parse(self.SESSION)
+        session.nii_path = str(nii_path)
+        session.niftis = []
+        session.find_files.return_value = []
+        names = []
+        for num in range(1, num_scans + 1):
+            tag = "T1" if num % 2 else "DTI"
+            stem = f"{self.SESSION}_{tag}_{num:02d}_SERIES"
+            names.append(stem)
+            for ext in (".nii.gz", ".json"):
+                (nii_path / (stem + ext)).write_text("{}")
+        (nii_path / f"{self.SESSION}_T1_01_SERIES.err").write_text(
+            "dcm2niix failed\n")
+
+        experiment = Mock(date="2020-01-01", scans=[Mock(names=names)])
+        experiment.is_shared.return_value = False
+        return exporters.DBExporter(config, session, experiment)
+
+    @pytest.fixture
+    def config(self):
+        config = Mock()
+        config.get_path.return_value = "/some/study/resources"
+        return config
+
+
 def replace_sidecars(contents_dict):
     """Used to provide JSON side car contents to open() calls.
     """
@@ -0,0 +1,87 @@
+import glob
+import importlib
+import logging
+import os
+from types import SimpleNamespace
+
+import pytest
+from mock import patch
+
+logging.disable(logging.CRITICAL)
+
+dm_blacklist_rm = importlib.import_module('bin.dm_blacklist_rm')
+
+SUBJECT = "STUDY_CMH_0001_01"
+FILES = [
+    f"{SUBJECT}_01_T1_02_MPRAGE.nii.gz",
+    f"{SUBJECT}_01_T1_02_MPRAGE.json",
+    f"{SUBJECT}_01_T1_02_MPRAGE_ND.nii.gz",
+    f"{SUBJECT}_01_DTI_03_DTI60.nii.gz",
+    f"{SUBJECT}_02_T1_02_MPRAGE.nii.gz",
+]
+
+
+@pytest.fixture
+def session(tmp_path):
+    nii = tmp_path / "nii" / SUBJECT
+    nii.mkdir(parents=True)
+    for name in FILES:
+        (nii / name).write_text("")
+    return SimpleNamespace(nii_path=str(nii), qc_path="",
+                           bids_path=str(tmp_path / "bids"),
+                           find_files=lambda scan, format: [])
+
+
+@pytest.mark.parametrize("stem", [
+    f"{SUBJECT}_01_T1_02_MPRAGE",
+    f"{SUBJECT}_01_DTI_03_DTI60",
+    f"{SUBJECT}_01_RST_04_REST",
+    f"{SUBJECT}_0",
+])
+def test_file_index_matches_glob(session, stem):
+    index = dm_blacklist_rm.FileIndex()
+
+    found = index.find(session.nii_path, stem)
+
+    assert sorted(found) == sorted(
+        glob.glob(os.path.join(session.nii_path, stem + "*")))
+
+
+def test_each_folder_listed_once(session):
+    index = dm_blacklist_rm.FileIndex()
+    bl_scans = [f"{SUBJECT}_01_T1_02_MPRAGE", f"{SUBJECT}_01_DTI_03_DTI60",
+                f"{SUBJECT}_02_T1_02_MPRAGE"]
+
+    with patch("os.listdir", wraps=os.listdir) as mock_listdir:
+        found = dm_blacklist_rm.find_blacklisted_files(
+            session, bl_scans, ["nii", "qc", "resources"], index)
+        dm_blacklist_rm.find_blacklisted_files(
+            session, bl_scans, ["nii"], index)
+
+    assert mock_listdir.call_count == 1
+    assert sorted(os.path.basename(item) for item in found) == sorted(FILES)
+    assert set(found.values()) == {session.nii_path}
+
+
+def test_blacklisted_files_moved(session):
+    found = dm_blacklist_rm.find_blacklisted_files(
+        session, [f"{SUBJECT}_01_T1_02_MPRAGE"], ["nii"],
+        dm_blacklist_rm.FileIndex())
+
+    dm_blacklist_rm.handle_blacklisted_files(found, keep=True, workers=2)
+
+    assert sorted(os.listdir(session.nii_path)) == sorted(
+        FILES[3:] + ["blacklisted"])
+    assert sorted(os.listdir(os.path.join(session.nii_path,
+                                          "blacklisted"))) == sorted(FILES[:3])
+
+
+def test_dry_run_leaves_files(session):
+    found = dm_blacklist_rm.find_blacklisted_files(
+        session, [f"{SUBJECT}_01_DTI_03_DTI60"], ["nii"],
+        dm_blacklist_rm.FileIndex())
+
+    with patch.object(dm_blacklist_rm, "DRYRUN", True):
+        dm_blacklist_rm.handle_blacklisted_files(found)
+
+    assert sorted(os.listdir(session.nii_path)) == sorted(FILES)
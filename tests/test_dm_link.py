@@ -0,0 +1,90 @@
+import importlib
+import logging
+import os
+import zipfile
+
+import pytest
+from mock import patch
+
+import datman.scanid
+from synthetic_data import make_dicom
+
+logging.disable(logging.CRITICAL)
+
+dm_link = importlib.import_module('bin.dm_link')
+
+SESSIONS = {
+    "2020_0101_A": "STUDY_CMH_0001_01_01",
+    "2020_0101_B": "STUDY_CMH_0002_01_01",
+    "2020_0102_C": "STUDY_CMH_0003_01_01",
+    "2020_0102_D": "STUDY_CMH_0001_01_01",
+}
+
+
+@pytest.fixture
+def study(tmp_path):
+    zips = tmp_path / "zips"
+    zips.mkdir()
+    (tmp_path / "dicom").mkdir()
+    for source, scanid in SESSIONS.items():
+        with zipfile.ZipFile(zips / f"{source}.zip", "w") as zf:
+            zf.writestr(f"{source}/1/0001.dcm",
+                        make_dicom("1.2.3", "1.2.3.1", 1, scanid))
+    with zipfile.ZipFile(zips / "2020_0103_E.zip", "w") as zf:
+        zf.writestr("2020_0103_E/notes.txt", "no dicoms here")
+    lookup = tmp_path / "scans.csv"
+    lookup.write_text("source_name target_name\n"
+                      "2020_0101_B STUDY_CMH_0009_01_01\n")
+
+    config = patch("datman.config.config").start()
+    config.return_value.get_path.side_effect = lambda key: str(
+        tmp_path / key)
+    patch.object(dm_link.datman.utils, "validate_subject_id",
+                 side_effect=lambda scanid, cfg: datman.scanid.parse(
+                     scanid)).start()
+    yield tmp_path
+    patch.stopall()
+    dm_link.header_cache.clear()
+
+
+def run(study, *options):
+    argv = ["dm_link.py", "--lookup", str(study / "scans.csv"),
+            "--scanid-field", "SeriesDescription", *options, "STUDY"]
+    with patch("sys.argv", argv):
+        dm_link.main()
+    dicom = study / "dicom"
+    return {name: os.readlink(dicom / name)
+            for name in sorted(os.listdir(dicom))}
+
+
+def test_links_from_lookup_table_and_headers(study):
+    links = run(study)
+
+    assert links["STUDY_CMH_0009_01_01.zip"].endswith("2020_0101_B.zip")
+    assert links["STUDY_CMH_0003_01_01.zip"].endswith("2020_0102_C.zip")
+    assert len(links) == 3
+
+
+def test_workers_give_same_links_as_serial_run(study):
+    serial = run(study)
+    for link in os.listdir(study / "dicom"):
+        os.remove(study / "dicom" / link)
+
+    parallel = run(study, "--workers", "2")
+
+    assert len(dm_link.header_cache) == 4
+    assert parallel == serial
+
+
+def test_read_headers_only_reads_archives_needing_them(study):
+    dm_link.lookup = dm_link.datman.scan_list.ScanLookup.from_file(
+        study / "scans.csv")
+    archives = [str(study / "zips" / f"{name}.zip")
+                for name in ["2020_0101_A", "2020_0101_B", "2020_0103_E"]]
+
+    needed = [item for item in archives if dm_link.needs_header(item)]
+    headers = dm_link.read_headers(needed, 2)
+
+    assert list(headers) == [archives[0], archives[2]]
+    assert headers[archives[0]].SeriesDescription == "STUDY_CMH_0001_01_01"
+    assert headers[archives[2]] is None
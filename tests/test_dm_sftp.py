@@ -0,0 +1,209 @@
+import importlib
+import logging
+import os
+import time
+import zipfile
+
+import pytest
+
+from mock_sftp import MockSFTPServer
+
+logging.disable(logging.CRITICAL)
+
+dm_sftp = importlib.import_module('bin.dm_sftp')
+
+OLD = time.time() - 3600
+
+
+@pytest.fixture
+def remote(tmp_path):
+    root = tmp_path / "remote"
+    scans = root / "scans"
+    for num in range(4):
+        series = scans / f"SESSION{num}" / "1-T1"
+        series.mkdir(parents=True)
+        for idx in range(3):
+            (series / f"{idx}.dcm").write_bytes(b"dicom" * (idx + 1))
+    (scans / "EXAM.zip").write_bytes(b"zipped")
+    (scans / "notes.txt").write_text("a file")
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            os.utime(os.path.join(dirpath, name), (OLD, OLD))
+    return root
+
+
+@pytest.fixture
+def zips(tmp_path):
+    path = tmp_path / "zips"
+    path.mkdir()
+    return path
+
+
+def fetch(remote, zips, connections=1, latency=0):
+    server = MockSFTPServer(str(remote), latency=latency)
+    with dm_sftp.ConnectionPool(server.connect, size=connections) as pool:
+        dm_sftp.process_dir(pool, "scans", str(zips))
+    return server
+
+
+def test_downloads_files_and_zips_folders(remote, zips):
+    fetch(remote, zips)
+
+    assert sorted(os.listdir(zips)) == [
+        "EXAM.zip", "SESSION0.zip", "SESSION1.zip", "SESSION2.zip",
+        "SESSION3.zip", "notes.txt"]
+    assert (zips / "EXAM.zip").read_bytes() == b"zipped"
+    assert os.path.getmtime(zips / "notes.txt") == pytest.approx(OLD)
+    with zipfile.ZipFile(zips / "SESSION1.zip") as zf:
+        assert sorted(zf.namelist()) == [
+            "1-T1/0.dcm", "1-T1/1.dcm", "1-T1/2.dcm"]
+        assert zf.read("1-T1/2.dcm") == b"dicom" * 3
+
+
+def test_remote_symlinks_are_followed(remote, zips):
+    scans = remote / "scans"
+    (scans / "notes_link.txt").symlink_to(scans / "notes.txt")
+    (scans / "SESSION_LINK").symlink_to(scans / "SESSION0")
+    (scans / "SESSION1" / "1-T1" / "extra.dcm").symlink_to(
+        scans / "SESSION0" / "1-T1" / "0.dcm")
+    (scans / "broken_link").symlink_to(scans / "missing")
+
+    fetch(remote, zips)
+
+    assert (zips / "notes_link.txt").read_text() == "a file"
+    assert not (zips / "broken_link").exists()
+    with zipfile.ZipFile(zips / "SESSION_LINK.zip") as zf:
+        assert sorted(zf.namelist()) == [
+            "1-T1/0.dcm", "1-T1/1.dcm", "1-T1/2.dcm"]
+    with zipfile.ZipFile(zips / "SESSION1.zip") as zf:
+        assert zf.read("1-T1/extra.dcm") == b"dicom"
+
+
+def test_up_to_date_copies_are_not_stat_or_downloaded(remote, zips):
+    fetch(remote, zips)
+
+    server = fetch(remote, zips)
+
+    assert server.calls["stat"] == 0
+    assert server.calls["open"] == 0
+    assert server.calls["listdir_attr"] == 1
+
+
+def test_newer_remote_files_are_downloaded_again(remote, zips):
+    fetch(remote, zips)
+    (remote / "scans" / "notes.txt").write_text("updated")
+
+    server = fetch(remote, zips)
+
+    assert (zips / "notes.txt").read_text() == "updated"
+    assert server.calls["open"] == 1
+
+
+def test_connections_download_concurrently(remote, zips, tmp_path):
+    serial = tmp_path / "serial"
+    serial.mkdir()
+    fetch(remote, serial)
+
+    server = fetch(remote, zips, connections=3, latency=0.01)
+
+    assert server.connections == 3
+    assert server.max_in_use > 1
+    assert sorted(os.listdir(zips)) == sorted(os.listdir(serial))
+    for name in os.listdir(serial):
+        if name.endswith(".zip") and name != "EXAM.zip":
+            with zipfile.ZipFile(zips / name) as new, \
+                    zipfile.ZipFile(serial / name) as old:
+                assert new.namelist() == old.namelist()
+
+
+def test_pool_reuses_idle_connections():
+    opened = []
+
+    def connect():
+        opened.append(object())
+        return opened[-1]
+
+    pool = dm_sftp.ConnectionPool(connect, size=4)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert len(opened) == 1
+
+
+def fetch_with_manifest(remote, zips, manifest_path, interrupt=None):
+    server = MockSFTPServer(str(remote))
+    if interrupt is not None:
+        server.interrupt_after(interrupt)
+    manifest = dm_sftp.TransferManifest(str(manifest_path))
+    with dm_sftp.ConnectionPool(server.connect) as pool:
+        dm_sftp.process_dir(pool, "scans", str(zips), manifest=manifest)
+    return server
+
+
+def test_manifest_records_completed_downloads(remote, zips, tmp_path):
+    manifest_path = tmp_path / "manifest.json"
+    fetch_with_manifest(remote, zips, manifest_path)
+
+    manifest = dm_sftp.TransferManifest(str(manifest_path))
+
+    assert sorted(manifest.entries) == [
+        "scans/EXAM.zip", "scans/SESSION0", "scans/SESSION1",
+        "scans/SESSION2", "scans/SESSION3", "scans/notes.txt"]
+    assert {item["status"] for item in manifest.entries.values()} == {
+        "complete"}
+
+
+def test_unchanged_folders_skipped_from_manifest(remote, zips, tmp_path):
+    manifest_path = tmp_path / "manifest.json"
+    fetch_with_manifest(remote, zips, manifest_path)
+    # The zips are newer than the remote folders, so only the manifest
+    # shows that this one changed
+    (remote / "scans" / "SESSION2" / "2-DTI").mkdir()
+    (remote / "scans" / "SESSION2" / "2-DTI" / "0.dcm").write_bytes(b"new")
+
+    server = fetch_with_manifest(remote, zips, manifest_path)
+
+    # scans, then SESSION2 and its two series. Nothing else is listed
+    assert server.calls["listdir_attr"] == 4
+    assert server.calls["open"] == 4
+    with zipfile.ZipFile(zips / "SESSION2.zip") as zf:
+        assert "2-DTI/0.dcm" in zf.namelist()
+
+
+def test_interrupted_file_download_is_resumed(remote, zips, tmp_path):
+    manifest_path = tmp_path / "manifest.json"
+    (remote / "scans" / "EXAM.zip").write_bytes(bytes(range(256)) * 100)
+    os.utime(remote / "scans" / "EXAM.zip", (OLD, OLD))
+    fetch_with_manifest(remote, zips, manifest_path)
+    (zips / "EXAM.zip").unlink()
+    manifest = dm_sftp.TransferManifest(str(manifest_path))
+    del manifest.entries["scans/EXAM.zip"]
+    manifest.save()
+    with pytest.raises(IOError):
+        fetch_with_manifest(remote, zips, manifest_path, interrupt=1000)
+    assert (zips / "EXAM.zip.part").stat().st_size == 1000
+
+    server = fetch_with_manifest(remote, zips, manifest_path)
+
+    assert server.bytes_sent == 25600 - 1000
+    assert (zips / "EXAM.zip").read_bytes() == bytes(range(256)) * 100
+    assert not (zips / "EXAM.zip.part").exists()
+
+
+def test_interrupted_folder_keeps_copied_files(remote, zips, tmp_path):
+    manifest_path = tmp_path / "manifest.json"
+    for name in ["EXAM.zip", "notes.txt"]:
+        (remote / "scans" / name).unlink()
+    # Each session has files of 5, 10 and 15 bytes, so this stops halfway
+    # through the second file of SESSION1
+    with pytest.raises(IOError):
+        fetch_with_manifest(remote, zips, manifest_path, interrupt=40)
+
+    server = fetch_with_manifest(remote, zips, manifest_path)
+
+    assert server.bytes_sent == 5 + 15
+    assert not (zips / ".sftp_partial").exists()
+    assert len(list(zips.glob("*.zip"))) == 4
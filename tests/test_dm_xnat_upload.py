@@ -1,12 +1,14 @@
 import unittest
 import importlib
 import logging
+import zipfile
 
 from mock import patch, MagicMock
 
 import datman
 import datman.xnat
 import datman.scanid
+from synthetic_data import make_session_zip
 
 # Disable all logging for the duration of testing
 logging.disable(logging.CRITICAL)
@@ -73,3 +75,33 @@ class CheckFilesExist(unittest.TestCase):
         with open(text_file, 'r') as session_data:
             xnat_session = eval(session_data.read())
         return datman.xnat.XNATSubject(xnat_session)
+
+
+class TestStripNiftis:
+
+    def test_copies_everything_but_niftis_and_their_sidecars(self, tmp_path):
+        archive = str(tmp_path / "STUDY_SITE_9999_01_01.zip")
+        make_session_zip(
+            archive, "STUDY_SITE_9999_01_01", series=["T1"],
+            resources={"DTI.bval": b"0 1000", "notes.txt": b"notes"},
+            niftis=["DTI.nii.gz"])
+        temp = tmp_path / "temp"
+        temp.mkdir()
+
+        result = upload.strip_niftis(archive, str(temp))
+
+        with zipfile.ZipFile(archive) as src, zipfile.ZipFile(result) as out:
+            assert sorted(out.namelist()) == [
+                "STUDY_SITE_9999_01_01/1-T1/0000.dcm",
+                "STUDY_SITE_9999_01_01/1-T1/0001.dcm",
+                "STUDY_SITE_9999_01_01/notes.txt"
+            ]
+            for info in out.infolist():
+                assert info.CRC == src.getinfo(info.filename).CRC
+
+    def test_returns_empty_list_when_only_niftis_exist(self, tmp_path):
+        archive = str(tmp_path / "STUDY_SITE_9999_01_01.zip")
+        make_session_zip(archive, "STUDY_SITE_9999_01_01", series=[],
+                         niftis=["T1.nii.gz"])
+
+        assert upload.strip_niftis(archive, str(tmp_path)) == []
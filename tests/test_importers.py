@@ -0,0 +1,160 @@
+import logging
+import os
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+from mock import patch
+
+import datman.config
+import datman.importers
+import datman.scanid
+from synthetic_data import make_session_zip
+
+logging.disable(logging.CRITICAL)
+
+SESSION = "STUDY_CMH_0001_01_01"
+
+
+@pytest.fixture
+def zip_path(tmp_path):
+    path = str(tmp_path / f"{SESSION}.zip")
+    make_session_zip(path, SESSION, series=["T1", "DTI", "RST"],
+                     files_per_series=3, pixel_bytes=1024,
+                     resources={"behav/log.txt": b"data"})
+    return path
+
+
+@pytest.fixture
+def importer(zip_path):
+    ident = datman.scanid.parse(SESSION)
+    zip_importer = datman.importers.ZipImporter(ident, zip_path)
+    yield zip_importer
+    zip_importer.close()
+
+
+class TestZipImporter:
+
+    def test_finds_scans_and_resources(self, importer):
+        assert sorted(scan.series for scan in importer.scans) == \
+            ["1", "2", "3"]
+        assert importer.resource_files == [f"{SESSION}/behav/log.txt"]
+        assert importer.date == "2020-01-01"
+        assert importer.dcm_subdir == SESSION
+
+    def test_headers_are_read_without_pixel_data(self, importer):
+        for scan in importer.scans:
+            assert "PixelData" not in scan.header
+
+    def test_series_share_the_session_index(self, importer):
+        assert all(scan.index is importer.index for scan in importer.scans)
+
+    def test_zip_is_only_reopened_once_for_extraction(self, importer,
+                                                      tmp_path):
+        with patch("datman.importers.ZipFile",
+                   wraps=datman.importers.ZipFile) as mock_zip:
+            for scan in importer.scans:
+                scan.get_files(str(tmp_path))
+            importer.get_resources(str(tmp_path))
+
+        assert mock_zip.call_count == 1
+
+    def test_get_files_extracts_everything(self, importer, tmp_path):
+        importer.get_files(str(tmp_path))
+
+        for scan in importer.scans:
+            assert len(os.listdir(scan.dcm_dir)) == 3
+        assert (tmp_path / SESSION / "behav" / "log.txt").read_bytes() == \
+            b"data"
+
+    def test_single_resource_can_be_extracted(self, importer, tmp_path):
+        importer.get_resources(str(tmp_path), f"{SESSION}/behav/log.txt")
+
+        assert (tmp_path / SESSION / "behav" / "log.txt").exists()
+
+    def test_scans_tagged_with_tag_matcher(self, importer):
+        tags = datman.config.TagInfo({
+            "T1": {"Pattern": {"SeriesDescription": "t1"}},
+            "DTI": {"Pattern": {"SeriesDescription": ["DTI", "DWI"]}},
+        })
+
+        names = [scan.set_datman_name(SESSION, tags)
+                 for scan in importer.scans if scan.description != "RST"]
+
+        assert names == [[f"{SESSION}_T1_01_T1"], [f"{SESSION}_DTI_02_DTI"]]
+
+
+class TestXNATScanTags:
+
+    TAGS = datman.config.TagInfo({
+        "T1": {"Pattern": {"SeriesDescription": "t1"}},
+        "RST": {"Pattern": {"XnatType": "rest"}},
+        "DTI": {"Pattern": {"SeriesDescription": "dti", "XnatType": "bold"}},
+    })
+
+    @pytest.mark.parametrize("description, xnat_type, expected", [
+        ("Sag_T1_MPRAGE", "OTHER", ["T1"]),
+        ("localizer", "REST_BOLD", ["RST"]),
+        ("DTI60", "OTHER", ["DTI"]),
+    ])
+    def test_tags_matched_on_preferred_field(self, description, xnat_type,
+                                             expected):
+        scan = SimpleNamespace(description=description, type=xnat_type,
+                               multiecho=False, tags=[])
+
+        datman.importers.XNATScan.set_tag(scan, self.TAGS.matcher)
+
+        assert scan.tags == expected
+
+    def test_tags_without_usable_pattern_raise(self):
+        scan = SimpleNamespace(description="T1", type="T1", tags=[])
+        tags = datman.config.TagInfo({
+            "T1": {"Pattern": {"SeriesDescription": "t1"}},
+            "ASL": {"Pattern": {"ImageType": "ORIGINAL"}},
+        })
+
+        with pytest.raises(KeyError):
+            datman.importers.XNATScan.set_tag(scan, tags.matcher)
+        with pytest.raises(KeyError):
+            datman.importers.ZipSeriesImporter.set_tag(scan, tags.matcher)
+
+
+class TestZipIndex:
+
+    def test_extract_matches_zip_contents(self, zip_path, tmp_path):
+        index = datman.importers.ZipIndex(zip_path, workers=4)
+        names = [item.filename for item in index.members]
+
+        index.extract(names, str(tmp_path))
+        index.close()
+
+        assert len(names) == 10
+        for name in names:
+            assert (tmp_path / name).is_file()
+
+    def test_extract_does_not_write_outside_dest_dir(self, tmp_path):
+        path = str(tmp_path / "bad.zip")
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr("../../escaped.txt", b"data")
+        dest = tmp_path / "dest"
+
+        index = datman.importers.ZipIndex(path)
+        index.extract(["../../escaped.txt"], str(dest))
+        index.close()
+
+        assert (dest / "escaped.txt").exists()
+
+    def test_unexpected_read_errors_are_raised(self, zip_path):
+        with patch("pydicom.dcmread", side_effect=OSError("disk error")):
+            with pytest.raises(OSError):
+                datman.importers.ZipIndex(zip_path)
+
+    def test_series_without_index_only_opens_zip(self, importer, tmp_path):
+        scan = importer.scans[0]
+        scan.index = None
+
+        with patch.object(datman.importers, "ZipIndex") as mock_index:
+            scan.get_files(str(tmp_path))
+
+        assert not mock_index.called
+        assert len(os.listdir(scan.dcm_dir)) == 3
@@ -0,0 +1,112 @@
+import io
+import logging
+import zipfile
+
+import pydicom
+import pytest
+
+import datman.scanid
+import datman.xnat
+from mock_xnat import MockXNAT
+from synthetic_data import make_dicom, make_session_zip
+
+logging.disable(logging.CRITICAL)
+
+PROJECT = "STUDY"
+SUBJECT = "STUDY_CMH_0001_01"
+EXPERIMENT = "STUDY_CMH_0001_01_SE01_MR"
+
+
+@pytest.fixture
+def server():
+    with MockXNAT() as mock:
+        yield mock
+
+
+@pytest.fixture
+def xnat(server):
+    return datman.xnat.XNAT(server.url, "user", "pass")
+
+
+def test_synthetic_dicom_is_readable():
+    contents = make_dicom("1.2.3", "1.2.3.4", 5, "T1", pixel_bytes=11)
+
+    dcm = pydicom.dcmread(io.BytesIO(contents))
+
+    assert dcm.SeriesDescription == "T1"
+    assert dcm.SeriesNumber == 5
+    assert len(dcm.PixelData) == 12
+
+
+def test_session_zip_contains_one_study(tmp_path):
+    archive = tmp_path / "session.zip"
+
+    study_uid = make_session_zip(str(archive), EXPERIMENT,
+                                 resources={"behav/log.txt": b"data"})
+
+    with zipfile.ZipFile(archive) as zf:
+        dicoms = [name for name in zf.namelist() if name.endswith(".dcm")]
+        uids = {pydicom.dcmread(io.BytesIO(zf.read(name))).StudyInstanceUID
+                for name in dicoms}
+        assert f"{EXPERIMENT}/behav/log.txt" in zf.namelist()
+    assert len(dicoms) == 6
+    assert uids == {study_uid}
+
+
+def test_experiment_scans_can_be_downloaded(server, xnat, tmp_path):
+    server.add_experiment(PROJECT, SUBJECT, EXPERIMENT, scans=["T1", "DTI"],
+                          files_per_scan=3)
+
+    experiment = xnat.get_experiment(PROJECT, SUBJECT, EXPERIMENT)
+    assert [scan.series for scan in experiment.scans] == ["1", "2"]
+
+    assert experiment.scans[0].get_files(str(tmp_path), xnat)
+    assert len(list(tmp_path.rglob("*.dcm"))) == 3
+
+
+def test_resources_can_be_listed_and_downloaded(server, xnat):
+    server.add_experiment(PROJECT, SUBJECT, EXPERIMENT,
+                          resources={"behav/log.txt": b"data"})
+    resource_id = xnat.get_resource_ids(PROJECT, SUBJECT, EXPERIMENT,
+                                        folder_name="MISC", create=False)
+
+    files = xnat.get_resource_list(PROJECT, SUBJECT, EXPERIMENT, resource_id)
+    downloaded = xnat.get_resource(PROJECT, SUBJECT, EXPERIMENT, resource_id,
+                                   "behav/log.txt", zipped=False)
+
+    assert [item["URI"] for item in files] == ["behav/log.txt"]
+    with open(downloaded, "rb") as fh:
+        assert fh.read() == b"data"
+
+
+def test_uploaded_dicoms_create_experiment(server, xnat, tmp_path):
+    server.add_project(PROJECT)
+    archive = str(tmp_path / f"{EXPERIMENT}.zip")
+    make_session_zip(archive, EXPERIMENT, series=["T1"])
+    ident = datman.scanid.parse("STUDY_CMH_0001_01_01")
+
+    xnat.put_dicoms(PROJECT, ident.get_xnat_subject_id(),
+                    ident.get_xnat_experiment_id(), archive)
+
+    experiment = xnat.get_experiment(PROJECT, ident.get_xnat_subject_id(),
+                                     ident.get_xnat_experiment_id())
+    assert len(experiment.scans) == 1
+    assert server.bytes_received > 0
+
+
+def test_injected_faults_return_fail_status(server, xnat):
+    server.add_project(PROJECT)
+    server.inject_faults(1)
+
+    with pytest.raises(datman.xnat.XnatException):
+        xnat.get_projects(PROJECT)
+    assert xnat.get_projects(PROJECT)
+
+
+def test_expired_sessions_require_new_login(server, xnat):
+    server.add_project(PROJECT)
+
+    server.expire_sessions()
+    xnat.get_projects(PROJECT)
+
+    assert server.logins == 2
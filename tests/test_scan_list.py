@@ -0,0 +1,55 @@
+import pandas as pd
+
+import datman.scan_list
+
+
+def make_lookup(tmp_path, rows):
+    lookup = tmp_path / "scans.csv"
+    lookup.write_text("source_name\ttarget_name\tdicom_StudyID\n" +
+                      "".join("\t".join(row) + "\n" for row in rows))
+    return datman.scan_list.ScanLookup.from_file(lookup)
+
+
+class TestScanLookup:
+
+    def test_finds_target_for_source_name(self, tmp_path):
+        lookup = make_lookup(tmp_path, [
+            ("2020_A", "STUDY_CMH_0001_01_01", "1"),
+            ("2020_B", "<ignore>", "2"),
+        ])
+
+        assert lookup.get_target("2020_A") == "STUDY_CMH_0001_01_01"
+        assert lookup.get_target("2020_B") == "<ignore>"
+        assert "2020_A" in lookup
+        assert len(lookup) == 2
+
+    def test_returns_none_for_missing_source_name(self, tmp_path):
+        lookup = make_lookup(tmp_path, [("2020_A", "STUDY_CMH_0001_01_01",
+                                         "1")])
+
+        assert lookup.get_target("2020_C") is None
+        assert lookup.get_rows("2020_C") is None
+        assert "2020_C" not in lookup
+
+    def test_duplicate_source_names_use_first_row(self, tmp_path):
+        lookup = make_lookup(tmp_path, [
+            ("2020_A", "STUDY_CMH_0001_01_01", "1"),
+            ("2020_B", "STUDY_CMH_0002_01_01", "2"),
+            ("2020_A", "STUDY_CMH_0003_01_01", "3"),
+        ])
+
+        rows = lookup.get_rows("2020_A")
+
+        assert lookup.get_target("2020_A") == "STUDY_CMH_0001_01_01"
+        assert rows["dicom_StudyID"].tolist() == ["1", "3"]
+
+    def test_matches_boolean_mask_results(self):
+        table = pd.DataFrame({
+            "source_name": ["A", "B", "A", "C"],
+            "target_name": ["T1", "T2", "T3", "T4"],
+        })
+        lookup = datman.scan_list.ScanLookup(table)
+
+        for name in ["A", "B", "C"]:
+            expected = table[table["source_name"] == name]
+            assert lookup.get_rows(name).equals(expected)
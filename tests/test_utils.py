@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 
+import io
 import os
 import unittest
 import logging
+import multiprocessing
+import tarfile
+import zipfile
 from random import randint
 
 import pytest
@@ -11,6 +15,9 @@ from mock import patch, MagicMock
 import datman.utils as utils
 import datman.config
 from datman.exceptions import ParseException
+import mock_dashboard
+from mock_dashboard import MockDashboard
+from synthetic_data import make_dicom, make_session_zip
 
 logging.disable(logging.CRITICAL)
 
@@ -230,12 +237,512 @@ class FindTechNotes(unittest.TestCase):
 @patch('datman.utils.dashboard')
 class TestUpdateChecklist:
     def test_entry_with_repeat_num_doesnt_crash_when_updating_file(
-            self, mock_dash, mock_locate, mock_read, mock_write
+            self, mock_dash, mock_locate, mock_read, mock_write, tmp_path
     ):
         mock_dash.dash_found = False
-        mock_locate.return_value = '/some/path/checklist.csv'
+        mock_locate.return_value = str(tmp_path / 'checklist.csv')
         mock_read.return_value = {}
 
         utils.update_checklist(
             {'STUDY_SITE_SUB001_01_01': 'comment'}, study='STUDY'
         )
+
+        assert (tmp_path / 'checklist.csv').read_text() == \
+            'qc_STUDY_SITE_SUB001_01.html comment\n'
+
+
+def _update_many(path, first, count, metadata, comment='ok'):
+    for num in range(first, first + count):
+        if metadata == 'checklist':
+            utils.update_checklist(
+                {f'STUDY_CMH_{num:04d}_01': comment}, path=path)
+        else:
+            utils.update_blacklist(
+                {f'STUDY_CMH_{num:04d}_01_01_T1_02_MPRAGE': comment},
+                path=path)
+
+
+class TestMetadataFileUpdates:
+
+    @pytest.fixture
+    def checklist(self, tmp_path):
+        path = tmp_path / 'checklist.csv'
+        path.write_text('qc_STUDY_CMH_0001_01.html\n'
+                        'qc_STUDY_CMH_0002_01.html someone\n')
+        return str(path)
+
+    def test_new_entries_are_appended(self, checklist):
+        with patch('datman.utils.write_metadata') as mock_write:
+            utils.update_checklist({'STUDY_CMH_0003_01': '',
+                                    'STUDY_CMH_0004_01_01': 'me'},
+                                   path=checklist)
+
+        assert not mock_write.called
+        with open(checklist) as fh:
+            assert fh.read().splitlines() == [
+                'qc_STUDY_CMH_0001_01.html',
+                'qc_STUDY_CMH_0002_01.html someone',
+                'qc_STUDY_CMH_0003_01.html ',
+                'qc_STUDY_CMH_0004_01.html me',
+            ]
+
+    def test_edits_rewrite_file_atomically(self, checklist):
+        os.chmod(checklist, 0o664)
+        inode = os.stat(checklist).st_ino
+
+        utils.update_checklist({'STUDY_CMH_0003_01': 'me',
+                                'STUDY_CMH_0001_01': 'me'}, path=checklist)
+
+        assert utils.read_checklist(path=checklist) == {
+            'STUDY_CMH_0001_01': 'me',
+            'STUDY_CMH_0002_01': 'someone',
+            'STUDY_CMH_0003_01': 'me',
+        }
+        assert os.stat(checklist).st_ino != inode
+        assert os.stat(checklist).st_mode & 0o777 == 0o664
+        assert sorted(os.listdir(os.path.dirname(checklist))) == [
+            'checklist.csv', 'checklist.csv.lock']
+
+    def test_unchanged_entries_dont_write(self, checklist):
+        before = os.stat(checklist)
+
+        utils.update_checklist({'STUDY_CMH_0002_01': 'someone'},
+                               path=checklist)
+
+        after = os.stat(checklist)
+        assert (after.st_ino, after.st_size) == (before.st_ino,
+                                                 before.st_size)
+
+    def test_blacklist_created_with_header(self, tmp_path):
+        path = str(tmp_path / 'blacklist.csv')
+
+        utils.update_blacklist(
+            {'STUDY_CMH_0001_01_01_T1_02_MPRAGE': 'motion'}, path=path)
+
+        with open(path) as fh:
+            assert fh.read() == ('series\treason\n'
+                                 'STUDY_CMH_0001_01_01_T1_02_MPRAGE motion\n')
+
+    @pytest.mark.parametrize('metadata', ['checklist', 'blacklist'])
+    def test_concurrent_updates_are_not_lost(self, tmp_path, metadata):
+        path = str(tmp_path / f'{metadata}.csv')
+        workers = 6
+        per_worker = 20
+        context = multiprocessing.get_context('fork')
+        procs = [
+            context.Process(target=_update_many,
+                            args=(path, num * per_worker, per_worker,
+                                  metadata))
+            for num in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+        # Edits force full rewrites while the other processes are appending
+        _update_many(path, 0, per_worker, metadata, comment='edited')
+        for proc in procs:
+            proc.join()
+
+        assert all(proc.exitcode == 0 for proc in procs)
+        if metadata == 'checklist':
+            entries = utils.read_checklist(path=path)
+        else:
+            entries = utils.read_blacklist(path=path)
+        assert len(entries) == workers * per_worker
+
+
+class TestIsDicom:
+
+    def test_file_with_preamble_is_dicom(self):
+        contents = make_dicom("1.2.3", "1.2.3.4", 1, "T1")
+        assert utils.is_dicom(io.BytesIO(contents))
+
+    def test_file_without_preamble_is_dicom(self):
+        contents = make_dicom("1.2.3", "1.2.3.4", 1, "T1", preamble=False)
+        assert utils.is_dicom(io.BytesIO(contents))
+
+    def test_only_reads_prefix_of_file_with_preamble(self):
+        contents = make_dicom("1.2.3", "1.2.3.4", 1, "T1",
+                              pixel_bytes=100000)
+        fh = io.BytesIO(contents)
+
+        utils.is_dicom(fh)
+
+        assert fh.tell() == utils.DICOM_PREFIX_SIZE
+
+    @pytest.mark.parametrize("contents", [
+        b"", b"Some notes about the scan\n" * 20, b"\x08\x00garbage" * 100,
+        b"\x02\x00" + bytes(300)
+    ])
+    def test_non_dicoms_are_rejected(self, contents):
+        assert not utils.is_dicom(io.BytesIO(contents))
+
+    def test_accepts_path(self, tmp_path):
+        path = tmp_path / "MR.1"
+        path.write_bytes(make_dicom("1.2.3", "1.2.3.4", 1, "T1"))
+
+        assert utils.is_dicom(str(path))
+
+    def test_missing_path_is_not_dicom(self, tmp_path):
+        assert not utils.is_dicom(str(tmp_path / "missing"))
+
+
+def test_get_resources_finds_only_non_dicom_files(tmp_path):
+    archive = tmp_path / "session.zip"
+    make_session_zip(str(archive), "SESSION", dcm_ext="",
+                     resources={"behav/log.txt": b"data",
+                                "physio/resp.1D": b"1\n2\n"})
+
+    with zipfile.ZipFile(archive) as zf:
+        found = utils.get_resources(zf)
+
+    assert sorted(found) == ["SESSION/behav/log.txt",
+                             "SESSION/physio/resp.1D"]
+
+
+class TestCopyZipMembers:
+
+    @pytest.fixture
+    def archive(self, tmp_path):
+        path = str(tmp_path / "source.zip")
+        make_session_zip(path, "SESSION", series=["T1"], pixel_bytes=2048,
+                         resources={"notes.txt": b"notes " * 100})
+        with zipfile.ZipFile(path, "a", compression=zipfile.ZIP_STORED) as zf:
+            zf.writestr("SESSION/stored.txt", b"uncompressed")
+            zf.writestr("SESSION/empty_dir/", b"")
+        return path
+
+    def test_copies_all_files_unchanged(self, archive, tmp_path):
+        dest = str(tmp_path / "dest.zip")
+
+        utils.copy_zip_members(archive, dest)
+
+        with zipfile.ZipFile(archive) as src, zipfile.ZipFile(dest) as out:
+            expected = [i for i in src.infolist() if not i.is_dir()]
+            assert out.testzip() is None
+            assert out.namelist() == [i.filename for i in expected]
+            for src_info, out_info in zip(expected, out.infolist()):
+                assert out_info.CRC == src_info.CRC
+                assert out_info.compress_type == src_info.compress_type
+                assert out_info.compress_size == src_info.compress_size
+                assert out.read(out_info) == src.read(src_info)
+
+    def test_copies_only_selected_members(self, archive, tmp_path):
+        dest = str(tmp_path / "dest.zip")
+
+        utils.copy_zip_members(archive, dest, ["SESSION/notes.txt"])
+
+        with zipfile.ZipFile(dest) as out:
+            assert out.namelist() == ["SESSION/notes.txt"]
+
+    def test_renames_members(self, archive, tmp_path):
+        dest = str(tmp_path / "dest.zip")
+
+        written = utils.copy_zip_members(
+            archive, dest, {"SESSION/notes.txt": "notes.txt",
+                            "SESSION/stored.txt": "a/b/stored.txt"})
+
+        assert written == ["notes.txt", "a/b/stored.txt"]
+        with zipfile.ZipFile(archive) as src, zipfile.ZipFile(dest) as out:
+            assert out.testzip() is None
+            assert out.getinfo("notes.txt").CRC == \
+                src.getinfo("SESSION/notes.txt").CRC
+            assert out.read("a/b/stored.txt") == b"uncompressed"
+
+    def test_missing_member_raises_key_error(self, archive, tmp_path):
+        with pytest.raises(KeyError):
+            utils.copy_zip_members(archive, str(tmp_path / "dest.zip"),
+                                   ["SESSION/missing.txt"])
+
+
+class TestMakeZip:
+
+    @pytest.fixture
+    def source(self, tmp_path):
+        source = tmp_path / "SESSION"
+        for num in range(10):
+            series = source / f"{num}-T1"
+            series.mkdir(parents=True)
+            (series / "0001.dcm").write_bytes(
+                make_dicom("1.2.3", f"1.2.3.{num}", num, "T1",
+                           pixel_bytes=4096, seed=num))
+        (source / "notes.txt").write_bytes(b"notes " * 1000)
+        (source / "empty.txt").write_bytes(b"")
+        return source
+
+    def _check_contents(self, source, dest):
+        with zipfile.ZipFile(dest) as zf:
+            assert zf.testzip() is None
+            names = zf.namelist()
+            assert len(names) == 12
+            for name in names:
+                assert zf.read(name) == (source / name).read_bytes()
+            return zf.infolist()
+
+    def test_deflates_by_default(self, source, tmp_path):
+        dest = str(tmp_path / "dest.zip")
+
+        utils.make_zip(str(source), dest)
+
+        infos = self._check_contents(source, dest)
+        assert {i.compress_type for i in infos} == {zipfile.ZIP_DEFLATED}
+
+    def test_stored_members_are_not_compressed(self, source, tmp_path):
+        dest = str(tmp_path / "dest.zip")
+
+        utils.make_zip(str(source), dest, compression="stored")
+
+        infos = self._check_contents(source, dest)
+        assert {i.compress_type for i in infos} == {zipfile.ZIP_STORED}
+
+    def test_parallel_compression_matches_sequential(self, source, tmp_path):
+        serial = str(tmp_path / "serial.zip")
+        parallel = str(tmp_path / "parallel.zip")
+
+        utils.make_zip(str(source), serial, level=1)
+        utils.make_zip(str(source), parallel, level=1, workers=4)
+
+        parallel_infos = self._check_contents(source, parallel)
+        with zipfile.ZipFile(serial) as zf:
+            serial_infos = zf.infolist()
+        assert [(i.filename, i.CRC, i.compress_size)
+                for i in parallel_infos] == \
+            [(i.filename, i.CRC, i.compress_size) for i in serial_infos]
+
+    def test_unknown_compression_raises_value_error(self, source, tmp_path):
+        with pytest.raises(ValueError):
+            utils.make_zip(str(source), str(tmp_path / "dest.zip"),
+                           compression="lzma")
+
+
+def test_get_zip_settings_omits_undefined_settings():
+    config = MagicMock()
+
+    def get_key(key, site=None):
+        if key == "ZipCompression":
+            return "stored"
+        raise datman.config.UndefinedSetting
+
+    config.get_key.side_effect = get_key
+
+    assert utils.get_zip_settings(config) == {"compression": "stored"}
+
+
+class TestGetTarfileHeaders:
+
+    @pytest.fixture
+    def tarball(self, tmp_path):
+        def _make(name, mode):
+            path = str(tmp_path / name)
+            with tarfile.open(path, mode) as tar:
+                for num, descr in enumerate(["T1", "DTI", "RST"], start=1):
+                    for idx in range(2):
+                        contents = make_dicom("1.2.3", f"1.2.3.{num}", num,
+                                              descr, instance=idx + 1)
+                        info = tarfile.TarInfo(
+                            f"SESSION/{num}-{descr}/{idx:04d}.dcm")
+                        info.size = len(contents)
+                        tar.addfile(info, io.BytesIO(contents))
+            return path
+        return _make
+
+    @pytest.mark.parametrize("name,mode", [("session.tar", "w"),
+                                           ("session.tar.gz", "w:gz")])
+    def test_finds_a_header_for_each_series(self, tarball, name, mode):
+        headers = utils.get_archive_headers(tarball(name, mode))
+
+        assert {k: str(v.SeriesDescription) for k, v in headers.items()} == {
+            "SESSION/1-T1": "T1", "SESSION/2-DTI": "DTI",
+            "SESSION/3-RST": "RST"
+        }
+
+    def test_stops_reading_members_after_first_header(self, tarball):
+        path = tarball("session.tar.gz", "w:gz")
+
+        with patch.object(tarfile.TarFile, "next",
+                          autospec=True, side_effect=tarfile.TarFile.next
+                          ) as mock_next:
+            headers = utils.get_tarfile_headers(path, stop_after_first=True)
+
+        assert len(headers) == 1
+        # Once when the tar is opened, and once to start iterating. Reading
+        # every member would need seven calls.
+        assert mock_next.call_count == 2
+
+    def test_index_is_used_for_repeated_scans(self, tarball, tmp_path):
+        path = tarball("session.tar", "w")
+        index = str(tmp_path / "session.index.json")
+
+        expected = utils.get_tarfile_headers(path, index_file=index)
+        with patch("datman.utils.tarfile.open") as mock_open:
+            result = utils.get_tarfile_headers(path, index_file=index)
+
+        mock_open.assert_not_called()
+        assert {k: v.SeriesInstanceUID for k, v in result.items()} == \
+            {k: v.SeriesInstanceUID for k, v in expected.items()}
+
+    def test_partial_index_not_used_for_full_scan(self, tarball, tmp_path):
+        path = tarball("session.tar", "w")
+        index = str(tmp_path / "session.index.json")
+
+        utils.get_tarfile_headers(path, stop_after_first=True,
+                                  index_file=index)
+        result = utils.get_tarfile_headers(path, index_file=index)
+
+        assert len(result) == 3
+
+    def test_stale_index_is_ignored(self, tarball, tmp_path):
+        path = tarball("session.tar", "w")
+        index = str(tmp_path / "session.index.json")
+        utils.get_tarfile_headers(path, index_file=index)
+        os.utime(path, (0, 0))
+
+        with patch("datman.utils.tarfile.open",
+                   wraps=tarfile.open) as mock_open:
+            result = utils.get_tarfile_headers(path, index_file=index)
+
+        mock_open.assert_called_once()
+        assert len(result) == 3
+
+    def test_index_not_written_for_compressed_tar(self, tarball, tmp_path):
+        path = tarball("session.tar.gz", "w:gz")
+        index = tmp_path / "session.index.json"
+
+        utils.get_tarfile_headers(path, index_file=str(index))
+
+        assert not index.exists()
+
+
+class TestFolderHeaders:
+
+    @pytest.fixture
+    def session(self, tmp_path):
+        session = tmp_path / "SESSION"
+        session.mkdir()
+        (session / "notes.txt").write_text("not a dicom")
+        for num, descr in enumerate(["T1", "DTI", "RST"], start=1):
+            series = session / f"{num}-{descr}"
+            series.mkdir()
+            (series / "README").write_text("not a dicom")
+            for idx in range(3):
+                (series / f"{idx:04d}.dcm").write_bytes(
+                    make_dicom("1.2.3", f"1.2.3.{num}", num, descr,
+                               instance=idx + 1))
+        return session
+
+    @pytest.mark.parametrize("workers", [None, 4])
+    def test_finds_a_header_for_each_series(self, session, workers):
+        headers = utils.get_folder_headers(str(session), workers=workers)
+
+        assert {os.path.basename(k): str(v.SeriesDescription)
+                for k, v in headers.items()} == {
+            "1-T1": "T1", "2-DTI": "DTI", "3-RST": "RST"}
+
+    def test_stop_after_first_searches_subfolders(self, session):
+        headers = utils.get_folder_headers(str(session),
+                                           stop_after_first=True)
+
+        assert len(headers) == 1
+
+    @pytest.mark.parametrize("workers", [None, 4])
+    def test_all_headers_only_includes_dicoms(self, session, workers):
+        headers = utils.get_all_headers_in_folder(
+            str(session / "2-DTI"), workers=workers)
+
+        assert sorted(os.path.basename(k) for k in headers) == [
+            "0000.dcm", "0001.dcm", "0002.dcm"]
+        assert all(h.SeriesDescription == "DTI" for h in headers.values())
+
+    def test_all_headers_recurses_when_requested(self, session):
+        headers = utils.get_all_headers_in_folder(str(session))
+        recursed = utils.get_all_headers_in_folder(str(session),
+                                                   recurse=True, workers=2)
+
+        assert headers == {}
+        assert len(recursed) == 9
+
+    def test_symlinks_that_loop_are_only_visited_once(self, session):
+        (session / "2-DTI" / "loop").symlink_to(session)
+
+        headers = utils.get_folder_headers(str(session))
+        recursed = utils.get_all_headers_in_folder(str(session), recurse=True)
+
+        assert len(headers) == 3
+        assert len(recursed) == 9
+
+    def test_symlinked_series_folders_read(self, session, tmp_path):
+        linked = tmp_path / "elsewhere" / "4-FMAP"
+        linked.mkdir(parents=True)
+        (linked / "0000.dcm").write_bytes(
+            make_dicom("1.2.3", "1.2.3.4", 4, "FMAP"))
+        (session / "4-FMAP").symlink_to(linked)
+
+        headers = utils.get_folder_headers(str(session), workers=2)
+        recursed = utils.get_all_headers_in_folder(str(session), recurse=True)
+
+        assert str(headers[str(session / "4-FMAP")].SeriesDescription) == \
+            "FMAP"
+        # Like os.walk, get_all_headers_in_folder doesn't follow links
+        assert len(recursed) == 9
+
+
+class TestStudyMetadataFromDashboard:
+
+    @pytest.fixture
+    def dashboard(self):
+        mock = MockDashboard()
+        reviewer = mock_dashboard.User(name="Jane Doe")
+        for num in range(1, 6):
+            session = mock.add_session(
+                "STUDY", "CMH", f"STUDY_CMH_{num:04d}_01", tags=["T1"])
+            session.timepoint.bids_name = f"sub-CMH{num:04d}"
+            if num % 2:
+                session.signed_off = True
+                session.reviewer = reviewer
+            scan = session.add_scan(
+                f"STUDY_CMH_{num:04d}_01_01_T1_02", 2, "T1", "MPRAGE")
+            if num < 3:
+                mock_dashboard.ScanChecklist(
+                    scan=scan, comment=f"bad {num}").save()
+        phantom = mock.add_session("STUDY", "CMH", "STUDY_CMH_PHA_FBN0001")
+        phantom.timepoint.is_phantom = True
+        phantom.save()
+
+        with patch.object(utils.dashboard, "queries", mock_dashboard.queries,
+                          create=True), \
+                patch.object(utils.dashboard, "dash_found", True), \
+                patch.object(utils.dashboard, "_connected", True):
+            mock.reset_counts()
+            yield mock
+        mock.close()
+
+    def test_read_checklist_for_study(self, dashboard):
+        entries = utils.read_checklist(study="STUDY")
+
+        assert entries == {
+            "STUDY_CMH_0001_01": "Jane Doe",
+            "STUDY_CMH_0002_01": "",
+            "STUDY_CMH_0003_01": "Jane Doe",
+            "STUDY_CMH_0004_01": "",
+            "STUDY_CMH_0005_01": "Jane Doe",
+        }
+        assert utils.read_checklist(study="STUDY", use_bids=True)[
+            "sub-CMH0002"] == ""
+
+    def test_read_checklist_queries_dont_grow_with_study(self, dashboard):
+        utils.read_checklist(study="STUDY")
+        queries_used = dashboard.statements
+        dashboard.add_session("STUDY", "CMH", "STUDY_CMH_0006_01")
+        dashboard.reset_counts()
+
+        utils.read_checklist(study="STUDY")
+
+        assert dashboard.statements == queries_used <= 4
+
+    def test_read_blacklist_for_study(self, dashboard):
+        entries = utils.read_blacklist(study="STUDY")
+
+        assert entries == {
+            "STUDY_CMH_0001_01_01_T1_02_MPRAGE": "bad 1",
+            "STUDY_CMH_0002_01_01_T1_02_MPRAGE": "bad 2",
+        }
+        assert dashboard.statements <= 3
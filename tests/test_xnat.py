@@ -1,4 +1,7 @@
 import os
+import json
+import threading
+import time
 import unittest
 import logging
 
@@ -6,6 +9,7 @@ from mock import Mock, patch
 import pytest
 
 import datman.xnat
+from mock_xnat import MockXNAT
 # Used only to act as a spec for Mock
 from datman.config import config as Config
 
@@ -221,3 +225,251 @@ class TestXnatScan(unittest.TestCase):
         tag_map = {'MOCK_TYPE': {'SeriesDescription': 'SERIES_DESCRIPTION'}}
         xnat_scan.set_tag(tag_map)
         assert set(xnat_scan.tags) == set(['MOCK_TYPE'])
+
+
+class TestSessionCache:
+
+    server = "https://xnat.ca"
+
+    def test_cache_file_is_only_readable_by_owner(self, tmp_path):
+        cache_file = tmp_path / "sessions"
+        cache = datman.xnat.SessionCache(str(cache_file))
+
+        cache.set(self.server, "someuser", "ABCD")
+
+        assert oct(cache_file.stat().st_mode & 0o777) == oct(0o600)
+
+    def test_sessions_are_stored_per_user_and_server(self, tmp_path):
+        cache = datman.xnat.SessionCache(str(tmp_path / "sessions"))
+
+        cache.set(self.server, "user1", "ABCD")
+        cache.set(self.server, "user2", "EFGH")
+        cache.set("https://otherxnat.ca", "user1", "IJKL")
+
+        assert cache.get(self.server, "user1") == "ABCD"
+        assert cache.get(self.server, "user2") == "EFGH"
+        assert cache.get("https://otherxnat.ca", "user1") == "IJKL"
+
+    def test_removed_session_is_not_returned(self, tmp_path):
+        cache = datman.xnat.SessionCache(str(tmp_path / "sessions"))
+        cache.set(self.server, "someuser", "ABCD")
+
+        cache.remove(self.server, "someuser")
+
+        assert cache.get(self.server, "someuser") is None
+
+    def test_malformed_cache_file_is_ignored(self, tmp_path):
+        cache_file = tmp_path / "sessions"
+        cache_file.write_text("{not json")
+        cache = datman.xnat.SessionCache(str(cache_file))
+
+        assert cache.get(self.server, "someuser") is None
+
+    @patch("datman.xnat.requests.Session")
+    def test_valid_cached_session_is_reused_without_login(
+            self, mock_session, tmp_path):
+        cache = datman.xnat.SessionCache(str(tmp_path / "sessions"))
+        cache.set(self.server, "someuser", "ABCD")
+        mock_session.return_value.request.return_value = Mock(
+            status_code=200, text="ABCD")
+
+        xnat = datman.xnat.XNAT(self.server, "someuser", "pass",
+                                session_cache=cache)
+
+        assert xnat.session == mock_session.return_value
+        methods = [c.args[0] for c in
+                   mock_session.return_value.request.call_args_list]
+        assert methods == ["GET"]
+
+    @patch("datman.xnat.requests.Session")
+    def test_expired_cached_session_is_replaced(self, mock_session, tmp_path):
+        cache = datman.xnat.SessionCache(str(tmp_path / "sessions"))
+        cache.set(self.server, "someuser", "ABCD")
+        session = mock_session.return_value
+        session.request.side_effect = lambda method, url, **kwargs: {
+            "GET": Mock(status_code=401, text=""),
+            "POST": Mock(status_code=200, text="EFGH")
+        }[method]
+        session.cookies.get.return_value = "EFGH"
+
+        datman.xnat.XNAT(self.server, "someuser", "pass", session_cache=cache)
+
+        methods = [c.args[0] for c in session.request.call_args_list]
+        assert "POST" in methods
+        assert cache.get(self.server, "someuser") == "EFGH"
+
+
+class TestRequestStats:
+
+    server = "https://xnat.ca/data/archive/projects/STUDY"
+
+    @pytest.mark.parametrize("url,expected", [
+        ("https://xnat.ca/data/JSESSION", "session"),
+        ("https://xnat.ca/data/services/import?project=A", "import"),
+        (server + "/subjects/SUB/experiments/EXP?format=json", "experiment"),
+        (server + "/subjects/SUB/experiments/?format=json", "experiment_list"),
+        (server + "/subjects/SUB/experiments/EXP/scans/1/resources/DICOM/"
+         "files?format=zip", "scan_zip"),
+        (server + "/subjects/SUB/experiments/EXP/resources/123/?format=xml",
+         "resource_catalog"),
+        (server + "/subjects/SUB/experiments/EXP/resources/123/files/a.txt",
+         "resource_file"),
+        ("https://xnat.ca/data/archive/projects/?format=json", "project"),
+        ("https://xnat.ca/some/other/page", "other"),
+    ])
+    def test_get_endpoint_identifies_logical_endpoints(self, url, expected):
+        assert datman.xnat.get_endpoint(url) == expected
+
+    def test_requests_are_grouped_by_method_and_endpoint(self):
+        stats = datman.xnat.RequestStats()
+        url = self.server + "/subjects/SUB/experiments/EXP?format=json"
+
+        stats.record("GET", url, 0.5, status=200, received=100)
+        stats.record("GET", url.replace("EXP", "EXP2"), 1.5, status=200,
+                     received=50)
+        stats.record("GET", url, 2.0)
+        stats.record_retry("GET", url)
+
+        entry = stats.endpoints[("GET", "experiment")]
+        assert entry["requests"] == 3
+        assert entry["errors"] == 1
+        assert entry["retries"] == 1
+        assert entry["bytes_received"] == 150
+        assert entry["max_seconds"] == 2.0
+
+    def test_write_uses_prometheus_format_for_prom_files(self, tmp_path):
+        stats = datman.xnat.RequestStats()
+        stats.record("POST", "https://xnat.ca/data/services/import", 3,
+                     status=200, sent=10)
+        output = tmp_path / "stats.prom"
+
+        stats.write(str(output))
+
+        contents = output.read_text()
+        assert ('datman_xnat_requests_total{method="POST",endpoint="import"} 1'
+                in contents)
+        assert ('datman_xnat_sent_bytes_total{method="POST",'
+                'endpoint="import"} 10' in contents)
+
+    def test_write_uses_json_for_other_files(self, tmp_path):
+        stats = datman.xnat.RequestStats()
+        stats.record("GET", "https://xnat.ca/data/JSESSION", 1, status=200)
+        output = tmp_path / "stats.json"
+
+        stats.write(str(output))
+
+        result = json.loads(output.read_text())
+        assert result["totals"]["requests"] == 1
+        assert result["endpoints"][0]["endpoint"] == "session"
+
+    @patch("datman.xnat.requests.Session")
+    def test_connection_records_requests_when_stats_given(self, mock_session):
+        mock_session.return_value.request.return_value = Mock(
+            status_code=200, text="ABCD", content=b"ABCD")
+        stats = datman.xnat.RequestStats()
+
+        datman.xnat.XNAT("https://xnat.ca", "user", "pass", stats=stats)
+
+        assert stats.endpoints[("POST", "session")]["requests"] == 1
+
+
+class TestConcurrencyLimiter:
+
+    def test_limit_grows_while_requests_are_healthy(self):
+        limiter = datman.xnat.ConcurrencyLimiter(initial=2, maximum=10)
+
+        for _ in range(20):
+            limiter.release(limiter.acquire())
+
+        assert limiter.limit > 2
+
+    def test_limit_never_exceeds_maximum(self):
+        limiter = datman.xnat.ConcurrencyLimiter(initial=2, maximum=3)
+
+        for _ in range(100):
+            limiter.release(limiter.acquire())
+
+        assert limiter.limit == 3
+
+    def test_limit_shrinks_on_overload(self):
+        limiter = datman.xnat.ConcurrencyLimiter(initial=8, backoff=0.5)
+
+        limiter.release(limiter.acquire(), overloaded=True)
+
+        assert limiter.limit == 4
+
+    def test_burst_of_overloads_only_shrinks_limit_once(self):
+        limiter = datman.xnat.ConcurrencyLimiter(initial=8, backoff=0.5)
+        started = [limiter.acquire() for _ in range(4)]
+
+        for start in started:
+            limiter.release(start, overloaded=True)
+
+        assert limiter.limit == 4
+
+    def test_limit_never_drops_below_minimum(self):
+        limiter = datman.xnat.ConcurrencyLimiter(initial=2, minimum=1)
+
+        for _ in range(10):
+            limiter.release(limiter.acquire(), overloaded=True)
+
+        assert limiter.limit == 1
+
+    def test_retry_delay_grows_with_consecutive_overloads(self):
+        limiter = datman.xnat.ConcurrencyLimiter(max_delay=5)
+        delays = []
+        for _ in range(5):
+            limiter.release(limiter.acquire(), overloaded=True)
+            delays.append(limiter.retry_delay())
+
+        assert delays == [1, 2, 4, 5, 5]
+
+        limiter.release(limiter.acquire())
+        assert limiter.retry_delay() == 1
+
+
+class TestLimiterWithOverloadedServer:
+
+    @pytest.fixture
+    def server(self):
+        with MockXNAT(latency=0.005) as mock:
+            mock.add_project("STUDY")
+            yield mock
+
+    def _run_phase(self, xnat, url, seconds, workers=8):
+        successes = []
+        stop = time.monotonic() + seconds
+
+        def work():
+            count = 0
+            while time.monotonic() < stop:
+                if xnat._request("GET", url).status_code == 200:
+                    count += 1
+            successes.append(count)
+
+        threads = [threading.Thread(target=work) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(successes) / seconds
+
+    def test_throughput_recovers_after_overload(self, server):
+        url = f"{server.url}/data/archive/projects/?format=json"
+        limiter = datman.xnat.ConcurrencyLimiter(initial=4, maximum=8)
+        xnat = datman.xnat.XNAT(server.url, "user", "pass", limiter=limiter)
+
+        healthy = self._run_phase(xnat, url, 0.5)
+        healthy_limit = limiter.limit
+
+        server.overloaded.set()
+        overloaded = self._run_phase(xnat, url, 0.5)
+        overloaded_limit = limiter.limit
+
+        server.overloaded.clear()
+        recovered = self._run_phase(xnat, url, 1.0)
+
+        assert overloaded == 0
+        assert overloaded_limit == limiter.minimum < healthy_limit
+        assert limiter.limit > overloaded_limit
+        assert recovered > 0.5 * healthy
@@ -0,0 +1,90 @@
+import logging
+
+import pytest
+
+import datman.xnat
+import datman.xnat_async
+from datman.importers import XNATExperiment
+from mock_xnat import MockXNAT
+
+pytest.importorskip("aiohttp")
+
+logging.disable(logging.CRITICAL)
+
+PROJECTS = {
+    "STUDY1": {"STUDY1_CMH_0001": ["STUDY1_CMH_0001_01_SE01_MR"]},
+    "STUDY2": {"STUDY2_CMH_0001": ["STUDY2_CMH_0001_01_SE01_MR",
+                                   "STUDY2_CMH_0001_02_SE01_MR"]},
+}
+
+
+@pytest.fixture
+def server():
+    with MockXNAT(latency=0.02) as mock:
+        for project, subjects in PROJECTS.items():
+            for subject, experiments in subjects.items():
+                for experiment in experiments:
+                    mock.add_experiment(project, subject, experiment)
+        yield mock
+
+
+@pytest.fixture
+def xnat(server):
+    return datman.xnat.XNAT(server.url, "user", "pass")
+
+
+def test_run_queries_returns_same_results_as_sync_client(xnat):
+    projects = ["STUDY1", "STUDY2", "STUDY2"]
+
+    result = datman.xnat_async.run_queries(
+        xnat, "get_experiment_ids", projects)
+
+    assert result == [xnat.get_experiment_ids(p) for p in projects]
+
+
+def test_run_queries_reuses_existing_session(server, xnat):
+    datman.xnat_async.run_queries(xnat, "get_experiment_ids", ["STUDY1"])
+
+    assert server.logins == 1
+
+
+def test_requests_in_flight_never_exceed_max_requests(server, xnat):
+    datman.xnat_async.run_queries(
+        xnat, "get_experiment_ids", ["STUDY1"] * 30, max_requests=3)
+
+    assert 1 < server.max_in_flight <= 3
+
+
+def test_get_experiment_returns_xnat_experiment(xnat):
+    args = [("STUDY1", "STUDY1_CMH_0001", "STUDY1_CMH_0001_01_SE01_MR")]
+
+    result = datman.xnat_async.run_queries(xnat, "get_experiment", args)
+
+    assert isinstance(result[0], XNATExperiment)
+    assert result[0].name == "STUDY1_CMH_0001_01_SE01_MR"
+
+
+def test_expired_session_is_only_renewed_once(server, xnat):
+    server.expire_sessions()
+
+    result = datman.xnat_async.run_queries(
+        xnat, "get_experiment_ids", ["STUDY1"] * 10)
+
+    assert server.logins == 2
+    assert len(result) == 10
+
+
+def test_return_exceptions_keeps_failed_queries_in_place(xnat):
+    args = [("STUDY1", "STUDY1_CMH_0001", "STUDY1_CMH_0001_01_SE01_MR"),
+            {"project": "STUDY1"}]
+
+    result = datman.xnat_async.run_queries(
+        xnat, "get_experiment", args, return_exceptions=True)
+
+    assert isinstance(result[0], XNATExperiment)
+    assert isinstance(result[1], datman.xnat.InputException)
+
+
+def test_unknown_query_method_raises_exception(xnat):
+    with pytest.raises(datman.xnat.InputException):
+        datman.xnat_async.run_queries(xnat, "_make_xnat_query", [])
@@ -0,0 +1,50 @@
+import importlib
+import logging
+import zipfile
+
+logging.disable(logging.CRITICAL)
+
+fetch = importlib.import_module('bin.xnat_fetch_sessions')
+
+
+def test_restructure_zip_moves_misc_resources_to_top_level(tmp_path):
+    temp_zip = str(tmp_path / "download.zip")
+    output_zip = str(tmp_path / "SESSION.zip")
+    with zipfile.ZipFile(temp_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("SESSION/scans/1-T1/0001.dcm", b"dicom" * 50)
+        zf.writestr("SESSION/scans/1-T1/SNAPSHOTS/1.gif", b"gif")
+        zf.writestr("resources/MISC/", b"")
+        zf.writestr("resources/MISC/behav/log.txt", b"log" * 50)
+        zf.writestr("resources/OTHER/file.txt", b"other")
+
+    fetch.restructure_zip(temp_zip, output_zip)
+
+    with zipfile.ZipFile(temp_zip) as src, zipfile.ZipFile(output_zip) as out:
+        assert sorted(out.namelist()) == ["SESSION/scans/1-T1/0001.dcm",
+                                          "behav/log.txt"]
+        assert out.getinfo("behav/log.txt").CRC == \
+            src.getinfo("resources/MISC/behav/log.txt").CRC
+        assert out.testzip() is None
+
+
+def test_restructure_zip_moves_zip_without_bad_folders(tmp_path):
+    temp_zip = str(tmp_path / "download.zip")
+    output_zip = str(tmp_path / "SESSION.zip")
+    with zipfile.ZipFile(temp_zip, "w") as zf:
+        zf.writestr("SESSION/scans/1-T1/0001.dcm", b"dicom")
+
+    fetch.restructure_zip(temp_zip, output_zip)
+
+    assert not (tmp_path / "download.zip").exists()
+    with zipfile.ZipFile(output_zip) as out:
+        assert out.namelist() == ["SESSION/scans/1-T1/0001.dcm"]
+
+
+def test_top_level_files_win_over_moved_resources():
+    archive = ["resources/MISC/notes.txt", "resources/MISC/behav/log.txt",
+               "notes.txt"]
+
+    members = fetch.get_restructured_paths(archive, "resources/MISC/")
+
+    assert members == {"notes.txt": "notes.txt",
+                       "resources/MISC/behav/log.txt": "behav/log.txt"}